@@ -0,0 +1,272 @@
+import asyncio
+import logging
+logger = logging.getLogger(__name__)
+
+from playwright.async_api import Browser, Locator, async_playwright
+from typing import Iterable
+
+from pillepas import tracing
+from pillepas.automation.async_form_gateway import AsyncFormGateway
+from pillepas.automation.fill_form import FillError, SessionBase
+from pillepas.automation.utils import add_wait_async, AsyncFormTransitionWatcher, AsyncWaitForMutation
+from pillepas.persistence.catalog import OptionCatalog
+
+
+class AsyncSession(SessionBase):
+    """Async counterpart of Session, built on the Playwright async API.
+    Can either launch its own browser, or use a provided one, in which case the session only creates (and closes)
+    its own browser context. The latter allows many sessions to run concurrently in one browser (see fill_concurrently).
+    Meant for unattended runs, so filling doesn't wait for the user to submit or confirm closing, and by default
+    fails rather than waiting for the user to take over (see fill)."""
+    
+    def __init__(
+            self,
+            fill_data: dict,
+            browser: Browser=None,
+            headless=True,
+            catalog: OptionCatalog=None,
+            url: str=None
+        ):
+        """fill_data (dict) - A dictionary containing form data
+        browser (Browser, optional) - A launched browser to use. If not provided, the session launches its own.
+        headless (bool, default True) - whether to run Playwright in headless mode, if launching a browser
+        catalog (OptionCatalog, optional) - catalog of autocomplete options. Uses the default location if not provided.
+        url (str, optional) - URL of the form. Defaults to the real form."""
+        
+        super().__init__(fill_data=fill_data, headless=headless, catalog=catalog, browser=browser, url=url)
+        self.proxies: AsyncFormGateway | None = None
+    
+    async def start(self):
+        with tracing.span("AsyncSession.start", category="phase", timed="start"):
+            await self._start()
+        #
+    
+    async def _start(self):
+        if self._owns_browser:
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(headless=self.headless)
+        
+        self.context = await self.browser.new_context(color_scheme="dark")
+        self.page = await self.context.new_page()
+        await self.page.goto(self.url)
+        
+        self.proxies = AsyncFormGateway(self.form, catalog=self.catalog)
+        self.transitions = AsyncFormTransitionWatcher(self.form)
+    
+    async def is_last_page(self):
+        return await self.next_button.count() == 0
+    
+    async def next_page(self):
+        """Navigate to the next form page"""
+        
+        with tracing.span("AsyncSession.next_page", category="phase", timed="navigate"):
+            async with AsyncWaitForMutation(self.form):
+                await self.next_button.click()
+            #
+        #
+    
+    async def fill_fields_on_current_page(self, presence: dict=None):
+        with tracing.span("AsyncSession.fill_fields_on_current_page", category="phase", timed="fill"):
+            await self._fill_fields_on_current_page(presence=presence)
+        #
+    
+    async def _fill_fields_on_current_page(self, presence: dict=None):
+        needs_write = self._needs_write(await self.proxies.present_fields(presence=presence))
+        
+        try:
+            filled = await self.proxies.fill_values({key: self.fill_data[key] for key in needs_write})
+        except Exception as e:
+            # E.g. the form was detached or the page navigated. Leave all fields to their proxies
+            logger.warning(f"{self} failed to fill elements in bulk - {e}. Falling back to proxies.")
+            filled = dict()
+        self._register_bulk_fill(filled)
+        
+        for key in needs_write:
+            if key not in self.saved_fields:
+                try:
+                    val = self.fill_data[key]
+                    logstring = self._log_str(key, val)
+                    await self.proxies[key].set_value(val)
+                    logger.info(f"Filled form element: {logstring}.")
+                except Exception as e:
+                    logger.error(f"{self} failed to fill element: {logstring} - {e}")
+                
+                self.saved_fields.add(key)
+            #
+        #
+    
+    async def read_fields_on_current_page(self, presence: dict=None):
+        logger.debug(f"Reading all present fields")
+        with tracing.span("AsyncSession.read_fields_on_current_page", category="phase", timed="read"):
+            values = await self.proxies.read_values(presence=presence)
+        self._register_read(values)
+    
+    async def _current_title(self):
+        headlines_form = await self.form.locator("h2").all_text_contents()
+        headlines_parent = await self.form.locator("..").locator("h2").all_text_contents()
+        diff = set(headlines_parent) - set(headlines_form)
+        if len(diff) == 1:
+            return list(diff)[0]
+    
+    async def wait_for_user_next(self):
+        await add_wait_async(
+            page=self.page,
+            button_text=self.next_button_text,
+            user_clicked_next_varname = self.user_clicked_next_var,
+            python_done_reading_varname = self.python_done_reading_var
+        )
+        
+        await self.page.evaluate(self.user_clicked_next_var)
+        await self.read_fields_on_current_page()
+        await self.page.evaluate(f"{self.python_done_reading_var}?.()")
+    
+    async def process_current_page(self, force_reprocess=False, let_user_click_next=False, interactive=False) -> bool:
+        """As Session.process_current_page. Returns whether the page was processed."""
+        
+        presence = await self.proxies.presence()
+        sig = await self.proxies.signature(presence=presence)
+        if sig in self.processed_pages_signatures and not force_reprocess:
+            return False
+        
+        self.processed_pages_signatures.add(sig)
+        
+        pageno = len(self.processed_pages_signatures)
+        title = await self._current_title()
+        title_str = f' "{title}"' if title else ""
+        logger.info(f"Processing form page {pageno}{title_str} (signature {sig})")
+        
+        await self.fill_fields_on_current_page(presence=presence)
+        
+        presence = await self.proxies.presence()
+        fields = await self.proxies.present_fields(presence=presence)
+        page_done = all(field in self.saved_fields for field in fields)
+        if page_done and not let_user_click_next:
+            await self.read_fields_on_current_page(presence=presence)
+            await self.next_page()
+        elif not interactive:
+            missing = [field for field in fields if field not in self.saved_fields]
+            raise FillError(f"Page {pageno} can't be completed without the user (unfilled fields: {missing}).")
+        else:
+            await self.wait_for_user_next()
+        
+        return True
+    
+    async def process_submit_page(self):
+        data_consent_box = self.form.get_by_role(
+            "checkbox",
+            name="Jeg giver samtykke til, at apoteket behandler mine oplysninger"
+        )
+        medicine_card_consent_box = self.form.get_by_role(
+            "checkbox",
+            name="Jeg giver samtykke til, at apoteket må slå op på mit medicinkort"
+        )
+        
+        await data_consent_box.click()
+        await medicine_card_consent_box.click()
+    
+    async def fill(
+            self,
+            auto_click_next: bool=True,
+            auto_submit: bool=False,
+            interactive: bool=False,
+            timeout: float=None
+        ) -> dict:
+        """Fills out the form, and returns the values read from it.
+        auto_click_next (bool, default True) - Whether to navigate automatically, rather than waiting for the user
+        auto_submit (bool, default False) - Whether to automatically submit the application after it's been filled
+        interactive, timeout - as for Session.fill, except that the session is non-interactive by default."""
+        
+        loop = asyncio.get_running_loop()
+        deadline = None
+        if timeout is not None:
+            deadline = loop.time() + timeout
+            self.page.set_default_timeout(timeout*1000)
+        
+        while not await self.is_last_page():
+            if deadline is not None and loop.time() > deadline:
+                raise FillError(f"Filling the form took more than {timeout} seconds.")
+            
+            await self.transitions.mark()
+            processed = await self.process_current_page(
+                let_user_click_next=not auto_click_next,
+                interactive=interactive
+            )
+            if not processed:
+                # Nothing to do until the form changes
+                changed = await self.transitions.wait(timeout=None if interactive else self.transition_timeout)
+                if not changed:
+                    raise FillError("The form didn't change after leaving the page, e.g. due to a validation error.")
+                #
+            #
+        
+        await self.process_submit_page()
+        
+        if auto_submit:
+            await self.submit_button.click()
+        
+        return self.read_fields
+    
+    async def stop(self):
+        if self.context is not None:
+            await self.context.close()
+        
+        if self._owns_browser:
+            await self.browser.close()
+            await self.playwright.stop()
+        #
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+    #
+
+
+async def fill_concurrently(
+        fill_data: Iterable[dict],
+        max_concurrency: int=4,
+        headless: bool=True,
+        auto_submit: bool=False,
+        catalog: OptionCatalog=None,
+        url: str=None,
+        timeout: float=None
+    ) -> list[dict|Exception]:
+    """Fills a form for each of the input data dicts concurrently, using an isolated browser context for each,
+    all in a single browser.
+    max_concurrency (int, default 4) - maximum number of forms being filled at once.
+    url (str, optional) - URL of the form. Defaults to the real form.
+    timeout (float, optional) - max number of seconds for filling each form.
+    Forms which can't be completed without the user fail rather than waiting.
+    Returns a list with the read values for each input, or the exception raised if filling failed."""
+    
+    catalog = OptionCatalog() if catalog is None else catalog
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=headless)
+        
+        async def run(data: dict) -> dict:
+            async with semaphore:
+                async with AsyncSession(data, browser=browser, catalog=catalog, url=url) as sess:
+                    res = await sess.fill(auto_submit=auto_submit, interactive=False, timeout=timeout)
+                #
+            return res
+        
+        try:
+            res = await asyncio.gather(*(run(data) for data in fill_data), return_exceptions=True)
+        finally:
+            await browser.close()
+        #
+    
+    return list(res)
+
+
+if __name__ == '__main__':
+    from pillepas.automation.utils import make_example_form_values
+    logging.basicConfig(level=logging.INFO)
+    
+    results = asyncio.run(fill_concurrently([make_example_form_values() for _ in range(4)]))
+    for result in results:
+        print(result)
@@ -0,0 +1,76 @@
+import hashlib
+import logging
+logger = logging.getLogger(__name__)
+from typing import Any, Dict
+
+from pillepas import tracing
+from pillepas.automation.async_proxy_classes import ASYNC_SUBSTITUTIONS, AsyncProxy
+from pillepas.automation.form_gateway import FormGatewayBase, _count_matches_js, _fill_js, _fingerprint_js
+
+
+class AsyncFormGateway(FormGatewayBase):
+    """Async counterpart of FormGateway. Holds async proxies, and the methods which probe the page are coroutines."""
+    
+    proxy_substitutions = ASYNC_SUBSTITUTIONS
+    
+    async def presence(self) -> Dict[str, bool]:
+        queries = self._presence_queries()
+        counts = await self.element.evaluate(_count_matches_js, queries) if queries else dict()
+        
+        res = self._presence_from_counts(counts)
+        for key, present in res.items():
+            if present is None:
+                res[key] = await self[key].is_present()
+            #
+        
+        return res
+    
+    async def fingerprint(self) -> str:
+        raw = await self.element.evaluate(_fingerprint_js)
+        res = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return res
+    
+    async def present_fields(self, presence: Dict[str, bool]=None) -> list[str]:
+        """Keys of the present fields, in the order they should be filled"""
+        
+        if presence is None:
+            presence = await self.presence()
+        
+        return self._ordered_present(presence)
+    
+    async def read_values(self, presence: Dict[str, bool]=None) -> Dict[str, Any]:
+        keys = await self.present_fields(presence=presence)
+        _, script = self._read_script(keys)
+        raw = dict() if script is None else await self.element.evaluate(script)
+        
+        res = dict()
+        for key in keys:
+            if key in raw:
+                res[key] = self[key].convert_read(raw[key])
+            else:
+                res[key] = await self[key].get_value()
+            #
+        
+        return res
+    
+    async def fill_values(self, values: Dict[str, Any]) -> Dict[str, bool]:
+        entries = self._fill_entries(values)
+        if not entries:
+            return dict()
+        
+        timed = f"{AsyncProxy.__name__} (bulk)"
+        with tracing.span("AsyncFormGateway.fill_values", category="proxy", timed=timed, n=len(entries)):
+            res = await self.element.evaluate(_fill_js, entries)
+        return res
+    
+    async def signature(self, presence: Dict[str, bool]=None) -> int:
+        if presence is None:
+            presence = await self.presence()
+        
+        res = self._signature_from_presence(presence)
+        return res
+    #
+
+
+if __name__ == '__main__':
+    pass
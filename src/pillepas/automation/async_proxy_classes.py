@@ -0,0 +1,257 @@
+"""Async counterparts of the proxies in proxy_classes, for use with the Playwright async API.
+The async classes share everything that doesn't involve talking to the browser (javascript snippets, selectors,
+parsing etc.) with the sync classes, via the base classes in proxy_classes (e.g. AutocompleteProxyBase), and
+implement the methods that do as coroutines. They don't derive from the sync classes, so they don't inherit
+any blocking methods."""
+
+from __future__ import annotations
+import datetime
+import logging
+logger = logging.getLogger(__name__)
+from playwright.async_api import Locator, TimeoutError
+from typing import Any, Dict, Iterable, Tuple
+
+from pillepas import tracing
+from pillepas.automation.proxy_classes import (
+    _jump_to_month_js,
+    ProxyBase,
+    Proxy,
+    AutocompleteProxyBase,
+    AutocompleteProxy,
+    DropDownProxyBase,
+    DropDownProxy,
+    RadioButtonProxyBase,
+    RadioButtonProxy,
+    DateSelectorProxyBase,
+    DateSelectorProxy,
+    MedicineProxyBase,
+    MedicineProxy
+)
+from pillepas.automation.utils import AsyncWaitForMutation
+
+
+class AsyncProxy(ProxyBase):
+    """Proxy for a plain text field, which interacts with the form using the async Playwright API"""
+    
+    async def type_(self, s: str):
+        """Enters text by simulating keyboard input"""
+        await self.e.page.keyboard.type(s, delay=50)
+    
+    async def _set(self, value: str):
+        await self.e.first.click(force=True)
+        await self.e.first.fill(value)
+    
+    async def _get(self):
+        res = await self.e.first.get_attribute("value")
+        return res
+    
+    async def set_value(self, value: Any):
+        logger.debug(f"{self} is setting value: {'*'*len(str(value)) if self.sensitive else value}")
+        name = self.__class__.__name__
+        with tracing.span(f"{name}._set", category="proxy", timed=name, key=self.key):
+            await self._set(value=value)
+            await self.e.dispatch_event('change')
+        #
+    
+    async def get_value(self) -> Any:
+        logger.debug(f"{self} is getting value.")
+        name = self.__class__.__name__
+        with tracing.span(f"{name}._get", category="proxy", timed=name, key=self.key):
+            res = await self._get()
+        return res
+    
+    async def is_present(self):
+        present = await self.e.count() > 0
+        return self._register_presence(present)
+    #
+
+
+class AsyncAutocompleteProxy(AutocompleteProxyBase, AsyncProxy):
+    async def _type_prefix(self, prefix: str, target: Locator) -> bool:
+        """Enters the prefix in one go, then waits for the target option to appear. Returns whether it did."""
+        
+        await self.e.fill(prefix)
+        try:
+            await target.wait_for(state="visible", timeout=3000)
+            return True
+        except TimeoutError:
+            logger.debug(f"{self} didn't find option after typing prefix '{prefix}'.")
+            await self.e.fill("")
+            return False
+        #
+    
+    async def _type_incrementally(self, value: str, target: Locator):
+        """Enters the next character and watch for changes in the suggestions, until the target appears."""
+        
+        top = self._top
+        for i, char in enumerate(value):
+            if i < self.min_chars:
+                await self.type_(char)
+                continue
+            
+            async with AsyncWaitForMutation(top.get_by_label("Suggestions")):
+                await self.type_(char)
+            await top.get_by_role("option").first.wait_for(state="visible", timeout=3000)
+            
+            if await target.count() > 0:
+                break
+            #
+        #
+    
+    async def _set(self, value: str):
+        await self.e.click()
+        top = self._top
+        target = top.get_by_role("option", name=value, exact=True)
+        
+        prefix = self._lookup_prefix(value)
+        found = prefix is not None and await self._type_prefix(prefix, target)
+        if not found:
+            await self._type_incrementally(value, target)
+        
+        if self._uses_catalog:
+            self.catalog.add(self.key, await top.get_by_role("option").all_inner_texts())
+        
+        if await target.count() == 1:
+            await target.click()
+        #
+    #
+
+
+class AsyncDropDownProxy(DropDownProxyBase, AsyncProxy):
+    async def _set(self, value: str):
+        select_elem = await self.e.locator("..").locator("select").element_handle()
+
+        await self.e.click(force=True)
+        await select_elem.select_option(label=value)
+        await select_elem.press("Escape")
+    
+    async def _get(self):
+        res = await self.e.first.inner_text()
+        return res
+    #
+
+
+class AsyncRadioButtonProxy(RadioButtonProxyBase, AsyncProxy):
+    async def _set(self, value):
+        target_button = self.e.locator(f'button[value={value}]')
+        await target_button.click()
+    
+    async def _get(self):
+        selected = self.e.locator('[role="radio"][aria-checked="true"]')
+        val = await selected.get_attribute('value')
+        return val
+    #
+
+
+class AsyncDateSelectorProxy(DateSelectorProxyBase, AsyncProxy):
+    async def _scroll_incrementally(self, pane: Locator):
+        dia = self.dialog
+        for _ in range(self.max_months_ahead):
+            if await pane.count() > 0:
+                break
+            await dia.get_by_role("button", name="Go to next month").click()
+        #
+    
+    async def scroll_to_date(self, date: datetime.date):
+        """Moves the dialog box forward to the specified month label (e.g. 'april 2025'),
+        then locates the input date, and clicks it."""
+        
+        dia = self.dialog
+        target = self._month_label_from_date(date)
+        pane = dia.get_by_label(target)
+        
+        n_clicks = await dia.evaluate(_jump_to_month_js, self._jump_args(date))
+        if n_clicks is None:
+            await self._scroll_incrementally(pane)
+        
+        date_cell = pane.get_by_role("gridcell", name=str(date.day), exact=True)
+        await date_cell.click()
+    
+    async def _set(self, value: Tuple[datetime.date]):
+        await self.e.click()
+        
+        for date in value:
+            await self.scroll_to_date(date)
+        
+        await self.dialog.get_by_role("button", name="Gem datoer").click()
+    
+    async def _get(self):
+        s = await self.e.inner_text()
+        res = self.convert_read(s)
+        return res
+    #
+
+
+class AsyncMedicineProxy(MedicineProxyBase, AsyncProxy):
+    async def is_present(self):
+        for proxies in self.sub_proxies:
+            for proxy in proxies.values():
+                if not await proxy.is_present():
+                    return False
+                #
+            #
+        return True
+    
+    async def get_value(self):
+        res = []
+        name = self.__class__.__name__
+        with tracing.span(f"{name}._get", category="proxy", timed=name, key=self.key):
+            for d in self.sub_proxies:
+                val = dict()
+                for k, p in d.items():
+                    val[k] = await p.get_value()
+                res.append(val)
+            #
+        
+        return res
+    
+    async def _reuse_doctor_info(self):
+        page = self.e.page
+        
+        heading = page.get_by_role("heading", name="Information om lægen").nth(-1)
+        info_section = heading.locator("..")
+        await info_section.get_by_role("button", name="Ja").click()
+        
+        dropdown = info_section.get_by_role("combobox").filter(has_text="Vælg en læge")
+        await dropdown.click()
+        await page.keyboard.press("Enter")
+    
+    async def set_value(self, value: Iterable[Dict[str, str]]):
+        name = self.__class__.__name__
+        with tracing.span(f"{name}._set", category="proxy", timed=name, key=self.key):
+            await self._set_medications(list(value))
+        #
+    
+    async def _set_medications(self, value: list[Dict[str, str]]):
+        for i, d in enumerate(value):
+            proxies = self.sub_proxies[i]
+            self._check_keys(d)
+            
+            for key, proxy in proxies.items():
+                await proxy.set_value(d[key])
+            #
+            
+            last = i == len(value) - 1
+            first = i == 0
+            if not first:
+                await self._reuse_doctor_info()
+            if not last:
+                await self.e.page.get_by_role("button", name="Tilføj mere medicin").click()
+                self._add_sub_proxies()
+        #
+    #
+
+
+# Maps each sync proxy class to its async counterpart. Used by proxy_factory.
+ASYNC_SUBSTITUTIONS = {
+    Proxy: AsyncProxy,
+    AutocompleteProxy: AsyncAutocompleteProxy,
+    DropDownProxy: AsyncDropDownProxy,
+    RadioButtonProxy: AsyncRadioButtonProxy,
+    DateSelectorProxy: AsyncDateSelectorProxy,
+    MedicineProxy: AsyncMedicineProxy,
+}
+
+
+if __name__ == '__main__':
+    pass
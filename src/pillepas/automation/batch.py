@@ -0,0 +1,210 @@
+"""Runs many form fills in parallel, across multiple processes.
+Each worker process keeps a single browser running across jobs, and creates a fresh browser context for each job.
+Jobs run unattended: a form which can't be completed without the user, or which takes longer than the job timeout,
+fails the job rather than blocking its worker.
+The workers share the option catalog and form map files. Both are saved atomically, and the catalog merges in
+options saved by other workers, so concurrent saves don't corrupt them."""
+
+import argparse
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import csv
+import datetime
+import json
+import logging
+logger = logging.getLogger(__name__)
+import multiprocessing
+from multiprocessing.util import Finalize
+from pathlib import Path
+import time
+import yaml
+
+from playwright.sync_api import Browser, Playwright, sync_playwright
+
+from pillepas.automation.fill_form import Session
+
+
+# Default max number of seconds for a single job
+DEFAULT_JOB_TIMEOUT = 300.0
+
+# State for worker processes. Set by _init_worker, so each worker keeps its browser warm between jobs
+_playwright: Playwright | None = None
+_browser: Browser | None = None
+
+
+def _parse_date(x) -> datetime.date:
+    if isinstance(x, datetime.date):
+        return x
+    return datetime.date.fromisoformat(x.strip())
+
+
+def _normalize_profile(d: dict) -> dict:
+    """Converts a profile read from a file into the shape produced by make_example_form_values.
+    Dates may be given as a list of dates, or as a string with two ISO dates separated by '/', e.g.
+    '2025-05-01/2025-05-08'. Medicine may be given as a list of dicts, or as a JSON string of one."""
+    
+    res = {k: v for k, v in d.items() if v not in (None, "")}
+    
+    dates = res.get("dates")
+    if isinstance(dates, str):
+        dates = dates.split("/")
+    if dates is not None:
+        res["dates"] = tuple(_parse_date(x) for x in dates)
+    
+    if isinstance(res.get("medicine"), str):
+        res["medicine"] = json.loads(res["medicine"])
+    
+    return res
+
+
+def load_profiles(path: Path) -> list[dict]:
+    """Reads form data for a number of jobs from a YAML file (a list of dicts) or a CSV file (a row per job)."""
+    
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            raw = list(csv.DictReader(f))
+        #
+    else:
+        raw = yaml.safe_load(path.read_text(encoding="utf-8"))
+    
+    if not isinstance(raw, list):
+        raise ValueError(f"Expected a list of profiles in {path}. Got {type(raw)}.")
+    
+    res = [_normalize_profile(d) for d in raw]
+    return res
+
+
+def _close_browser():
+    if _browser is not None:
+        _browser.close()
+    if _playwright is not None:
+        _playwright.stop()
+    #
+
+
+def _init_worker(headless: bool):
+    """Launches a browser in the worker process, which is kept alive until the worker exits"""
+    
+    global _playwright, _browser
+    _playwright = sync_playwright().start()
+    _browser = _playwright.chromium.launch(headless=headless)
+    # Worker processes skip atexit handlers, so use multiprocessing's finalizer to shut down the browser
+    Finalize(None, _close_browser, exitpriority=10)
+
+
+def _run_job(index: int, fill_data: dict, auto_submit: bool, url: str=None, timeout: float=DEFAULT_JOB_TIMEOUT) -> dict:
+    """Fills a single form in a fresh context of the worker's browser. Returns a summary of the result."""
+    
+    now = time.time()
+    res = dict(index=index)
+    try:
+        sess = Session(fill_data, browser=_browser, url=url)
+        try:
+            sess.start()
+            sess.fill(
+                auto_click_next=True,
+                auto_submit=auto_submit,
+                wait_for_user=False,
+                interactive=False,
+                timeout=timeout
+            )
+        finally:
+            sess.stop()
+        
+        res["ok"] = True
+        # The results file isn't encrypted, so only record which fields were read - never their values
+        res["fields_read"] = sorted(sess.read_fields)
+    except Exception as e:
+        res["ok"] = False
+        res["error"] = f"{e.__class__.__name__}: {e}"
+    
+    res["seconds"] = time.time() - now
+    return res
+
+
+def run_batch(
+        profiles: list[dict],
+        results_path: Path,
+        n_workers: int=None,
+        headless: bool=True,
+        auto_submit: bool=False,
+        url: str=None,
+        job_timeout: float=DEFAULT_JOB_TIMEOUT
+    ) -> dict:
+    """Fills a form for each profile, sharding the jobs across a pool of worker processes.
+    Results are appended to results_path (one JSON object per line) as jobs complete. The file isn't encrypted,
+    so results contain the keys of the fields read from each form, but not the values. If a worker process dies,
+    the pool breaks, and its remaining jobs are recorded as failed.
+    n_workers (int, optional) - number of worker processes. Defaults to the number of CPUs.
+    url (str, optional) - URL of the form. Defaults to the real form.
+    job_timeout (float, default DEFAULT_JOB_TIMEOUT) - max number of seconds for each job. Jobs exceeding it fail.
+    Returns a summary with counts and the throughput in jobs per second."""
+    
+    now = time.time()
+    n_ok = 0
+    n_failed = 0
+    
+    executor = ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(headless,)
+    )
+    
+    with executor, open(results_path, "a", encoding="utf-8") as f:
+        futures = {
+            executor.submit(_run_job, i, profile, auto_submit, url, job_timeout): i
+            for i, profile in enumerate(profiles)
+        }
+        for future in as_completed(futures):
+            try:
+                res = future.result()
+            except BrokenProcessPool as e:
+                res = dict(index=futures[future], ok=False, error=f"{e.__class__.__name__}: {e}")
+            
+            f.write(json.dumps(res, default=str) + "\n")
+            f.flush()
+            
+            if res["ok"]:
+                n_ok += 1
+            else:
+                n_failed += 1
+                logger.error(f"Job {res['index']} failed: {res['error']}")
+            
+            n_done = n_ok + n_failed
+            logger.info(f"Completed {n_done}/{len(profiles)} jobs ({n_done/(time.time() - now):.2f} jobs/s).")
+        #
+    
+    elapsed = time.time() - now
+    res = dict(
+        n_jobs=len(profiles),
+        n_ok=n_ok,
+        n_failed=n_failed,
+        seconds=elapsed,
+        jobs_per_second=len(profiles)/elapsed if elapsed else 0.0
+    )
+    
+    return res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fill pillepas forms for all profiles in a YAML or CSV file.")
+    parser.add_argument("profiles", type=Path)
+    parser.add_argument("results", type=Path)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--headed", action="store_true")
+    parser.add_argument("--submit", action="store_true")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_JOB_TIMEOUT, help="Max seconds per job")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    
+    summary = run_batch(
+        profiles=load_profiles(args.profiles),
+        results_path=args.results,
+        n_workers=args.workers,
+        headless=not args.headed,
+        auto_submit=args.submit,
+        job_timeout=args.timeout
+    )
+    print(json.dumps(summary, indent=2))
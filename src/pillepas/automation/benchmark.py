@@ -0,0 +1,165 @@
+"""End-to-end benchmark of the form automation.
+Runs a headless Session against the local stand-in form a number of times, and reports the wall time spent on
+each page, in each proxy class, and in each phase (signature, fill, read, navigate, ...).
+Results can be written to a JSON file and compared against a previous run to flag regressions.
+
+Example:
+
+python -m pillepas.automation.benchmark --runs 5 --output current.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import logging
+logger = logging.getLogger(__name__)
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import time
+
+from pillepas.automation import timing
+from pillepas.automation.fill_form import Session
+from pillepas.automation.standin import StandinServer
+from pillepas.automation.utils import make_example_form_values
+from pillepas.persistence.catalog import OptionCatalog
+from pillepas.persistence.form_map import FormMap
+
+
+def _summarize(values: list[float]) -> dict[str, float]:
+    res = dict(
+        mean=statistics.mean(values),
+        median=statistics.median(values),
+        min=min(values),
+        max=max(values),
+    )
+    return res
+
+
+def aggregate(runs: list[dict[str, dict[str, float]]]) -> dict[str, dict[str, dict[str, float]]]:
+    """Combines the per-run totals (as produced by Timings.totals) into summary statistics for each
+    category and name. Names missing from a run are not counted for that run."""
+    
+    collected: dict[str, dict[str, list[float]]] = dict()
+    for totals in runs:
+        for cat, d in totals.items():
+            for name, seconds in d.items():
+                collected.setdefault(cat, dict()).setdefault(name, []).append(seconds)
+            #
+        #
+    
+    res = {cat: {name: _summarize(vals) for name, vals in d.items()} for cat, d in collected.items()}
+    return res
+
+
+def run_benchmark(
+        n_runs: int=5,
+        fill_data: dict=None,
+        suggest_delay: float=0.1,
+        navigation_delay: float=0.05,
+        headless: bool=True
+    ) -> dict:
+    """Fills the stand-in form n_runs times and returns the timing breakdown.
+    fill_data (dict, optional) - data to fill in. Defaults to make_example_form_values().
+    suggest_delay, navigation_delay (float) - server-side delays (seconds) of the stand-in form.
+    Each run uses a fresh, empty option catalog and form map, so results don't depend on earlier runs."""
+    
+    if fill_data is None:
+        fill_data = make_example_form_values()
+    
+    runs = []
+    with StandinServer(suggest_delay=suggest_delay, navigation_delay=navigation_delay) as server:
+        for i in range(n_runs):
+            timings = timing.Timings()
+            with tempfile.TemporaryDirectory() as tmpdir, timing.recording(timings):
+                catalog = OptionCatalog(path=Path(tmpdir) / "catalog.json")
+                form_map = FormMap(path=Path(tmpdir) / "form_map.json")
+                now = time.perf_counter()
+                with Session(fill_data, headless=headless, catalog=catalog, url=server.url, form_map=form_map) as sess:
+                    sess.fill(auto_click_next=True, auto_submit=True, wait_for_user=False, interactive=False)
+                timings.add("total", "run", time.perf_counter() - now)
+            #
+            
+            logger.info(f"Completed run {i+1}/{n_runs} in {timings.totals()['total']['run']:.2f}s.")
+            runs.append(timings.totals())
+        #
+    
+    res = dict(
+        n_runs=n_runs,
+        suggest_delay=suggest_delay,
+        navigation_delay=navigation_delay,
+        timings=aggregate(runs),
+    )
+    
+    return res
+
+
+def compare(current: dict, baseline: dict, threshold: float=0.1, stat: str="median", min_seconds: float=0.01) -> list[dict]:
+    """Compares two benchmark results, and returns a list of regressions.
+    A regression is a category/name in both results, where the statistic has increased by more than the
+    threshold (relative), and by more than min_seconds (to ignore noise on very fast operations).
+    The relative change is infinite if the baseline is 0."""
+    
+    res = []
+    for cat, d in current["timings"].items():
+        for name, stats in d.items():
+            try:
+                before = baseline["timings"][cat][name][stat]
+            except KeyError:
+                continue
+            
+            after = stats[stat]
+            if after - before > max(threshold*before, min_seconds):
+                change = (after - before)/before if before else float("inf")
+                res.append(dict(category=cat, name=name, baseline=before, current=after, change=change))
+            #
+        #
+    
+    return res
+
+
+def format_report(result: dict, stat: str="median") -> str:
+    lines = [f"Benchmark over {result['n_runs']} runs ({stat} seconds per run):"]
+    for cat, d in result["timings"].items():
+        lines.append(f"  {cat}:")
+        for name, stats in sorted(d.items(), key=lambda t: -t[1][stat]):
+            lines.append(f"    {name:<40}{stats[stat]:8.3f}")
+        #
+    
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the form automation against the local stand-in form.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--suggest-delay", type=float, default=0.1)
+    parser.add_argument("--navigation-delay", type=float, default=0.05)
+    parser.add_argument("--headed", action="store_true")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    
+    result = run_benchmark(
+        n_runs=args.runs,
+        suggest_delay=args.suggest_delay,
+        navigation_delay=args.navigation_delay,
+        headless=not args.headed
+    )
+    print(format_report(result))
+    
+    if args.output is not None:
+        args.output.write_text(json.dumps(result, indent=2))
+    
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(result, baseline, threshold=args.threshold)
+        for reg in regressions:
+            print(f"Regression in {reg['category']}/{reg['name']}: {reg['baseline']:.3f}s -> {reg['current']:.3f}s ({reg['change']:+.0%})")
+        
+        if regressions:
+            sys.exit(1)
+        #
+    #
@@ -0,0 +1,191 @@
+"""Helpers for keeping a browser running between sessions, so sessions can skip launching a browser
+and loading the form.
+The browser is a plain Chromium process with remote debugging enabled, which sessions attach to using
+connect_over_cdp. Sessions leave a 'spare' page with the form loaded in the browser, which the next session claims.
+
+The remote debugging endpoint is unauthenticated, so the browser picks a random port, and uses a fresh profile in a
+private temporary folder, which is deleted by stop_server. The port and profile folder are only recorded in a state
+file which only the user can read."""
+
+import json
+import logging
+logger = logging.getLogger(__name__)
+from pathlib import Path
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from playwright.sync_api import BrowserContext, Page, Playwright
+
+from pillepas import config
+from pillepas.persistence.storage import atomic_write
+
+
+# Marker stored in window.name of spare pages
+SPARE_PAGE_MARKER = "pillepas-spare"
+
+# File in the profile folder where Chromium writes the port it listens on
+_PORT_FILE = "DevToolsActivePort"
+
+
+def endpoint_url(port: int) -> str:
+    return f"http://127.0.0.1:{port}"
+
+
+def _read_state() -> dict|None:
+    """The port and profile folder of the running server, if any was started"""
+    
+    try:
+        res = json.loads(config.BROWSER_SERVER_STATE_PATH.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    
+    return res
+
+
+def _write_state(port: int, profile_dir: Path) -> None:
+    config.BROWSER_SERVER_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # Written via a temporary file from mkstemp, so only the user can read it
+    raw = json.dumps(dict(port=port, profile_dir=str(profile_dir))).encode("utf-8")
+    atomic_write(config.BROWSER_SERVER_STATE_PATH, raw)
+
+
+def _read_port(profile_dir: Path) -> int|None:
+    try:
+        res = int((profile_dir / _PORT_FILE).read_text().splitlines()[0])
+    except (FileNotFoundError, IndexError, ValueError):
+        return None
+    
+    return res
+
+
+def server_is_running(port: int=None) -> bool:
+    """Whether a browser is listening on the port. Defaults to the port of the server started by ensure_server."""
+    
+    if port is None:
+        state = _read_state()
+        if state is None:
+            return False
+        port = state["port"]
+    
+    try:
+        with urllib.request.urlopen(f"{endpoint_url(port)}/json/version", timeout=0.5):
+            return True
+    except (urllib.error.URLError, OSError):
+        return False
+    #
+
+
+def _cleanup(state: dict) -> None:
+    shutil.rmtree(state["profile_dir"], ignore_errors=True)
+    config.BROWSER_SERVER_STATE_PATH.unlink(missing_ok=True)
+
+
+def ensure_server(playwright: Playwright, headless: bool=False, timeout: float=10.0) -> str:
+    """Starts a detached Chromium process listening for remote debugging connections, unless one is already running.
+    The process outlives the python process. Returns the endpoint URL to connect to."""
+    
+    state = _read_state()
+    if state is not None:
+        if server_is_running(state["port"]):
+            return endpoint_url(state["port"])
+        
+        # Left over from a server which is no longer running
+        _cleanup(state)
+    
+    profile_dir = Path(tempfile.mkdtemp(prefix="pillepas-browser-"))
+    args = [
+        playwright.chromium.executable_path,
+        "--remote-debugging-port=0",  # Pick a random free port, and write it to the profile folder
+        f"--user-data-dir={profile_dir}",
+        "--no-first-run",
+        "--no-default-browser-check",
+    ]
+    if headless:
+        args.append("--headless=new")
+    
+    logger.info("Starting browser server.")
+    subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True  # So the browser isn't killed along with the python process
+    )
+    
+    deadline = time.time() + timeout
+    port = None
+    while port is None or not server_is_running(port):
+        if time.time() > deadline:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+            raise RuntimeError(f"Browser server didn't start listening within {timeout} seconds.")
+        time.sleep(0.1)
+        port = _read_port(profile_dir)
+    
+    _write_state(port, profile_dir)
+    return endpoint_url(port)
+
+
+def stop_server(playwright: Playwright, timeout: float=5.0) -> None:
+    """Shuts down the browser server, if running, and deletes its profile"""
+    
+    state = _read_state()
+    if state is None:
+        return
+    
+    if server_is_running(state["port"]):
+        browser = playwright.chromium.connect_over_cdp(endpoint_url(state["port"]))
+        browser.new_browser_cdp_session().send("Browser.close")
+        
+        # Wait for the browser to exit, so it doesn't write to the profile while it's being deleted
+        deadline = time.time() + timeout
+        while server_is_running(state["port"]) and time.time() < deadline:
+            time.sleep(0.1)
+        #
+    
+    _cleanup(state)
+
+
+def _origin(url: str) -> tuple[str, str]:
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme, parts.netloc
+
+
+def claim_spare_page(context: BrowserContext, url: str) -> Page|None:
+    """Returns a spare page on the url's origin, if one exists in the context. Matching on the origin rather than the
+    full url means spare pages which were redirected (e.g. to a page with a session id) are claimed as well, rather
+    than being left open. The page is unmarked, so other sessions won't claim it as well."""
+    
+    origin = _origin(url)
+    for page in context.pages:
+        if _origin(page.url) != origin:
+            continue
+        
+        claimed = page.evaluate(
+            "(marker) => { const res = window.name === marker; if (res) { window.name = ''; } return res; }",
+            SPARE_PAGE_MARKER
+        )
+        if claimed:
+            logger.debug(f"Claimed spare page.")
+            return page
+        #
+    
+    return None
+
+
+def prepare_spare_page(context: BrowserContext, url: str) -> Page:
+    """Opens a new page and starts loading the url in it, marking it as spare.
+    Only waits for the navigation to commit, so the page finishes loading in the background."""
+    
+    page = context.new_page()
+    page.goto(url, wait_until="commit")
+    page.evaluate("(marker) => { window.name = marker; }", SPARE_PAGE_MARKER)
+    return page
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,204 @@
+"""Builds the form's proxies from the field specification in data/fields.yaml.
+The specification is compiled into plain CSS attribute selectors (e.g. input[name="firstName"]), which are much
+cheaper for the browser to resolve than the chained role/label locators in make_proxies.proxy_factory.
+The compiled specification is cached as JSON, keyed by a hash of the YAML file and the version of the compiler,
+so the YAML only needs to be parsed again when it or the compiler changes.
+If the specification can't be loaded, FormGateway falls back to the hand-written proxy_factory."""
+
+import hashlib
+import json
+import logging
+logger = logging.getLogger(__name__)
+from pathlib import Path
+from playwright.sync_api import Locator, Page
+import re
+from typing import Dict, Generator, Tuple
+import yaml
+
+from pillepas import config
+from pillepas.automation import proxy_classes
+from pillepas.automation.proxy_classes import MedicineProxy, Proxy
+from pillepas.persistence.catalog import OptionCatalog
+from pillepas.persistence.storage import atomic_write
+
+_here = Path(__file__).parent.resolve()
+FIELDS_PATH = _here.parent / "data" / "fields.yaml"
+
+SECTIONS = ("medicine", "volatile", "base")
+MEDICINE_KEY = "medicine"
+APPEND_TAG = "append"
+ANY_ROW_TAG = "any_row"
+
+# Increment when changing the format of the compiled specification, so cached specs from older versions are
+# compiled again
+COMPILER_VERSION = 2
+
+
+class SpecError(Exception):
+    pass
+
+
+def _hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _row_wildcard_selector(name: str) -> str:
+    """Selector matching a field in all medication rows, e.g. 'medication.0.drug' becomes
+    [name^="medication."][name$=".drug"]."""
+    
+    m = re.fullmatch(r"(.*?\.)\d+(\..*)", name)
+    if m is None:
+        return f'[name="{name}"]'
+    
+    head, tail = m.groups()
+    res = f'[name^="{head}"][name$="{tail}"]'
+    return res
+
+
+def _compile_field(field: dict, section: str) -> dict:
+    """Compiles a single field from the YAML file into a dict of plain values"""
+    
+    try:
+        key = field["key"].strip()
+    except (KeyError, AttributeError):
+        raise SpecError(f"Field without a key in section '{section}': {field}")
+    
+    tags = field.get("tags", [])
+    if isinstance(tags, str):
+        tags = [tags]
+    append = APPEND_TAG in tags or section == "medicine"
+    
+    selector = field.get("selector")
+    if selector is None:
+        if "name" not in field:
+            raise SpecError(f"Field {key} needs either a name or a selector.")
+        name = field["name"]
+        any_row = append or ANY_ROW_TAG in tags
+        selector = _row_wildcard_selector(name) if any_row else f'[name="{name}"]'
+    
+    element = field.get("element", [selector])
+    if isinstance(element, str):
+        element = [element]
+    
+    proxy = field.get("proxy", Proxy.__name__)
+    cls_ = getattr(proxy_classes, proxy, None)
+    if not (isinstance(cls_, type) and issubclass(cls_, Proxy)):
+        raise SpecError(f"Unknown proxy class for field {key}: {proxy}")
+    
+    res = dict(
+        key=key,
+        proxy=proxy,
+        selector=selector,
+        element=element,
+        label=field.get("label"),
+        sensitive=bool(field.get("sensitive", False)),
+        catalog=bool(field.get("catalog", False)),
+        append=append,
+        volatile=section == "volatile",
+    )
+    
+    return res
+
+
+def compile_spec(raw: bytes) -> list[dict]:
+    """Compiles the contents of a fields YAML file into a list of field specs.
+    Volatile fields are placed after the others, so they're filled last within their group."""
+    
+    d = yaml.safe_load(raw)
+    if not isinstance(d, dict) or not set(d.keys()) <= set(SECTIONS):
+        raise SpecError(f"Expected the sections {SECTIONS} in the field specification.")
+    
+    fields = [_compile_field(field, section) for section in SECTIONS for field in d.get(section) or []]
+    res = [f for f in fields if not f["volatile"]] + [f for f in fields if f["volatile"]]
+    
+    keys = [f["key"] for f in res]
+    if len(set(keys)) != len(keys) or MEDICINE_KEY in keys:
+        raise SpecError(f"Field keys must be unique, and '{MEDICINE_KEY}' is reserved. Got {keys}.")
+    
+    return res
+
+
+def load_spec(path: Path=None, cache_path: Path=None) -> list[dict]:
+    """Loads the compiled field specification. Uses the cache if it matches the hash of the YAML file and the
+    compiler version, otherwise compiles the YAML and updates the cache."""
+    
+    if path is None:
+        path = FIELDS_PATH
+    if cache_path is None:
+        cache_path = config.FIELD_SPEC_CACHE_PATH
+    
+    raw = path.read_bytes()
+    hash_ = _hash(raw)
+    
+    try:
+        cached = json.loads(cache_path.read_text())
+        if cached["hash"] == hash_ and cached["version"] == COMPILER_VERSION:
+            return cached["fields"]
+        #
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+        pass
+    
+    logger.debug(f"Compiling field specification from {path}.")
+    res = compile_spec(raw)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        d = dict(hash=hash_, version=COMPILER_VERSION, fields=res)
+        atomic_write(cache_path, json.dumps(d).encode("utf-8"))
+    except OSError as e:
+        logger.warning(f"Could not cache the compiled field specification: {e}")
+    
+    return res
+
+
+def _locate(elem: Page|Locator, chain: list[str]) -> Locator:
+    res = elem
+    for selector in chain:
+        res = res.locator(selector)
+    return res
+
+
+def compiled_proxy_factory(
+        elem: Page|Locator,
+        catalog: OptionCatalog=None,
+        substitutions: Dict[type, type]=None,
+        spec: list[dict]=None
+    ) -> Generator[Tuple[str, Proxy], None, None]:
+    """Generates (key, proxy) tuples for each field in the specification. Has the same signature as
+    make_proxies.proxy_factory, so can be used in its place.
+    spec (list, optional) - compiled field specification. Loaded with load_spec if not provided."""
+    
+    if substitutions is None:
+        substitutions = dict()
+    
+    def sub(cls_: type) -> type:
+        return substitutions.get(cls_, cls_)
+    
+    if spec is None:
+        spec = load_spec()
+    
+    def make(field: dict) -> Proxy:
+        kwargs = dict(key=field["key"], selector=field["selector"])
+        if field["sensitive"]:
+            kwargs["sensitive"] = True
+        if field["catalog"]:
+            kwargs["catalog"] = catalog
+        
+        cls_ = sub(getattr(proxy_classes, field["proxy"]))
+        res = cls_(_locate(elem, field["element"]), **kwargs)
+        return res
+    
+    # Fields tagged with 'append' are repeated for each medication, so make up the medicine proxy
+    sub_proxies = {field["key"]: make(field) for field in spec if field["append"]}
+    if sub_proxies:
+        # Defer medicine proxy until last, to make sure doctor info is filled out before
+        yield MEDICINE_KEY, sub(MedicineProxy)(elem, key=MEDICINE_KEY, sub_proxies=sub_proxies, order=float('inf'))
+    
+    for field in spec:
+        if not field["append"]:
+            yield field["key"], make(field)
+        #
+    #
+
+
+if __name__ == '__main__':
+    pass
@@ -5,51 +5,75 @@ from playwright.sync_api import Browser, Locator, Page, Playwright, sync_playwri
 from playwright._impl._errors import TargetClosedError
 import time
 
+from pillepas import tracing
+from pillepas.automation import browser_server, timing
+from pillepas.automation.fill_plan import FillPlan
 from pillepas.automation.form_gateway import FormGateway
-from pillepas.automation.utils import add_wait, WaitForChange
+from pillepas.automation.lean import LEAN_LAUNCH_ARGS, LEAN_VIEWPORT, NetworkFilter
+from pillepas.automation.roundtrips import RoundTripCounter
+from pillepas.automation.utils import add_wait, FormTransitionWatcher, WaitForMutation
 from pillepas import config
+from pillepas.persistence.catalog import OptionCatalog
+from pillepas.persistence.form_map import FormMap
+
+
+class FillError(Exception):
+    """Raised in non-interactive fills when the form can't be completed without the user"""
+    pass
 
 
 def on_page_close():
     print("The page has been closed!")
 
 
-class Session:
+class SessionBase:
+    """The parts of a session which don't talk to the browser: the fill data, what has been filled and read so far,
+    and locators for the form. Session adds the methods which drive the form using the sync Playwright API, and
+    AsyncSession (see the async_fill_form module) adds coroutine versions of them."""
+    
     url = config.URL
     next_button_text = "Næste"
     
-    # javascript variables for signalling page is done from js (user clicks next) and python (reading complete)
+    # javascript variables for signalling page is done from js (promise resolving when user clicks next)
+    # and python (callback releasing the click when reading is complete)
     user_clicked_next_var = "window.__userClickedNext"
     python_done_reading_var = "window.__pythonDoneReading"
     
-    def __init__(self, fill_data: dict, headless=False):
-        """Creates a session for filling a pillepas form.
-        fill_data (dict) - A dictionary containing form data
-        headless (bool, default True) - whether to run Playwright in headless mode"""
-
+    # Max number of milliseconds to wait for the form to change after leaving a page, in non-interactive fills
+    transition_timeout = 10000
+    
+    def __init__(
+            self,
+            fill_data: dict,
+            headless=False,
+            catalog: OptionCatalog=None,
+            browser: Browser=None,
+            url: str=None
+        ):
+        """fill_data (dict) - A dictionary containing form data
+        headless (bool, default False) - whether to run Playwright in headless mode
+        catalog (OptionCatalog, optional) - catalog of autocomplete options. Uses the default location if not provided.
+        browser (Browser, optional) - A launched browser to use. If provided, the session only creates (and closes)
+            its own browser context, leaving the browser running.
+        url (str, optional) - URL of the form. Defaults to the real form."""
+        
         self.fill_data = fill_data
+        if url is not None:
+            self.url = url
         self.saved_fields = set([])
         self.read_fields = dict()
         self.n_reads_executed = 0
         self.processed_pages_signatures = set([])  # For figuring out if we already did a page
         
         self.headless = headless
-        self.playwright: Playwright | None = None
-        self.browser: Browser | None = None
+        self.catalog = OptionCatalog() if catalog is None else catalog
+        self.playwright = None
+        self.browser = browser
+        self._owns_browser = browser is None
         self.context = None
-        self.page: Page | None = None
-        self.proxies: FormGateway = None
-    
-    def start(self):
-        self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=self.headless)
-        self.context = self.browser.new_context(color_scheme="dark")
-        self.page = self.context.new_page()
-        self.page.goto(self.url)
-
-        self.proxies = FormGateway(self.form)
-
-        self.page.on("close", on_page_close)
+        self.page = None
+        self.proxies = None
+        self.transitions = None
     
     @property
     def form(self) -> Locator:
@@ -66,16 +90,6 @@ class Session:
         btn = self.form.get_by_role("button", name="Bestil pillepas")
         return btn
     
-    def is_last_page(self):
-        return self.next_button.count() == 0
-    
-    def next_page(self):
-        """Navigate to the next form page"""
-        
-        with WaitForChange(self.form):
-            self.next_button.click()
-        #
-
     def _log_str(self, key: str, value) -> str:
         """Returns a string for logging a key-value relation, e.g. 'my_key = 'my_value'.
         If the key is marked as sensitive, the value string is replaced by '*' characters."""
@@ -86,13 +100,173 @@ class Session:
         
         s = f"{key} = {valstring}"
         return s
+    
+    def _needs_write(self, present_fields) -> list[str]:
+        """The present fields which haven't been filled yet, and have data"""
+        return [key for key in present_fields if key not in self.saved_fields and key in self.fill_data]
+    
+    def _register_bulk_fill(self, filled: dict[str, bool]):
+        """Marks the fields which were filled in bulk as saved. Failed ones are left to their proxies."""
+        
+        for key, success in filled.items():
+            if success:
+                logger.info(f"Filled form element: {self._log_str(key, self.fill_data[key])}.")
+                self.saved_fields.add(key)
+            else:
+                logger.debug(f"Bulk fill failed for {key} - falling back to proxy.")
+            #
+        #
+    
+    def _register_read(self, values: dict):
+        for key, current_val in values.items():
+            # If we read a new value, store it
+            if current_val != self.read_fields.get(key):
+                self.read_fields[key] = current_val
+                logger.info(f"Read form element: {self._log_str(key, current_val)}.")
+            #
+        #
+    #
 
-    def fill_fields_on_current_page(self):
-        """Fills out the fields that are present on the current form page."""
+
+class Session(SessionBase):
+    def __init__(
+            self,
+            fill_data: dict,
+            headless=False,
+            catalog: OptionCatalog=None,
+            browser: Browser=None,
+            use_server: bool=False,
+            lean: bool=False,
+            network_filter: NetworkFilter=None,
+            url: str=None,
+            count_round_trips: bool=False,
+            form_map: FormMap=None
+        ):
+        """Creates a session for filling a pillepas form.
+        fill_data (dict) - A dictionary containing form data
+        headless (bool, default True) - whether to run Playwright in headless mode
+        catalog (OptionCatalog, optional) - catalog of autocomplete options. Uses the default location if not provided.
+        browser (Browser, optional) - A launched browser to use. If provided, the session only creates (and closes)
+            its own browser context, leaving the browser running.
+        use_server (bool, default False) - whether to attach to a long-lived browser (see the browser_server module),
+            starting it if needed. Reuses a page with the form loaded, if one is available, and leaves another one
+            ready for the next session. Stopping the session leaves the browser running.
+        lean (bool, default False) - whether to block requests which aren't needed for filling the form, and to
+            launch the browser with flags and a viewport which lower rendering costs.
+        network_filter (NetworkFilter, optional) - filter to use in lean mode. Defaults to a NetworkFilter
+            with default settings.
+        url (str, optional) - URL of the form. Defaults to the real form. Useful for running against a local stand-in
+            (see the standin module).
+        count_round_trips (bool, default False) - whether to count calls to the browser, by page, field and method.
+            The counts are available as the round_trips attribute, and a summary is logged after filling.
+        form_map (FormMap, optional) - map of previously seen form pages, for identifying pages without probing
+            each field. Uses the default location if not provided."""
+        
+        super().__init__(fill_data=fill_data, headless=headless, catalog=catalog, browser=browser, url=url)
+        self.playwright: Playwright | None = None
+        self._owns_browser = browser is None and not use_server
+        self.use_server = use_server
+        self.lean = lean
+        self.network_filter = None
+        if lean:
+            self.network_filter = NetworkFilter() if network_filter is None else network_filter
+        self.page: Page | None = None
+        self.proxies: FormGateway = None
+        self.transitions: FormTransitionWatcher | None = None
+        self.round_trips = RoundTripCounter() if count_round_trips else None
+        self.form_map = form_map
+        # Plan for repeating the fill, recorded as pages are filled (see the fill_plan module)
+        self.plan: FillPlan | None = None
+        self._plan_complete = True
+    
+    def _attach_to_server(self):
+        """Connects to the browser server, and claims a spare page with the form, if available"""
         
-        for key in self.proxies.present_fields():
-            needs_write = key not in self.saved_fields and key in self.fill_data
-            if needs_write:
+        self.playwright = sync_playwright().start()
+        endpoint = browser_server.ensure_server(self.playwright, headless=self.headless)
+        self.browser = self.playwright.chromium.connect_over_cdp(endpoint)
+        
+        # Pages in the default context survive disconnecting, so use that
+        self.context = self.browser.contexts[0]
+        if self.network_filter is not None:
+            self.network_filter.install(self.context)
+        self.page = browser_server.claim_spare_page(self.context, self.url)
+        if self.page is None:
+            self.page = self.context.new_page()
+            self.page.goto(self.url)
+        else:
+            self.page.wait_for_load_state()
+        
+        self.page.emulate_media(color_scheme="dark")
+        browser_server.prepare_spare_page(self.context, self.url)
+    
+    def start(self):
+        with tracing.span("Session.start", category="phase", timed="start", lean=self.lean, use_server=self.use_server):
+            self._start()
+        #
+    
+    def _start(self):
+        if self.use_server:
+            self._attach_to_server()
+        else:
+            if self._owns_browser:
+                self.playwright = sync_playwright().start()
+                args = list(LEAN_LAUNCH_ARGS) if self.lean else None
+                self.browser = self.playwright.chromium.launch(headless=self.headless, args=args)
+            
+            viewport = LEAN_VIEWPORT if self.lean else None
+            self.context = self.browser.new_context(color_scheme="dark", viewport=viewport)
+            if self.network_filter is not None:
+                self.network_filter.install(self.context)
+            self.page = self.context.new_page()
+            self.page.goto(self.url)
+
+        if self.round_trips is not None:
+            self.page = self.round_trips.wrap(self.page)
+            # Round trips are attributed to fields using the spans, so they must be recorded
+            tracing.add_recorder(self.round_trips)
+        
+        self.proxies = FormGateway(self.form, catalog=self.catalog)
+        layout = self.proxies.layout()
+        if self.form_map is None:
+            self.form_map = FormMap(layout=layout)
+        self.plan = FillPlan(layout=layout)
+        self.transitions = FormTransitionWatcher(self.form)
+
+        self.page.on("close", on_page_close)
+    
+    def is_last_page(self):
+        return self.next_button.count() == 0
+    
+    def next_page(self):
+        """Navigate to the next form page"""
+        
+        with tracing.span("Session.next_page", category="phase", timed="navigate"), WaitForMutation(self.form):
+            self.next_button.click()
+        #
+
+    def fill_fields_on_current_page(self, presence: dict=None):
+        """Fills out the fields that are present on the current form page.
+        presence (dict, optional) - presence map from FormGateway.presence, to avoid re-probing the page."""
+        
+        with tracing.span("Session.fill_fields_on_current_page", category="phase", timed="fill"):
+            self._fill_fields(presence=presence)
+        #
+    
+    def _fill_fields(self, presence: dict=None):
+        needs_write = self._needs_write(self.proxies.present_fields(presence=presence))
+        
+        # Write plain text fields in bulk, and leave the remaining fields (or failed ones) to their proxies
+        try:
+            filled = self.proxies.fill_values({key: self.fill_data[key] for key in needs_write})
+        except Exception as e:
+            # E.g. the form was detached or the page navigated. Leave all fields to their proxies
+            logger.warning(f"{self} failed to fill elements in bulk - {e}. Falling back to proxies.")
+            filled = dict()
+        self._register_bulk_fill(filled)
+        
+        for key in needs_write:
+            if key not in self.saved_fields:
                 try:
                     val = self.fill_data[key]
                     logstring = self._log_str(key, val)
@@ -105,17 +279,14 @@ class Session:
             #
         #
 
-    def read_fields_on_current_page(self):
-        """Reads field data from all fields present on the current form page."""
+    def read_fields_on_current_page(self, presence: dict=None):
+        """Reads field data from all fields present on the current form page.
+        presence (dict, optional) - presence map from FormGateway.presence, to avoid re-probing the page."""
         
         logger.debug(f"Reading all present fields")
-        for key in self.proxies.present_fields():
-            current_val = self.proxies[key].get_value()
-            # If we read a new value, store it
-            if current_val != self.read_fields.get(key):
-                self.read_fields[key] = current_val
-                logger.info(f"Read form element: {self._log_str(key, current_val)}.")
-            #
+        with tracing.span("Session.read_fields_on_current_page", category="phase", timed="read"):
+            values = self.proxies.read_values(presence=presence)
+        self._register_read(values)
 
     def _current_title(self):
         """Attempts to determine the title of the current form page"""
@@ -125,6 +296,24 @@ class Session:
         if len(diff) == 1:
             return list(diff)[0]
 
+    def _identify_page(self) -> tuple[dict, int, str|None, str]:
+        """Determines the presence map, signature, title and fingerprint of the current page.
+        If the page's fingerprint is in the form map, the cached information is used. Otherwise, the page is probed,
+        and the result is added to the map."""
+        
+        fingerprint = self.proxies.fingerprint()
+        entry = self.form_map.lookup(fingerprint)
+        if entry is not None:
+            presence = self.proxies.presence_from_fields(entry["fields"])
+            return presence, entry["signature"], entry["title"], fingerprint
+        
+        presence = self.proxies.presence()
+        sig = self.proxies.signature(presence=presence)
+        title = self._current_title()
+        self.form_map.record(fingerprint, sig, list(self.proxies.present_fields(presence=presence)), title)
+        
+        return presence, sig, title, fingerprint
+    
     def wait_for_user_next(self):
         add_wait(
             page=self.page,
@@ -133,40 +322,69 @@ class Session:
             python_done_reading_varname = self.python_done_reading_var
         )
         
-        while self.page.evaluate(f"{self.user_clicked_next_var} === true") is False:
-            user_clicked = self.page.evaluate(f"{self.user_clicked_next_var} === true")
-            logger.debug(f"User clicked next? {user_clicked}")
-            time.sleep(0.2)
+        # Evaluating the promise blocks until the user clicks
+        logger.debug("Waiting for user to click next")
+        self.page.evaluate(self.user_clicked_next_var)
         
         logger.debug("Pre-navigation read triggered")
         self.read_fields_on_current_page()
-        self.page.evaluate(f"{self.python_done_reading_var} = true")
+        self.page.evaluate(f"{self.python_done_reading_var}?.()")
 
-    def process_current_page(self, force_reprocess=False, let_user_click_next=True):
+    def process_current_page(self, force_reprocess=False, let_user_click_next=True, interactive=True) -> bool:
         """Go over all present fields, write any unwritten data, and update read values.
         If the page has already been processed, no action is performed except if
-        force_reprocess is True."""
+        force_reprocess is True.
+        If the page can't be completed automatically, the user takes over, unless interactive is False, in which
+        case FillError is raised.
+        Returns whether the page was processed."""
         
-        sig = self.proxies.signature()
+        with tracing.span("Session.process_current_page", category="session"):
+            res = self._process_current_page(
+                force_reprocess=force_reprocess,
+                let_user_click_next=let_user_click_next,
+                interactive=interactive
+            )
+        return res
+    
+    def _process_current_page(self, force_reprocess=False, let_user_click_next=True, interactive=True) -> bool:
+        start = time.perf_counter()
+        with tracing.span("Session.identify_page", category="phase", timed="signature"):
+            presence, sig, title, fingerprint = self._identify_page()
         if sig in self.processed_pages_signatures and not force_reprocess:
-            return
+            return False
         
         self.processed_pages_signatures.add(sig)
+        if self.round_trips is not None:
+            self.round_trips.page = sig
         
         # Print info on current page
         pageno = len(self.processed_pages_signatures)
-        title = self._current_title()
-        logger.info(f"Processing form page {pageno}{f' "{title}"'if title else ''} (signature {sig})")
+        title_str = f' "{title}"' if title else ""
+        logger.info(f"Processing form page {pageno}{title_str} (signature {sig})")
         
-        self.fill_fields_on_current_page()
+        self.fill_fields_on_current_page(presence=presence)
         
-        page_done = all(field in self.saved_fields for field in self.proxies.present_fields())
+        # Filling may reveal new fields, so probe again
+        with tracing.span("Session.identify_page", category="phase", timed="signature"):
+            presence, _, _, fingerprint_after = self._identify_page()
+        fields = list(self.proxies.present_fields(presence=presence))
+        page_done = all(field in self.saved_fields for field in fields)
         if page_done and not let_user_click_next:
-            self.read_fields_on_current_page()
+            self.read_fields_on_current_page(presence=presence)
             self.next_page()
+            self.plan.add_step(fingerprint, sig, fields, reprobe=fingerprint_after != fingerprint)
+        elif not interactive:
+            # Only the keys are reported - never the values
+            missing = [field for field in fields if field not in self.saved_fields]
+            raise FillError(f"Page {pageno} can't be completed without the user (unfilled fields: {missing}).")
         else:
+            # The user takes over, so the plan can't cover the whole form
+            self._plan_complete = False
             self.wait_for_user_next()
         
+        timing.record("page", f"{pageno} {title}" if title else str(pageno), time.perf_counter() - start)
+        return True
+    
     def process_submit_page(self):
         """Processes the final page of the form"""
         
@@ -186,23 +404,141 @@ class Session:
     def confirm_close(self):
         input("Done - press any key to close.")
     
-    def fill(self, auto_click_next: bool=False, auto_submit: bool=False):
-        """auto_submit (bool, default False) - Whether to automatically submit the application after it's been filled"""
+    def fill(
+            self,
+            auto_click_next: bool=False,
+            auto_submit: bool=False,
+            wait_for_user: bool=True,
+            interactive: bool=True,
+            timeout: float=None
+        ):
+        """auto_click_next (bool, default False) - Whether to navigate automatically, rather than waiting for the user
+        auto_submit (bool, default False) - Whether to automatically submit the application after it's been filled
+        wait_for_user (bool, default True) - Whether to wait for the user to submit (if not auto-submitting), and to
+            confirm closing. Disable for unattended runs.
+        interactive (bool, default True) - Whether the user can take over pages which can't be completed
+            automatically. If False, such pages raise FillError, as does a page which doesn't change within
+            transition_timeout after leaving it (e.g. due to a validation error). Disable for unattended runs.
+        timeout (float, optional) - Max number of seconds for filling. Also used as the default timeout of
+            Playwright actions. Raises FillError when exceeded.
+        If every page is filled and navigated automatically, a plan for repeating the fill (see the replay method) is
+        available as the plan attribute afterwards."""
+        
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+            self.page.set_default_timeout(timeout*1000)
         
         while not self.is_last_page():
-            self.process_current_page(let_user_click_next=not auto_click_next)
+            if deadline is not None and time.monotonic() > deadline:
+                raise FillError(f"Filling the form took more than {timeout} seconds.")
+            
+            self.transitions.mark()
+            processed = self.process_current_page(let_user_click_next=not auto_click_next, interactive=interactive)
+            if not processed:
+                # Nothing to do until the form changes, e.g. when the user moves to the next page
+                changed = self.transitions.wait(timeout=None if interactive else self.transition_timeout)
+                if not changed:
+                    raise FillError("The form didn't change after leaving the page, e.g. due to a validation error.")
+                #
+            #
+        
+        with tracing.span("Session.submit", category="phase", timed="submit"):
+            self.process_submit_page()
+            
+            # If auto-submitting, click the final submit button
+            if auto_submit:
+                self.submit_button.click()
+            #
         
-        self.process_submit_page()
+        # Otherwise, wait for the user to submit
+        if not auto_submit and wait_for_user:
+            self.submit_button.wait_for(state="detached", timeout=0)
         
-        # If auto-submitting, click the final submit button
-        if auto_submit:
-            self.submit_button.click()
-        else:
-            while self.submit_button.count():
-                time.sleep(.1)
+        # Save when each known page was last seen
+        self.form_map.save()
+        
+        # Only keep the plan if every page was filled and navigated automatically
+        if not self._plan_complete:
+            logger.debug("Not all pages were filled automatically, so no fill plan was made.")
+            self.plan = None
+        
+        if self.round_trips is not None:
+            logger.info(self.round_trips.format_summary())
+        
+        if wait_for_user:
+            self.confirm_close()
+    
+    def _replay_step(self, step: dict) -> bool:
+        """Fills and leaves the current page as described by a step in a fill plan.
+        Returns whether the step could be completed. If not, the page is left for regular processing."""
+        
+        sig = step["signature"]
+        self.processed_pages_signatures.add(sig)
+        if self.round_trips is not None:
+            self.round_trips.page = sig
+        
+        presence = self.proxies.presence_from_fields(step["fields"])
+        self.fill_fields_on_current_page(presence=presence)
+        
+        fingerprint = step["fingerprint"]
+        if step["reprobe"]:
+            with tracing.span("Session.identify_page", category="phase", timed="signature"):
+                presence, _, _, _ = self._identify_page()
             #
         
-        self.confirm_close()
+        fields = list(self.proxies.present_fields(presence=presence))
+        if not all(field in self.saved_fields for field in fields):
+            # Let the page be processed again from scratch
+            self.processed_pages_signatures.discard(sig)
+            return False
+        
+        self.read_fields_on_current_page(presence=presence)
+        self.next_page()
+        self.plan.add_step(fingerprint, sig, fields, reprobe=step["reprobe"])
+        return True
+    
+    def replay(
+            self,
+            plan: FillPlan,
+            auto_submit: bool=False,
+            wait_for_user: bool=True,
+            interactive: bool=True,
+            timeout: float=None
+        ):
+        """Fills the form by following a plan recorded in an earlier session, using this session's fill data.
+        Each page is only verified by its fingerprint, rather than probed for fields. On the first page which doesn't
+        match the plan, falls back to regular filling (as with fill, navigating automatically) for the remaining pages.
+        plan (FillPlan) - the plan to follow.
+        auto_submit, wait_for_user, interactive, timeout - as for the fill method. The timeout only covers the
+            regular filling."""
+        
+        steps = plan.steps
+        if plan.layout != self.plan.layout:
+            logger.info("Fill plan was made for different proxies. Filling without it.")
+            steps = []
+        
+        for i, step in enumerate(steps):
+            with tracing.span("FormGateway.fingerprint", category="phase", timed="signature"):
+                fingerprint = self.proxies.fingerprint()
+            
+            if fingerprint != step["fingerprint"]:
+                logger.info(f"Page {i+1} doesn't match the fill plan. Continuing without it.")
+                break
+            
+            logger.info(f"Replaying fill plan for page {i+1}")
+            if not self._replay_step(step):
+                logger.info(f"Could not complete page {i+1} from the fill plan. Continuing without it.")
+                break
+            #
+        
+        self.fill(
+            auto_click_next=True,
+            auto_submit=auto_submit,
+            wait_for_user=wait_for_user,
+            interactive=interactive,
+            timeout=timeout
+        )
             
     def is_alive(self) -> bool:
         """Whether the session is alive (to avoid things hanging)"""
@@ -213,8 +549,31 @@ class Session:
             return False
     
     def stop(self):
-        self.browser.close()
-        self.playwright.stop()
+        """Closes whatever start opened. Safe to call if start failed partway."""
+        
+        if self.round_trips is not None:
+            tracing.remove_recorder(self.round_trips)
+        if self.network_filter is not None:
+            logger.info(f"Network filter stats: {self.network_filter.stats()}")
+        
+        if self.use_server:
+            # Close our page, but leave the browser (and spare page) running
+            if self.page is not None:
+                self.page.close()
+            if self.playwright is not None:
+                self.playwright.stop()
+            return
+        
+        if not self._owns_browser:
+            if self.context is not None:
+                self.context.close()
+            return
+        
+        if self.browser is not None:
+            self.browser.close()
+        if self.playwright is not None:
+            self.playwright.stop()
+        #
     
     def __enter__(self):
         self.start()
@@ -0,0 +1,79 @@
+"""Fill plans, for quickly repeating an order which has been filled before.
+A plan is recorded while a Session fills the form, and holds for each page the fingerprint of the page, its signature,
+the fields which were filled, in order, and whether filling revealed new fields (in which case the page must be
+probed again before moving on).
+Plans contain no values - these are taken from the session's fill data when the plan is replayed, so e.g.
+new travel dates can be used with an existing plan.
+
+Example:
+
+with Session(fill_data) as sess:
+    sess.fill(auto_click_next=True)
+    sess.plan.save()
+
+with Session(new_fill_data) as sess:
+    sess.replay(FillPlan.load())
+"""
+
+import json
+import logging
+logger = logging.getLogger(__name__)
+from pathlib import Path
+
+from pillepas import config
+from pillepas.persistence.storage import atomic_write
+
+
+class FillPlan:
+    """The steps (one per form page) for filling out the form"""
+    
+    def __init__(self, layout: str, steps: list[dict]=None):
+        """layout (str) - identifier of the proxies' layout (see FormGateway.layout), which the plan is only valid for.
+        steps (list, optional) - dicts with keys fingerprint, signature, fields and reprobe."""
+        
+        self.layout = layout
+        self.steps = [] if steps is None else steps
+    
+    def add_step(self, fingerprint: str, signature: int, fields: list[str], reprobe: bool) -> None:
+        step = dict(fingerprint=fingerprint, signature=signature, fields=list(fields), reprobe=reprobe)
+        self.steps.append(step)
+    
+    def to_dict(self) -> dict:
+        return dict(layout=self.layout, steps=self.steps)
+    
+    def save(self, path: Path=None) -> None:
+        """Saves the plan. Defaults to the location in the config module."""
+        
+        if path is None:
+            path = config.FILL_PLAN_PATH
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(path, json.dumps(self.to_dict(), indent=2).encode("utf-8"))
+    
+    @classmethod
+    def load(cls, path: Path=None) -> "FillPlan|None":
+        """Loads a saved plan. Returns None if there is no (valid) plan at the path."""
+        
+        if path is None:
+            path = config.FILL_PLAN_PATH
+        
+        try:
+            d = json.loads(path.read_text())
+            res = cls(layout=d["layout"], steps=d["steps"])
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, KeyError, TypeError):
+            logger.warning(f"Could not parse fill plan at {path}.")
+            return None
+        
+        return res
+    
+    def __len__(self):
+        return len(self.steps)
+    
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self)} steps)"
+    #
+
+
+if __name__ == '__main__':
+    pass
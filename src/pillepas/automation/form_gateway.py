@@ -1,46 +1,229 @@
+import hashlib
+import json
 import logging
 logger = logging.getLogger(__name__)
 from playwright.sync_api import Locator
+from typing import Any, Dict
+import yaml
 
-from pillepas.automation.proxy_classes import Proxy
+from pillepas import tracing
+from pillepas.automation.proxy_classes import Proxy, ProxyBase
+from pillepas.automation.field_spec import compiled_proxy_factory, load_spec, SpecError
 from pillepas.automation.make_proxies import proxy_factory
+from pillepas.automation.utils import _fill_js
+from pillepas.persistence.catalog import OptionCatalog
 
 
-class FormGateway(dict[str, Proxy]):
-    """Helper class that contains proxies for each form element, and methods
-    for iterating over the ones that are present on the current page, etc."""
+# Counts the number of visible matches in the form for each of a number of CSS selectors. Hidden elements
+# (e.g. template fields) are ignored, like the role based locators do
+_count_matches_js = """(form, queries) => {
+    const visible = el => el.checkVisibility ? el.checkVisibility() : el.getClientRects().length > 0;
+    const count = s => Array.from(form.querySelectorAll(s)).filter(visible).length;
+    return Object.fromEntries(
+        Object.entries(queries).map(([key, selectors]) => [key, selectors.map(count)])
+    );
+}"""
+
+# Cheap fingerprint of the form's current structure: the identifying attributes of all elements which proxies'
+# selectors match on, in document order, along with the headings around the form. The values of ids are left out,
+# as they're often generated anew on each render, which would give the same page a new fingerprint every time
+_fingerprint_js = """form => {
+    const attrs = Array.from(
+        form.querySelectorAll('[name], [id], [placeholder]'),
+        el => [el.tagName, el.getAttribute('name'), el.getAttribute('placeholder')].join(':')
+    );
+    const headings = Array.from(form.parentElement?.querySelectorAll('h2') ?? [], el => el.textContent.trim());
+    return attrs.join('|') + '#' + headings.join('|');
+}"""
+
 
-    def __init__(self, element: Locator):
+class FormGatewayBase(dict[str, ProxyBase]):
+    """The parts of a form gateway which don't talk to the browser. FormGateway adds the methods which probe the
+    form using the sync Playwright API, and AsyncFormGateway (see the async_form_gateway module) adds coroutine
+    versions of them."""
+    
+    # Optional mapping from proxy classes to the classes to use instead (see proxy_factory)
+    proxy_substitutions = None
+    # Whether to build proxies from the field specification (data/fields.yaml) rather than the hand-written factory.
+    # Off until the compiled proxies have been run against the stand-in form in a browser (TestFieldSpecFormFill in
+    # tests/test_automation.py), as their locators differ from the hand-written role and label based ones
+    use_field_spec = False
+
+    def __init__(self, element: Locator, catalog: OptionCatalog=None):
+        """element (Locator) - the form element.
+        catalog (OptionCatalog, optional) - option catalog used by autocomplete fields."""
+        
         super().__init__()
         self.element = element
         
-        for key, proxy in proxy_factory(elem=self.element):
-            self[key] = proxy
-        #
+        self.update(self._make_proxies(catalog=catalog))
     #
     
-    def present_fields(self):
-        for key, proxy in sorted(self.items(), key=lambda t: t[1].order):
-            if proxy.is_present():
-                yield key
+    def _make_proxies(self, catalog: OptionCatalog=None) -> Dict[str, ProxyBase]:
+        """Makes proxies from the field specification, falling back to the hand-written factory if the
+        specification can't be loaded, or the proxies can't be built from it (e.g. a stale cached specification)."""
+        
+        kwargs = dict(elem=self.element, catalog=catalog, substitutions=self.proxy_substitutions)
+        if self.use_field_spec:
+            try:
+                spec = load_spec()
+                # Build the proxies right away, so errors are caught here rather than when iterating
+                return dict(compiled_proxy_factory(spec=spec, **kwargs))
+            except (OSError, yaml.YAMLError, SpecError, KeyError, TypeError, AttributeError) as e:
+                logger.warning(f"Could not load field specification ({e!r}). Using hand-written proxies.")
+            #
+        
+        return dict(proxy_factory(**kwargs))
+    
+    def _presence_queries(self) -> Dict[str, list[str]]:
+        """Maps the keys of proxies which support bulk presence checks to their CSS selectors"""
+        res = dict()
+        for key, proxy in self.items():
+            selectors = proxy.presence_selectors()
+            if selectors is not None:
+                res[key] = selectors
             #
-        #
+        return res
+    
+    def _presence_from_counts(self, counts: Dict[str, list[int]]) -> Dict[str, bool|None]:
+        """Determines presence from selector match counts. Proxies without counts are mapped to None."""
+        res = {key: proxy.present_from_counts(counts[key]) if key in counts else None for key, proxy in self.items()}
+        return res
+    
+    def presence_from_fields(self, fields: list[str]) -> Dict[str, bool]:
+        """Presence map corresponding to a list of present fields, e.g. from a FormMap"""
+        present = set(fields)
+        res = {key: key in present for key in self.keys()}
+        return res
+    
+    def layout(self) -> str:
+        """Identifies the proxies and their selectors, so cached presence information can be discarded if they change"""
+        d = {key: [proxy.__class__.__name__, proxy.presence_selectors()] for key, proxy in self.items()}
+        res = hashlib.sha1(json.dumps(d, sort_keys=True).encode("utf-8")).hexdigest()
+        return res
+    
+    def _ordered_present(self, presence: Dict[str, bool]) -> list[str]:
+        return [key for key, proxy in sorted(self.items(), key=lambda t: t[1].order) if presence[key]]
+    
+    def _read_script(self, keys: list[str]) -> tuple[list[str], str|None]:
+        """Returns the keys which can be read in bulk, and a script returning an object with their raw values."""
+        
+        expressions = dict()
+        for key in keys:
+            expr = self[key].read_expression()
+            if expr is not None:
+                expressions[key] = expr
+            #
+        
+        if not expressions:
+            return [], None
+        
+        body = ",\n".join(f"{json.dumps(key)}: {expr}" for key, expr in expressions.items())
+        script = f"form => ({{\n{body}\n}})"
+        return list(expressions.keys()), script
+    
+    def _fill_entries(self, values: Dict[str, Any]) -> list[list]:
+        """Arguments for the bulk fill script, for the values whose proxies support bulk filling"""
+        
+        res = []
+        for key, value in values.items():
+            proxy = self[key]
+            if proxy.bulk_fillable and proxy.selector is not None:
+                logger.debug(f"{proxy} is bulk setting value: {'*'*len(str(value)) if proxy.sensitive else value}")
+                res.append([key, proxy.selector, proxy.index, str(value)])
+            #
+        return res
     
     def __repr__(self):
         return self.__class__.__name__
     
-    def signature(self) -> int:
-        """Returns a distinct integer which depends on the combination of fields that are currently visible.
-        This can be used as a kind of signature, to differentiate between the various pages of a form"""
-        
-        bits = []
-        for key, proxy in sorted(self.items()):
-            present = proxy.is_present()
-            bits.append(present)
+    def _signature_from_presence(self, presence: Dict[str, bool]) -> int:
+        bits = [presence[key] for key in sorted(self.keys())]
         
         bin_str = "".join((str(int(p)) for p in bits))
         res = int(bin_str, 2)
         return res
+    
+    #
+
+
+class FormGateway(FormGatewayBase):
+    """Helper class that contains proxies for each form element, and methods
+    for iterating over the ones that are present on the current page, etc."""
+    
+    def presence(self) -> Dict[str, bool]:
+        """Determines which fields are present on the current page.
+        Proxies with CSS selectors are checked in bulk using a single javascript evaluation, so only proxies
+        without selectors require a round trip to the browser each."""
+        
+        queries = self._presence_queries()
+        counts = self.element.evaluate(_count_matches_js, queries) if queries else dict()
+        
+        res = self._presence_from_counts(counts)
+        for key, present in res.items():
+            if present is None:
+                res[key] = self[key].is_present()
+            #
+        
+        return res
+    
+    def fingerprint(self) -> str:
+        """A short hash of the form's current structure, obtained in a single evaluation"""
+        raw = self.element.evaluate(_fingerprint_js)
+        res = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return res
+    
+    def present_fields(self, presence: Dict[str, bool]=None):
+        """Iterates over the keys of the present fields, in the order they should be filled.
+        presence (dict, optional) - presence map as returned by the presence method. Probes the page if not provided."""
+        
+        if presence is None:
+            presence = self.presence()
+        
+        yield from self._ordered_present(presence)
+    
+    def read_values(self, presence: Dict[str, bool]=None) -> Dict[str, Any]:
+        """Reads the values of all present fields. Values are read in bulk using a single javascript evaluation,
+        except for proxies which can't provide a javascript expression for their value.
+        presence (dict, optional) - presence map as returned by the presence method. Probes the page if not provided."""
+        
+        keys = list(self.present_fields(presence=presence))
+        _, script = self._read_script(keys)
+        raw = dict() if script is None else self.element.evaluate(script)
+        
+        res = dict()
+        for key in keys:
+            if key in raw:
+                res[key] = self[key].convert_read(raw[key])
+            else:
+                res[key] = self[key].get_value()
+            #
+        
+        return res
+    
+    def fill_values(self, values: Dict[str, Any]) -> Dict[str, bool]:
+        """Writes values to all plain text fields among the input in a single javascript evaluation.
+        Fields which require keyboard input etc are skipped, and must be filled using their proxy's set_value.
+        Returns a dict mapping the key of each field that was attempted to whether it was successfully filled."""
+        
+        entries = self._fill_entries(values)
+        if not entries:
+            return dict()
+        
+        with tracing.span("FormGateway.fill_values", category="proxy", timed=f"{Proxy.__name__} (bulk)", n=len(entries)):
+            res = self.element.evaluate(_fill_js, entries)
+        return res
+    
+    def signature(self, presence: Dict[str, bool]=None) -> int:
+        """Returns a distinct integer which depends on the combination of fields that are currently visible.
+        This can be used as a kind of signature, to differentiate between the various pages of a form.
+        presence (dict, optional) - presence map as returned by the presence method. Probes the page if not provided."""
+        
+        if presence is None:
+            presence = self.presence()
+        
+        res = self._signature_from_presence(presence)
+        return res
     #
 
 
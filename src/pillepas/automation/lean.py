@@ -0,0 +1,127 @@
+"""Settings for running the browser with as little overhead as possible, i.e. without loading images, fonts,
+trackers etc, which are irrelevant for filling out the form."""
+
+import logging
+logger = logging.getLogger(__name__)
+from playwright.sync_api import BrowserContext, Request, Response, Route
+from typing import Iterable
+from urllib.parse import urlparse
+
+
+# Chromium flags which disable features we don't need
+LEAN_LAUNCH_ARGS = (
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--mute-audio",
+    "--no-first-run",
+    "--blink-settings=imagesEnabled=false",
+)
+
+# Small, but large enough for the form to use its regular desktop layout
+LEAN_VIEWPORT = dict(width=1024, height=768)
+
+DEFAULT_BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+
+DEFAULT_BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "siteimprove.com",
+    "siteimproveanalytics.com",
+)
+
+
+def _host_matches(host: str, patterns: Iterable[str]) -> bool:
+    """Whether the host is one of the patterns, or a subdomain of one"""
+    return any(host == p or host.endswith(f".{p}") for p in patterns)
+
+
+class NetworkFilter:
+    """Blocks requests which aren't needed for filling out the form, and keeps count of what was blocked.
+    Requests to allowed hosts are never blocked. Otherwise, a request is blocked if its resource type or host
+    is on the deny lists. If allowed_hosts is provided and deny_other_hosts is True, requests to any host
+    not on the allow list are blocked as well.
+    
+    The bytes of blocked requests are never transferred, so can't be measured. Instead, the filter counts the
+    bytes loaded (based on content-length headers), which can be compared against a run using a filter
+    with empty deny lists."""
+    
+    def __init__(
+            self,
+            blocked_resource_types: Iterable[str]=DEFAULT_BLOCKED_RESOURCE_TYPES,
+            blocked_hosts: Iterable[str]=DEFAULT_BLOCKED_HOSTS,
+            allowed_hosts: Iterable[str]=(),
+            deny_other_hosts: bool=False
+        ):
+        """blocked_resource_types - Playwright resource types (e.g. 'image', 'font', 'stylesheet') to block
+        blocked_hosts - hosts (including subdomains) to block
+        allowed_hosts - hosts (including subdomains) which are never blocked
+        deny_other_hosts - whether to block hosts which aren't in allowed_hosts"""
+        
+        self.blocked_resource_types = frozenset(blocked_resource_types)
+        self.blocked_hosts = tuple(blocked_hosts)
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.deny_other_hosts = deny_other_hosts
+        
+        self.requests_allowed = 0
+        self.requests_blocked = 0
+        self.blocked_by_type: dict[str, int] = dict()
+        self.bytes_loaded = 0
+    
+    def should_block(self, request: Request) -> bool:
+        host = urlparse(request.url).hostname or ""
+        if _host_matches(host, self.allowed_hosts):
+            return False
+        if self.deny_other_hosts and self.allowed_hosts:
+            return True
+        
+        res = request.resource_type in self.blocked_resource_types or _host_matches(host, self.blocked_hosts)
+        return res
+    
+    def _handle_route(self, route: Route):
+        request = route.request
+        if self.should_block(request):
+            self.requests_blocked += 1
+            rt = request.resource_type
+            self.blocked_by_type[rt] = self.blocked_by_type.get(rt, 0) + 1
+            route.abort("blockedbyclient")
+        else:
+            self.requests_allowed += 1
+            route.continue_()
+        #
+    
+    def _handle_response(self, response: Response):
+        try:
+            self.bytes_loaded += int(response.headers.get("content-length", 0))
+        except ValueError:
+            pass
+        #
+    
+    def install(self, context: BrowserContext):
+        """Starts filtering the requests made by pages in the context"""
+        context.route("**/*", self._handle_route)
+        context.on("response", self._handle_response)
+    
+    def stats(self) -> dict:
+        res = dict(
+            requests_allowed=self.requests_allowed,
+            requests_blocked=self.requests_blocked,
+            blocked_by_type=dict(self.blocked_by_type),
+            bytes_loaded=self.bytes_loaded
+        )
+        return res
+    
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.stats()})"
+    #
+
+
+if __name__ == '__main__':
+    pass
@@ -1,7 +1,9 @@
 import logging
 logger = logging.getLogger(__name__)
 from playwright.sync_api import Locator, Page
-from typing import Generator, Tuple
+from typing import Dict, Generator, Tuple
+
+from pillepas.persistence.catalog import OptionCatalog
 
 from pillepas.automation.proxy_classes import (
     Proxy,
@@ -13,81 +15,125 @@ from pillepas.automation.proxy_classes import (
 )
 
 
-def proxy_factory(elem: Page|Locator) -> Generator[Tuple[str, Proxy], None, None]:
+def proxy_factory(
+        elem: Page|Locator,
+        catalog: OptionCatalog=None,
+        substitutions: Dict[type, type]=None
+    ) -> Generator[Tuple[str, Proxy], None, None]:
+    """Generates (key, proxy) tuples for each field in the form.
+    catalog (OptionCatalog, optional) - option catalog for autocomplete fields.
+    substitutions (dict, optional) - maps proxy classes to the classes to use in their place, e.g. async variants."""
+    
+    if substitutions is None:
+        substitutions = dict()
+    
+    def sub(cls_: type) -> type:
+        return substitutions.get(cls_, cls_)
+    
     page = elem.page
     dr_css = ':scope[name*="doctor"]'
     nodr_css = ':scope:not([name*="doctor"])'
 
     medicine_proxies = dict(
-        drug = AutocompleteProxy(page.get_by_role("combobox").filter(has=page.locator(':scope[name*="drug"]'))),
-        daily_dosis = Proxy(elem.get_by_role("spinbutton", name="Daglig dosis i antal enheder")),
-        n_days_with_meds = DropDownProxy(elem.get_by_role("combobox", name="Antal dage med medicin"))
+        drug = sub(AutocompleteProxy)(
+            page.get_by_role("combobox").filter(has=page.locator(':scope[name*="drug"]')),
+            key="drug",
+            selector='input[name*="drug"]',
+            catalog=catalog
+        ),
+        daily_dosis = sub(Proxy)(
+            elem.get_by_role("spinbutton", name="Daglig dosis i antal enheder"),
+            selector='input[name*="dailyDose"]'
+        ),
+        n_days_with_meds = sub(DropDownProxy)(
+            elem.get_by_role("combobox", name="Antal dage med medicin"),
+            selector='select[name="days-with-medicine"]'
+        )
     )
 
     d = dict(
         dates = (DateSelectorProxy,
-            elem.locator("button[id='date']")
+            elem.locator("button[id='date']"),
+            dict(selector="button[id='date']")
         ),
         # Defer medicine proxy until last, to make sure doctor info is filled out before
         medicine = (MedicineProxy, elem, dict(sub_proxies=medicine_proxies, order=float('inf'))),
         doctor_first_name = (Proxy,
-            elem.get_by_role("textbox", name="Fornavn").filter(has=page.locator(dr_css))
+            elem.get_by_role("textbox", name="Fornavn").filter(has=page.locator(dr_css)),
+            dict(selector='input[name*="doctor"][name$="firstName"]')
         ),
         doctor_last_name = (Proxy,
-            elem.get_by_role("textbox", name="Efternavn").filter(has=page.locator(dr_css))
+            elem.get_by_role("textbox", name="Efternavn").filter(has=page.locator(dr_css)),
+            dict(selector='input[name*="doctor"][name$="lastName"]')
         ),
         doctor_address = (Proxy,
-            elem.locator('input[name*="address"]').filter(has=page.locator(dr_css))
+            elem.locator('input[name*="address"]').filter(has=page.locator(dr_css)),
+            dict(selector='input[name*="doctor"][name$="address"]')
         ),
         doctor_zipcode = (Proxy,
-            elem.get_by_role("textbox", name="Postnummer").filter(has=page.locator(dr_css))
+            elem.get_by_role("textbox", name="Postnummer").filter(has=page.locator(dr_css)),
+            dict(selector='input[name*="doctor"][name$="zipCode"]')
         ),
         doctor_city = (Proxy,
-            elem.get_by_role("textbox", name="By").filter(has=page.locator(dr_css))
+            elem.get_by_role("textbox", name="By").filter(has=page.locator(dr_css)),
+            dict(selector='input[name*="doctor"][name$="city"]')
         ),
         doctor_phone = (Proxy,
-            elem.get_by_role("textbox", name="telefon").filter(has=page.locator(dr_css))
+            elem.get_by_role("textbox", name="telefon").filter(has=page.locator(dr_css)),
+            dict(selector='input[name*="doctor"][name$="phoneNumber"]')
         ),
 
         user_first_name = (Proxy,
-            elem.get_by_role("textbox", name="Fornavn").filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="Fornavn").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="firstName"]')
         ),
         user_last_name = (Proxy,
-            elem.get_by_role("textbox", name="Efternavn").filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="Efternavn").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="lastName"]')
         ),
         user_address = (Proxy,
-            elem.locator("input[name*='address']").filter(has=page.locator(nodr_css))
+            elem.locator("input[name*='address']").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="address"]')
         ),
         user_zipcode = (Proxy,
-            elem.get_by_role("textbox", name="Postnummer").filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="Postnummer").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="zipCode"]')
         ),
         user_city = (Proxy,
-            elem.get_by_role("textbox", name="By", exact=True).filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="By", exact=True).filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="city"]')
         ),
         user_passport_number = (Proxy,
             elem.get_by_role("textbox", name="Pasnummer").filter(has=page.locator(nodr_css)),
-            dict(sensitive=True)
+            dict(sensitive=True, selector='input[name="passportNumber"]')
         ),
         user_birthdate = (Proxy,
-            elem.get_by_role("textbox", name="Indtast din fødselsdato (DD-").filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="Indtast din fødselsdato (DD-").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="birthDate"]')
         ),
         user_birth_city = (Proxy,
-            elem.get_by_role("textbox", name="Fødeby").filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="Fødeby").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="birthPlace"]')
         ),
         user_nationality = (Proxy,
-            elem.get_by_role("textbox", name="Nationalitet").filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="Nationalitet").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="nationality"]')
         ),
         user_email = (Proxy,
-            elem.get_by_role("textbox", name="E-mail").filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="E-mail").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="email"]')
         ),
         user_phone_number = (Proxy,
-            elem.get_by_role("textbox", name="Telefonnummer").filter(has=page.locator(nodr_css))
+            elem.get_by_role("textbox", name="Telefonnummer").filter(has=page.locator(nodr_css)),
+            dict(selector='input[name="phoneNumber"]')
         ),
         user_gender = (RadioButtonProxy,
-            elem.locator('label', has_text="Køn").locator("..").locator("..")
+            elem.locator('label', has_text="Køn").locator("..").locator(".."),
+            dict(selector='[name="gender"]')
         ),
         pharmacy_address = (AutocompleteProxy,
-            elem.locator("input[placeholder='Indtast apotekets navn']")
+            elem.locator("input[placeholder='Indtast apotekets navn']"),
+            dict(selector="input[placeholder='Indtast apotekets navn']", catalog=catalog)
         ),
     )
 
@@ -96,6 +142,6 @@ def proxy_factory(elem: Page|Locator) -> Generator[Tuple[str, Proxy], None, None
         if opt:
             assert len(opt) == 1
             kwargs.update(opt[0])
-        proxy = cls_(e, **kwargs)
+        proxy = sub(cls_)(e, **kwargs)
         yield key, proxy
     #
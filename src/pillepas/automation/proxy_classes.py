@@ -1,32 +1,55 @@
 from __future__ import annotations
 import datetime
+import functools
+import json
 import logging
 logger = logging.getLogger(__name__)
-from playwright.sync_api import Locator
+from playwright.sync_api import Locator, TimeoutError
 from typing import Any, Dict, final, Iterable, Tuple
 
-from pillepas.automation.utils import WaitForChange
+from pillepas import tracing
+from pillepas.automation.utils import _fill_js, WaitForMutation
+from pillepas.persistence.catalog import OptionCatalog
 
 
-class Proxy:
+class ProxyBase:
+    """The parts of a proxy which don't talk to the browser (selectors, javascript for bulk reads, parsing etc).
+    Proxy adds the methods which interact with the form using the sync Playwright API, and AsyncProxy (see the
+    async_proxy_classes module) adds coroutine versions of them. The subclasses are split the same way."""
+    
+    # Javascript function extracting the same value as _get from the matched element
+    read_js = "el => el.getAttribute('value')"
+    # Whether the value can be written directly with the native value setter (see FormGateway.fill_values)
+    bulk_fillable = True
+    
     def __init__(
-            self, element: Locator, sensitive=False, key: str=None, order: int|float=0):
+            self, element: Locator, sensitive=False, key: str=None, order: int|float=0, selector: str=None):
         """Proxy for a form element, to harmonize get/set logic. The ideas is to create
         subclasses of this for specific types of inputs (radio buttons, dropdowns, text, etc).
         element: Locator for the topmost element in the form.
         sensitive: Whether the field contains sensitive information (influences whether saved and logged)
         key: Optional key representing the key used for the proxy (useful for debugging etc)
-        order: Optional int for specifying an order, e.g. to fill elements with order 1 before order 2."""
+        order: Optional int for specifying an order, e.g. to fill elements with order 1 before order 2.
+        selector: Optional plain CSS selector (relative to the form) matching the same element as the locator.
+            Allows presence to be checked in bulk with a single javascript evaluation."""
         
         self.e = element
         self.sensitive = sensitive
         self.key = key
         self.order = order
+        self.selector = selector
+        # Which match of the selector the proxy represents (see copy_for_nth_match)
+        self.index = 0
         # Cache whether element is present, so we can log changes only
         self._present_when_last_checked: bool = None
     
-    def copy_for_nth_match(self, i: int) -> Proxy:
-        res = self.__class__(element=self.e.nth(i), sensitive=self.sensitive, key=self.key)
+    def _copy_kwargs(self) -> dict:
+        """Keyword arguments for creating a copy of the proxy"""
+        return dict(sensitive=self.sensitive, key=self.key, selector=self.selector)
+    
+    def copy_for_nth_match(self, i: int) -> ProxyBase:
+        res = self.__class__(element=self.e.nth(i), **self._copy_kwargs())
+        res.index = i
         return res
     
     def __repr__(self):
@@ -39,6 +62,44 @@ class Proxy:
     def __str__(self):
         return repr(self)
     
+    def read_expression(self) -> str|None:
+        """Javascript expression which evaluates to the proxy's raw value, given the form element as
+        the variable 'form'. Returns None if the value can only be read via the locator (get_value)."""
+        if self.selector is None:
+            return None
+        
+        match = f"form.querySelectorAll({json.dumps(self.selector)})[{self.index}]"
+        res = f"(el => el ? ({self.read_js})(el) : null)({match})"
+        return res
+    
+    def convert_read(self, raw: Any) -> Any:
+        """Converts the raw value obtained from read_expression into what get_value returns"""
+        return raw
+    
+    def _register_presence(self, present: bool) -> bool:
+        """Caches the presence state, logging any changes"""
+        if not (present is self._present_when_last_checked):
+            logger.debug(f"{repr(self)} detected as present: {present}.")
+            self._present_when_last_checked = present
+        return present
+    
+    def presence_selectors(self) -> list[str]|None:
+        """CSS selectors which must all match for the proxy to be present, or None if presence can only
+        be determined via the locator (is_present)."""
+        if self.selector is None:
+            return None
+        return [self.selector]
+    
+    def present_from_counts(self, counts: list[int]) -> bool:
+        """Determines presence from the number of matches for each of the presence selectors."""
+        present = all(n > self.index for n in counts)
+        return self._register_presence(present)
+    #
+
+
+class Proxy(ProxyBase):
+    """Proxy for a plain text field, which interacts with the form using the sync Playwright API"""
+    
     def type_(self, s: str):
         """Enters text by simulating keyboard input"""
         self.e.page.keyboard.type(s, delay=50)
@@ -54,49 +115,112 @@ class Proxy:
     @final
     def set_value(self, value: Any):
         logger.debug(f"{self} is setting value: {'*'*len(str(value)) if self.sensitive else value}")
-        self._set(value=value)
-        self.e.dispatch_event('change')
+        # Only the key goes into the span - never the value
+        name = self.__class__.__name__
+        with tracing.span(f"{name}._set", category="proxy", timed=name, key=self.key):
+            self._set(value=value)
+            self.e.dispatch_event('change')
+        #
         
     @final
     def get_value(self) -> Any:
         logger.debug(f"{self} is getting value.")
-        res = self._get()
+        name = self.__class__.__name__
+        with tracing.span(f"{name}._get", category="proxy", timed=name, key=self.key):
+            res = self._get()
         return res
     
     def is_present(self):
         present = self.e.count() > 0
-        if not (present is self._present_when_last_checked):
-            logger.debug(f"{repr(self)} detected as present: {present}.")
-            self._present_when_last_checked = present
-        return  present
+        return self._register_presence(present)
     #
 
 
-class AutocompleteProxy(Proxy):
+class AutocompleteProxyBase(ProxyBase):
+    bulk_fillable = False
+    # It seems a minimum of 3 characters must be entered for options to appear
+    min_chars = 3
+    
+    def __init__(self, element: Locator, catalog: OptionCatalog=None, **kwargs):
+        """catalog (OptionCatalog, optional) - catalog for recording seen options and looking up prefixes."""
+        self.catalog = catalog
+        super().__init__(element, **kwargs)
+    
+    def _copy_kwargs(self):
+        res = super()._copy_kwargs()
+        res["catalog"] = self.catalog
+        return res
+    
+    @property
+    def _top(self) -> Locator:
+        return self.e.locator("..").locator("..")
+    
+    @property
+    def _uses_catalog(self) -> bool:
+        return self.catalog is not None and self.key is not None
+    
+    def _lookup_prefix(self, value: str) -> str|None:
+        """The prefix to type for the value, if it's in the catalog"""
+        if not self._uses_catalog:
+            return None
+        return self.catalog.shortest_unique_prefix(self.key, value, min_length=self.min_chars)
+    #
+
+
+class AutocompleteProxy(AutocompleteProxyBase, Proxy):
     """Proxy for text field where value must be selected from a list of autocompletions, which
     updates as more text is typed.
-    Works by repeatedly entering more text, until the required value appears, then selecting it."""
+    If the options for the field are known from an option catalog, types the shortest prefix which singles out
+    the desired value. Otherwise, works by repeatedly entering more text, until the required value appears,
+    then selecting it."""
     
-    def _set(self, value: str):
-        self.e.click()
-        # Locator for the desired value in the options
-        top = self.e.locator("..").locator("..")
-        target = top.get_by_role("option", name=value, exact=True)
+    def _type_prefix(self, prefix: str, target: Locator) -> bool:
+        """Enters the prefix in one go, then waits for the target option to appear. Returns whether it did."""
         
+        self.e.fill(prefix)
+        try:
+            target.wait_for(state="visible", timeout=3000)
+            return True
+        except TimeoutError:
+            logger.debug(f"{self} didn't find option after typing prefix '{prefix}'.")
+            self.e.fill("")
+            return False
+        #
+    
+    def _type_incrementally(self, value: str, target: Locator):
+        """Enters the next character and watch for changes in the suggestions, until the target appears."""
+        
+        top = self._top
         for i, char in enumerate(value):
-            # It seems a minimum of 3 characters must be entered for options to appear
-            if i < 3:
+            if i < self.min_chars:
                 self.type_(char)
                 continue
             
             # Enter the next character and watch for changes in the suggestions
-            with WaitForChange(top.get_by_label("Suggestions")):
+            with WaitForMutation(top.get_by_label("Suggestions")):
                 self.type_(char)
             top.get_by_role("option").first.wait_for(state="visible", timeout=3000)
             
             # Stop typing if an option has the desired value
             if target.count() > 0:
                 break
+            #
+        #
+    
+    def _set(self, value: str):
+        self.e.click()
+        # Locator for the desired value in the options
+        top = self._top
+        target = top.get_by_role("option", name=value, exact=True)
+        
+        prefix = self._lookup_prefix(value)
+        found = prefix is not None and self._type_prefix(prefix, target)
+        if not found:
+            self._type_incrementally(value, target)
+        
+        # Remember the available options for next time
+        if self._uses_catalog:
+            self.catalog.add(self.key, top.get_by_role("option").all_inner_texts())
         
         if target.count() == 1:
             target.click()
@@ -106,8 +230,16 @@ class AutocompleteProxy(Proxy):
     #
 
 
-class DropDownProxy(Proxy):
+class DropDownProxyBase(ProxyBase):
+    bulk_fillable = False
+    # The selector matches the select element, so look up its sibling combobox
+    read_js = "el => el.parentElement.querySelector('[role=\"combobox\"]')?.innerText ?? null"
+    #
+
+
+class DropDownProxy(DropDownProxyBase, Proxy):
     """Proxy for text field where an option must be selected from a dropdown with suggestions."""
+    
     def _set(self, value: str):
         # Start by grabbing the select element bc it gets disabled  when we start typing, apparently
         select_elem = self.e.locator("..").locator("select").element_handle()
@@ -121,8 +253,16 @@ class DropDownProxy(Proxy):
         return res
 
 
-class RadioButtonProxy(Proxy):
+class RadioButtonProxyBase(ProxyBase):
+    bulk_fillable = False
+    read_js = """el => (el.closest('[role="radiogroup"]') ?? el.parentElement)
+        .querySelector('[role="radio"][aria-checked="true"]')?.getAttribute('value') ?? null"""
+    #
+
+
+class RadioButtonProxy(RadioButtonProxyBase, Proxy):
     """Proxy for form radio buttons (multiple select where only one can be selected). Used for e.g. gender."""
+    
     def _set(self, value):
         target_button = self.e.locator(f'button[value={value}]')
         target_button.click()
@@ -134,8 +274,44 @@ class RadioButtonProxy(Proxy):
     #
 
 
-class DateSelectorProxy(Proxy):
-    """Proxy for picking pairs of dates (start and end of travel) from a date picker."""
+# Clicks 'next month' in the date picker dialog until the target month (given as year*12 + month index) is shown.
+# The shown months are determined from their labels, e.g. 'april 2025'. Waits for a frame between clicks, so the
+# picker can re-render. Returns the number of clicks, or null if the dialog doesn't look as expected.
+_jump_to_month_js = """async (dialog, [target, months, maxClicks]) => {
+    const monthIndex = label => {
+        const m = label.trim().match(/^(\\S+) (\\d{4})$/);
+        const month = m ? months.indexOf(m[1]) : -1;
+        return month < 0 ? null : Number(m[2])*12 + month;
+    };
+    const shown = Array.from(dialog.querySelectorAll('[aria-label]'), el => monthIndex(el.getAttribute('aria-label')))
+        .filter(ind => ind !== null);
+    const nextButton = () => dialog.querySelector('[aria-label="Go to next month"]');
+    if (shown.length === 0 || nextButton() === null) {
+        return null;
+    }
+    
+    const nClicks = Math.min(Math.max(target - Math.max(...shown), 0), maxClicks);
+    for (let i = 0; i < nClicks; i++) {
+        nextButton().click();
+        await new Promise(resolve => requestAnimationFrame(resolve));
+    }
+    return nClicks;
+}"""
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_short_date(datestring: str, months: tuple[str, ...]) -> datetime.date:
+    """Parses dates represented with abreviated names like '25. apr. 2025' into a date instance."""
+    
+    date_s, month_s, year_s = datestring.replace(".", "").split()
+    # Take the first month which starts with the abreviation
+    month_ind = next(i for i, m in enumerate(months) if m.startswith(month_s))
+    res = datetime.date(int(year_s), month_ind+1, int(date_s))
+    return res
+
+
+class DateSelectorProxyBase(ProxyBase):
+    bulk_fillable = False
     
     # Define Danish month names explicitly so we don't have to rely on any locale stuff being installed
     months = (
@@ -143,11 +319,15 @@ class DateSelectorProxy(Proxy):
         'juli', 'august', 'september', 'oktober', 'november', 'december'
     )
     
+    read_js = "el => el.innerText"
+    # Max number of months to move forward in the picker - something's probably wrong if we need to go further
+    max_months_ahead = 12
+    
     def _month_label_from_date(self, date: datetime.date) -> str:
         """Creates a label like 'april 2025', for locating the correct pane from which to select a date"""
         ind = date.month - 1  # date.month's start at 1, so subtract 1 to get the index
         month_str = self.months[ind]
-        res = f"{month_str} {date.strftime("%Y")}"
+        res = f"{month_str} {date.strftime('%Y')}"
         return res
     
     @property
@@ -158,22 +338,56 @@ class DateSelectorProxy(Proxy):
         res = self.e.page.get_by_role('dialog').filter(has_text=target)
         return res
     
-    def scroll_to_date(self, date: datetime.date):
-        """Scrolls the dialog box forward until the specified month label (e.g. 'april 2025') appears,
-        then locates the input date, and clicks it."""
+    def _jump_args(self, date: datetime.date) -> list:
+        """Arguments for the javascript which moves the picker to the month of the date"""
+        res = [date.year*12 + date.month - 1, list(self.months), self.max_months_ahead]
+        return res
+    
+    def _parse_short_date(self, datestring: str) -> datetime.date:
+        """Parses dates represented with abreviated names like '25. apr. 2025' into a date instance."""
+        return _parse_short_date(datestring, self.months)
+    
+    def convert_read(self, raw: str|None):
+        # The element is missing
+        if raw is None:
+            return None
+        
+        parts = raw.strip().split(" - ")
+        res = tuple(self._parse_short_date(part) for part in parts)
 
-        dia = self.dialog
-        target = self._month_label_from_date(date)
-        _max = 12  # Something's probably wrong if we need to scroll this long
-        pane = dia.get_by_label(target)
+        return res
+    #
 
-        # Keep scrolling until the pana appears
-        for _ in range(_max):
+
+class DateSelectorProxy(DateSelectorProxyBase, Proxy):
+    """Proxy for picking pairs of dates (start and end of travel) from a date picker."""
+    
+    def _scroll_incrementally(self, pane: Locator):
+        """Clicks 'next month' one month at a time until the pane appears"""
+        
+        dia = self.dialog
+        for _ in range(self.max_months_ahead):
             if pane.count() > 0:
                 break
             dia.get_by_role("button", name="Go to next month").click()
+        #
+    
+    def scroll_to_date(self, date: datetime.date):
+        """Moves the dialog box forward to the specified month label (e.g. 'april 2025'),
+        then locates the input date, and clicks it.
+        The number of clicks needed is computed from the months currently shown, and the clicks are made in a single
+        evaluation. Falls back to clicking one month at a time if the shown months can't be determined."""
+
+        dia = self.dialog
+        target = self._month_label_from_date(date)
+        pane = dia.get_by_label(target)
+        
+        n_clicks = dia.evaluate(_jump_to_month_js, self._jump_args(date))
+        if n_clicks is None:
+            logger.debug(f"{self} couldn't determine the shown months. Scrolling one month at a time.")
+            self._scroll_incrementally(pane)
         
-        # Locate date and click it
+        # Locate date and click it. Clicking waits for the pane to appear
         date_cell = pane.get_by_role("gridcell", name=str(date.day), exact=True)
         date_cell.click()
     
@@ -185,29 +399,54 @@ class DateSelectorProxy(Proxy):
         
         self.dialog.get_by_role("button", name="Gem datoer").click()
     
-    def _parse_short_date(self, datestring: str) -> datetime.date:
-        """Parses dates represented with abreviated names like '25. apr. 2025' into a date instance."""
-        
-        date_s, month_s, year_s = datestring.replace(".", "").split()
-        # Take the first month which starts with the abreviation
-        month_ind = next(i for i, m in enumerate(self.months) if m.startswith(month_s))
-        res = datetime.date(int(year_s), month_ind+1, int(date_s))
-        return res
-    
     def _get(self):
         """The dates are represented with abreviated names like '25. apr. 2025', so we need to parse that back into
         a date."""
         s = self.e.inner_text()
-        
-        parts = s.strip().split(" - ")
-        res = tuple(self._parse_short_date(part) for part in parts)
-
+        res = self.convert_read(s)
         return res
     #
 
 
-class MedicineProxy(Proxy):
-    def __init__(self, element, sub_proxies: Dict[str, Proxy], **kwargs):
+# Clicks the button with the given text a number of times, waiting a frame between clicks so the form can re-render
+_click_repeatedly_js = """async (form, [buttonText, n]) => {
+    const findButton = () => Array.from(form.querySelectorAll('button')).find(
+        el => el.textContent.trim() === buttonText
+    );
+    for (let i = 0; i < n; i++) {
+        findButton()?.click();
+        await new Promise(resolve => requestAnimationFrame(resolve));
+    }
+}"""
+
+# Clicks the 'yes' button in each section asking whether to reuse the doctor information. Returns the number of clicks.
+_reuse_doctor_js = """(form, [headingText, buttonText]) => {
+    let res = 0;
+    for (const heading of form.querySelectorAll('h1, h2, h3, h4')) {
+        if (heading.textContent.trim() !== headingText) {
+            continue;
+        }
+        const button = Array.from(heading.parentElement.querySelectorAll('button')).find(
+            el => el.textContent.trim() === buttonText
+        );
+        if (button) {
+            button.click();
+            res++;
+        }
+    }
+    return res;
+}"""
+
+
+class MedicineProxyBase(ProxyBase):
+    bulk_fillable = False
+    # Whether to enter multiple medications in bulk (see _set_medications_bulk)
+    bulk = True
+    
+    add_button_text = "Tilføj mere medicin"
+    doctor_heading = "Information om lægen"
+    
+    def __init__(self, element, sub_proxies: Dict[str, ProxyBase], **kwargs):
         self._sub_proxies = sub_proxies
         self.sub_proxies = []
         self._add_sub_proxies()
@@ -218,6 +457,52 @@ class MedicineProxy(Proxy):
         new_subs = {k: p.copy_for_nth_match(i) for k, p in self._sub_proxies.items()}
         self.sub_proxies.append(new_subs)
     
+    def presence_selectors(self):
+        res = [p.selector for p in self._sub_proxies.values()]
+        if any(sel is None for sel in res):
+            return None
+        return res
+    
+    def present_from_counts(self, counts):
+        # Every added medication must have a match for each of the sub proxies
+        present = all(n >= len(self.sub_proxies) for n in counts)
+        return self._register_presence(present)
+    
+    def read_expression(self):
+        rows = []
+        for d in self.sub_proxies:
+            exprs = {k: p.read_expression() for k, p in d.items()}
+            if any(expr is None for expr in exprs.values()):
+                return None
+            rows.append("{" + ", ".join(f"{json.dumps(k)}: {expr}" for k, expr in exprs.items()) + "}")
+        
+        res = "[" + ", ".join(rows) + "]"
+        return res
+    
+    def convert_read(self, raw):
+        res = [{k: p.convert_read(row[k]) for k, p in d.items()} for d, row in zip(self.sub_proxies, raw)]
+        return res
+    
+    def _check_keys(self, d: Dict[str, str]):
+        if set(d.keys()) != set(self._sub_proxies.keys()):
+            raise RuntimeError(f"Keys mismatch medicine ({d.keys()}) vs proxies ({self._sub_proxies.keys()})")
+        #
+    
+    def _bulk_entries(self, value: list[Dict[str, str]]) -> list[list]:
+        """Arguments for the bulk fill script, for the sub-fields of all rows which support bulk filling"""
+        
+        res = []
+        for i, (proxies, d) in enumerate(zip(self.sub_proxies, value)):
+            for key, proxy in proxies.items():
+                if proxy.bulk_fillable and proxy.selector is not None:
+                    res.append([f"{i}.{key}", proxy.selector, proxy.index, str(d[key])])
+                #
+            #
+        return res
+    #
+
+
+class MedicineProxy(MedicineProxyBase, Proxy):
     def is_present(self):
         for proxies in self.sub_proxies:
             for proxy in proxies.values():
@@ -242,7 +527,7 @@ class MedicineProxy(Proxy):
         page = self.e.page
         
         # Click 'yes' to reuse existing doctor information
-        heading = page.get_by_role("heading", name="Information om lægen").nth(-1)
+        heading = page.get_by_role("heading", name=self.doctor_heading).nth(-1)
         info_section = heading.locator("..")
         info_section.get_by_role("button", name="Ja").click()
         
@@ -252,12 +537,64 @@ class MedicineProxy(Proxy):
         page.keyboard.press("Enter")
     
     def set_value(self, value: Iterable[Dict[str, str]]):
+        name = self.__class__.__name__
+        with tracing.span(f"{name}._set", category="proxy", timed=name, key=self.key):
+            value = list(value)
+            if self.bulk and len(value) > 1:
+                self._set_medications_bulk(value)
+            else:
+                self._set_medications(value)
+            #
+        #
+    
+    def _reuse_doctor_info_bulk(self, n_rows: int):
+        """Reuses the existing doctor information for the medications after the first.
+        The 'yes' buttons are clicked in a single evaluation, then the doctor is selected in each dropdown."""
+        
+        page = self.e.page
+        self.e.evaluate(_reuse_doctor_js, [self.doctor_heading, "Ja"])
+        
+        headings = page.get_by_role("heading", name=self.doctor_heading)
+        for i in range(1, n_rows):
+            dropdown = headings.nth(i).locator("..").get_by_role("combobox").filter(has_text="Vælg en læge")
+            dropdown.click()
+            page.keyboard.press("Enter")
+        #
+    
+    def _set_medications_bulk(self, value: list[Dict[str, str]]):
+        """Enters multiple medications with a roughly constant number of round trips per extra medication.
+        All rows are added up front, the plain sub-fields of all rows are filled in a single evaluation, and
+        only the fields which require interaction (autocomplete, dropdowns) are set one at a time."""
+        
+        for d in value:
+            self._check_keys(d)
+        
+        # Add all the rows at once, and wait for the last one to appear
+        n_new = len(value) - len(self.sub_proxies)
+        if n_new > 0:
+            self.e.evaluate(_click_repeatedly_js, [self.add_button_text, n_new])
+        while len(self.sub_proxies) < len(value):
+            self._add_sub_proxies()
+        next(iter(self.sub_proxies[-1].values())).e.wait_for(state="attached")
+        
+        entries = self._bulk_entries(value)
+        filled = self.e.evaluate(_fill_js, entries) if entries else dict()
+        
+        for i, (proxies, d) in enumerate(zip(self.sub_proxies, value)):
+            for key, proxy in proxies.items():
+                if not filled.get(f"{i}.{key}"):
+                    proxy.set_value(d[key])
+                #
+            #
+        
+        self._reuse_doctor_info_bulk(len(value))
+    
+    def _set_medications(self, value: list[Dict[str, str]]):
         # Go over all subproxies and use them to set data
         
         for i, d in enumerate(value):
             proxies = self.sub_proxies[i]
-            if set(d.keys()) != set(proxies.keys()):
-                raise RuntimeError(f"Keys mismatch medicine ({d.keys()}) vs proxies ({self.sub_proxies.keys()})")
+            self._check_keys(d)
         
             for key, proxy in proxies.items():
                 val = d[key]
@@ -269,7 +606,7 @@ class MedicineProxy(Proxy):
             if not first:
                 self._reuse_doctor_info()
             if not last:
-                self.e.page.get_by_role("button", name="Tilføj mere medicin").click()
+                self.e.page.get_by_role("button", name=self.add_button_text).click()
                 self._add_sub_proxies()
         #
     #
@@ -0,0 +1,143 @@
+"""Accounting of Playwright round trips, i.e. calls which have to wait for the browser.
+Most of the automation's latency comes from these, rather than from work done in Python. Wrapping the page used by
+a Session in an instrumented proxy counts every such call by method, and attributes it to the form page (signature)
+and the field being processed, along with the time spent. The field is the 'key' attribute of the innermost open
+span (see the tracing module), so the counter must be active as a span recorder.
+Calls which only build locators (e.g. 'locator', 'get_by_role', 'nth') don't talk to the browser, so aren't counted,
+but the objects they return are wrapped as well.
+
+Example:
+
+counter = RoundTripCounter()
+page = counter.wrap(page)
+with tracing.recording(counter), tracing.span("fill", key="user_first_name"):
+    page.locator("input").fill("Namey")
+print(counter.format_summary())
+"""
+
+from collections import defaultdict
+import time
+
+from playwright.sync_api import Frame, FrameLocator, Keyboard, Locator, Mouse, Page
+
+from pillepas import tracing
+
+
+# Playwright objects which are wrapped, so calls on them are counted as well
+_WRAPPED_TYPES = (Frame, FrameLocator, Keyboard, Locator, Mouse, Page)
+
+# Methods which don't involve the browser (event handler registration etc.)
+_LOCAL_METHODS = frozenset({"on", "once", "remove_listener", "is_closed"})
+
+class RoundTripCounter:
+    """Keeps count of round trips, and the time spent on them, by page, key and method"""
+    
+    def __init__(self):
+        # Maps (page, key, method) to [number of calls, total seconds]
+        self.records: dict[tuple[str, str, str], list] = defaultdict(lambda: [0, 0.0])
+        self.page: str | None = None
+    
+    def add(self, method: str, seconds: float):
+        rec = self.records[(self.page, tracing.current_attr("key"), method)]
+        rec[0] += 1
+        rec[1] += seconds
+    
+    def record_span(self, span: tracing.Span, end: float):
+        """Round trips are counted as they happen, so finished spans are ignored"""
+        pass
+    
+    def wrap(self, obj):
+        """Wraps a Playwright object, so calls on it (and objects derived from it) are counted"""
+        return _Instrumented(obj, self)
+    
+    def _group(self, ind: int) -> dict[str, dict[str, float]]:
+        res = dict()
+        for tup, (n, seconds) in self.records.items():
+            name = "-" if tup[ind] is None else str(tup[ind])
+            d = res.setdefault(name, dict(calls=0, seconds=0.0))
+            d["calls"] += n
+            d["seconds"] += seconds
+        
+        return res
+    
+    def by_page(self) -> dict[str, dict[str, float]]:
+        return self._group(0)
+    
+    def by_key(self) -> dict[str, dict[str, float]]:
+        return self._group(1)
+    
+    def by_method(self) -> dict[str, dict[str, float]]:
+        return self._group(2)
+    
+    @property
+    def n_calls(self) -> int:
+        return sum(n for n, _ in self.records.values())
+    
+    def summary(self) -> dict:
+        res = dict(
+            n_calls=self.n_calls,
+            seconds=sum(seconds for _, seconds in self.records.values()),
+            by_page=self.by_page(),
+            by_key=self.by_key(),
+            by_method=self.by_method(),
+        )
+        
+        return res
+    
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f"{summary['n_calls']} Playwright round trips ({summary['seconds']:.2f}s)"]
+        for heading in ("by_page", "by_method", "by_key"):
+            lines.append(f"  {heading.replace('_', ' ')}:")
+            groups = sorted(summary[heading].items(), key=lambda t: -t[1]["seconds"])
+            for name, d in groups:
+                lines.append(f"    {name:<40}{d['calls']:6d}{d['seconds']:9.3f}s")
+            #
+        
+        return "\n".join(lines)
+    #
+
+
+def _unwrap(x):
+    return x._target if isinstance(x, _Instrumented) else x
+
+
+class _Instrumented:
+    """Stands in for a Playwright object, counting calls which go to the browser"""
+    
+    __slots__ = ("_target", "_counter")
+    
+    def __init__(self, target, counter: RoundTripCounter):
+        self._target = target
+        self._counter = counter
+    
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        # Properties such as 'page', 'first' and 'keyboard' give objects which should be instrumented as well
+        if isinstance(attr, _WRAPPED_TYPES):
+            return _Instrumented(attr, self._counter)
+        if not callable(attr):
+            return attr
+        
+        def method(*args, **kwargs):
+            args = [_unwrap(arg) for arg in args]
+            kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+            
+            now = time.perf_counter()
+            res = attr(*args, **kwargs)
+            if isinstance(res, _WRAPPED_TYPES):
+                return _Instrumented(res, self._counter)
+            
+            if name not in _LOCAL_METHODS:
+                self._counter.add(name, time.perf_counter() - now)
+            return res
+        
+        return method
+    
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._target!r})"
+    #
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,164 @@
+"""A local stand-in for the pillepas order form, for running the automation offline, e.g. in tests and benchmarks.
+Serves a replica of the form with the same roles, labels and field names as the real one, along with the
+endpoints it uses for autocomplete suggestions, navigation and submission. Server-side delays are configurable,
+to emulate network latency.
+
+Example:
+
+with StandinServer(suggest_delay=0.2) as server:
+    sess = Session(fill_data, url=server.url)
+    ...
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+logger = logging.getLogger(__name__)
+import pathlib
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+_here = pathlib.Path(__file__).parent.resolve()
+FORM_PATH = _here.parent / "data" / "standin_form.html"
+
+
+DRUGS = (
+    "Elvanse, kapsler, hårde, 20 mg 'Takeda Pharma'",
+    "Elvanse, kapsler, hårde, 30 mg 'Takeda Pharma'",
+    "Elvanse, kapsler, hårde, 40 mg 'Takeda Pharma'",
+    "Elvanse, kapsler, hårde, 50 mg 'Takeda Pharma'",
+    "Elvanse, kapsler, hårde, 70 mg 'Takeda Pharma'",
+    "Elvanse Voksen, kapsler, hårde, 30 mg 'Takeda Pharma'",
+    "Concerta, depottabletter, 18 mg 'Janssen-Cilag'",
+    "Concerta, depottabletter, 36 mg 'Janssen-Cilag'",
+    "Medikinet CR, kapsler med modificeret udløsning, 10 mg 'Medice'",
+    "Ritalin, tabletter, 10 mg 'Novartis'",
+    "Ritalin Uno, kapsler med modificeret udløsning, 20 mg 'Novartis'",
+    "Oxynorm, kapsler, hårde, 5 mg 'Mundipharma'",
+)
+
+PHARMACIES = (
+    "København Hamlets Apotek, København N, 2200",
+    "København Steno Apotek, København V, 1560",
+    "København Sønderbro Apotek, København S, 2300",
+    "Frederiksberg Apotek, Frederiksberg, 2000",
+    "Hillerød Slotsapoteket, Hillerød, 3400",
+    "Aarhus Løve Apotek, Aarhus C, 8000",
+    "Odense Svane Apotek, Odense C, 5000",
+)
+
+SOURCES = dict(drug=DRUGS, pharmacy=PHARMACIES)
+
+
+def suggest(source: str, query: str, limit: int=10) -> list[str]:
+    """Options from the source containing the query, ignoring case"""
+    q = query.casefold()
+    res = [opt for opt in SOURCES.get(source, ()) if q in opt.casefold()]
+    return res[:limit]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StandinServer"
+    
+    def _send(self, body: bytes, content_type: str, status: int=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_json(self, obj):
+        self._send(json.dumps(obj).encode("utf-8"), "application/json")
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/suggest":
+            params = parse_qs(url.query)
+            time.sleep(self.server.suggest_delay)
+            self._send_json(suggest(params.get("source", [""])[0], params.get("q", [""])[0]))
+        elif url.path == "/api/next":
+            time.sleep(self.server.navigation_delay)
+            self._send_json(dict())
+        elif url.path in ("/", "/index.html"):
+            time.sleep(self.server.page_delay)
+            self._send(self.server.form_html, "text/html; charset=utf-8")
+        else:
+            self._send(b"Not found", "text/plain", status=404)
+        #
+    
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/api/submit":
+            self._send(b"Not found", "text/plain", status=404)
+            return
+        
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.submissions.append(data)
+        self._send_json(dict(ok=True))
+    
+    def log_message(self, format, *args):
+        logger.debug(f"Stand-in server: {format % args}")
+    #
+
+
+class StandinServer(ThreadingHTTPServer):
+    """HTTP server for the stand-in form, running in a background thread."""
+    
+    daemon_threads = True
+    
+    def __init__(
+            self,
+            port: int=0,
+            suggest_delay: float=0.1,
+            navigation_delay: float=0.05,
+            page_delay: float=0.0
+        ):
+        """port (int, default 0) - port to listen on. 0 picks a free port.
+        suggest_delay (float, default 0.1) - seconds to wait before responding with autocomplete suggestions
+        navigation_delay (float, default 0.05) - seconds to wait before responding when moving to the next page
+        page_delay (float, default 0) - seconds to wait before serving the form page itself"""
+        
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.suggest_delay = suggest_delay
+        self.navigation_delay = navigation_delay
+        self.page_delay = page_delay
+        self.form_html = FORM_PATH.read_bytes()
+        
+        self.submissions: list[dict] = []
+        self.lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Stand-in form served at {self.url}")
+    
+    def stop(self):
+        # shutdown waits for serve_forever to finish, so would block forever if it isn't running
+        if self._thread is not None and self._thread.is_alive():
+            self.shutdown()
+            self._thread.join()
+        self.server_close()
+        self._thread = None
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+    #
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    with StandinServer(port=8765) as server:
+        input(f"Serving stand-in form at {server.url} - press enter to stop.")
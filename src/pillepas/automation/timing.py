@@ -0,0 +1,67 @@
+"""Lightweight timing of the automation's phases, used for benchmarking.
+Timings are collected from the tracing module's spans: a Timings instance is a span recorder, which records the
+duration of each span with a 'timed' name, grouped by the span's category. Nothing is recorded unless a recorder is
+active, so the overhead is negligible during regular runs.
+Spans nested in a timed span of the same category (e.g. the sub-proxies of MedicineProxy, within the medicine proxy)
+are recorded in a separate '<category> (nested)' category, so each category's totals don't count any time twice.
+
+Example:
+
+timings = Timings()
+with recording(timings):
+    session.fill(...)
+print(timings.totals())
+"""
+
+from collections import defaultdict
+
+from pillepas import tracing
+
+NESTED_SUFFIX = " (nested)"
+
+
+class Timings:
+    """Collects durations (in seconds) grouped by category (e.g. 'phase') and name (e.g. 'fill')"""
+    
+    def __init__(self):
+        self.records: dict[str, dict[str, list[float]]] = defaultdict(lambda: defaultdict(list))
+    
+    def add(self, category: str, name: str, seconds: float):
+        self.records[category][name].append(seconds)
+    
+    def record_span(self, span: tracing.Span, end: float):
+        if span.timed is None:
+            return
+        
+        nested = any(s.timed is not None and s.category == span.category for s in span.ancestors())
+        category = span.category + NESTED_SUFFIX if nested else span.category
+        self.add(category, span.timed, end - span.start)
+    
+    def totals(self) -> dict[str, dict[str, float]]:
+        """The total time spent for each name in each category"""
+        res = {cat: {name: sum(vals) for name, vals in d.items()} for cat, d in self.records.items()}
+        return res
+    
+    def counts(self) -> dict[str, dict[str, int]]:
+        res = {cat: {name: len(vals) for name, vals in d.items()} for cat, d in self.records.items()}
+        return res
+    #
+
+
+def recording(timings: Timings):
+    """Makes the timings instance active within the block"""
+    return tracing.recording(timings)
+
+
+def record(category: str, name: str, seconds: float):
+    """Records a duration which was measured manually, if recording"""
+    
+    for recorder in tracing.recorders():
+        if isinstance(recorder, Timings):
+            recorder.add(category, name, seconds)
+        #
+    #
+
+
+if __name__ == '__main__':
+    pass
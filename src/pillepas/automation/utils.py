@@ -1,5 +1,11 @@
+from contextlib import ExitStack
 import datetime
-from playwright.sync_api import Locator, Page, TimeoutError
+import time
+from playwright.async_api import Locator as AsyncLocator, Page as AsyncPage
+from playwright.sync_api import Error, Locator, Page, TimeoutError
+from playwright._impl._errors import TargetClosedError
+
+from pillepas import tracing
 
 
 class WaitForChange:
@@ -27,62 +33,386 @@ class WaitForChange:
         self.innerHTML = None
     
     def __enter__(self):
-        self.innerHTML = self.locator.inner_html()
+        with ExitStack() as stack:
+            stack.enter_context(tracing.span("WaitForChange", category="automation"))
+            self.innerHTML = self.locator.inner_html()
+            # Keep the span open until exiting
+            self._stack = stack.pop_all()
+        #
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        try:
-            self.page.wait_for_function(
-                expression = "(oldHTML) => document.querySelector('form')?.innerHTML !== oldHTML",
-                arg = self.innerHTML,
-                timeout=3000
-            )
-        except TimeoutError:
-            pass
+        with self._stack:
+            try:
+                self.page.wait_for_function(
+                    expression = "(oldHTML) => document.querySelector('form')?.innerHTML !== oldHTML",
+                    arg = self.innerHTML,
+                    timeout=3000
+                )
+            except TimeoutError:
+                pass
+            
+            self.page.wait_for_load_state("domcontentloaded")
+            self.innerHTML = None
+        #
+    #
+
+
+# Sets input values using the native value setter, so frameworks like React pick up the change via the events.
+# Reports for each key whether the value stuck.
+_fill_js = """(form, entries) => {
+    const res = {};
+    for (const [key, selector, index, value] of entries) {
+        const el = form.querySelectorAll(selector)[index];
+        if (!el) {
+            res[key] = false;
+            continue;
+        }
+        const proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+        const setter = Object.getOwnPropertyDescriptor(proto, 'value').set;
+        el.focus();
+        setter.call(el, value);
+        el.dispatchEvent(new Event('input', {bubbles: true}));
+        el.dispatchEvent(new Event('change', {bubbles: true}));
+        el.blur();
+        res[key] = el.value === value;
+    }
+    return res;
+}"""
+
+# Properties of the observed element holding the state of its mutation counters
+_MUTATIONS = "__pillepasMutations"
+_STRUCTURE = "__pillepasStructure"
+
+# Observer options for the counters. The structure counter only counts elements being added or removed, so e.g.
+# typing in a field doesn't count
+_MUTATION_OPTIONS = dict(subtree=True, childList=True, attributes=True, characterData=True)
+_STRUCTURE_OPTIONS = dict(subtree=True, childList=True)
+
+# Installs a MutationObserver (once per element) on the first element matched by a locator, which counts mutations
+# of the element and its descendants, and records when the last one happened. Returns the current count, or null if
+# nothing matched. Used with Locator.evaluate_all, which takes a single round trip and doesn't wait for the element.
+_install_mutation_counter_js = """(els, [prop, options]) => {
+    const el = els[0];
+    if (!el) {
+        return null;
+    }
+    if (!el[prop]) {
+        const state = {count: 0, last: performance.now()};
+        new MutationObserver(records => {
+            state.count += records.length;
+            state.last = performance.now();
+        }).observe(el, options);
+        el[prop] = state;
+    }
+    return el[prop].count;
+}"""
+
+# Resolves with 'settled' once mutations have happened since the start count, and the element has then been quiet
+# for quietMs. If that doesn't happen within timeoutMs, resolves with 'moved' if there were mutations (but the element
+# kept changing), or 'unchanged' if not. An element without a counter, or one which has been removed from the
+# document, means the content was replaced, which is a change in itself.
+_wait_settled_js = """(els, [prop, start, quietMs, timeoutMs]) => new Promise(resolve => {
+    const el = els[0];
+    const deadline = performance.now() + timeoutMs;
+    const check = () => {
+        const state = el?.[prop];
+        if (!state || !el.isConnected) {
+            return resolve('settled');
+        }
+        const now = performance.now();
+        if (state.count > start && now - state.last >= quietMs) {
+            return resolve('settled');
+        }
+        if (now >= deadline) {
+            return resolve(state.count > start ? 'moved' : 'unchanged');
+        }
+        setTimeout(check, Math.min(quietMs, 50));
+    };
+    check();
+})"""
+
+
+class WaitForMutationBase:
+    """Waits for an element to change, without serializing any HTML.
+    Instead, a MutationObserver on the watched element keeps a counter of changes to it. On entering, the current
+    count is read, and on exiting, we wait until the count has increased and no mutations have happened for a short
+    quiet period, meaning the element has settled. If the element is replaced or removed, that counts as a change.
+    This class holds the state. WaitForMutation and AsyncWaitForMutation add the context manager protocols for the
+    sync and async Playwright APIs."""
+    
+    def __init__(self, locator: Locator|AsyncLocator, quiet_ms: int=100, timeout: int=3000):
+        """locator (Locator) - the element to watch (the first match, if several). Only mutations of the element
+            and its descendants count.
+        quiet_ms (int, default 100) - number of milliseconds without mutations before the DOM is considered settled.
+        timeout (int, default 3000) - max number of milliseconds to wait for a change."""
         
-        self.page.wait_for_load_state("domcontentloaded")
-        self.innerHTML = None
+        self.locator = locator
+        self.page = self.locator.page
+        self.quiet_ms = quiet_ms
+        self.timeout = timeout
+        self.count = None
+    
+    def _settled_args(self) -> list:
+        return [_MUTATIONS, self.count or 0, self.quiet_ms, self.timeout]
     #
 
 
-def add_wait(page: Page, button_text: str, user_clicked_next_varname: str, python_done_reading_varname: str):
-    """Injects an event listener which delays an event until 'variable_name' has incremented.
-    This is useful for delaying navigating away from a form page until any newly entered
-    information has been read by python.
-    The python method which reads the data must then increment the variable and be run
-    repeatedly until the next button is clicked.
-    The generated javascript checks if the callback has already been attached,
-    so calling it multiple times should cause issues."""
+class WaitForMutation(WaitForMutationBase):
+    """Drop-in replacement for WaitForChange which avoids serializing any HTML (see WaitForMutationBase).
     
-    js = f"""
-        const button = Array.from(document.querySelectorAll('button')).find(
-            el => el.textContent.trim() === '{button_text}'
-        );
+    Example:
+    
+    with WaitForMutation(my_form):
+        my_form.get_by_role("button", name="Next").click()
+    """
+    
+    def __enter__(self):
+        with ExitStack() as stack:
+            stack.enter_context(tracing.span("WaitForMutation", category="automation"))
+            self.count = self.locator.evaluate_all(_install_mutation_counter_js, [_MUTATIONS, _MUTATION_OPTIONS])
+            # Keep the span open until exiting
+            self._stack = stack.pop_all()
+        #
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._stack:
+            try:
+                self.locator.evaluate_all(_wait_settled_js, self._settled_args())
+            except TargetClosedError:
+                raise
+            except Error:
+                # The document was replaced while waiting, so it changed
+                pass
+            
+            self.page.wait_for_load_state("domcontentloaded")
+            self.count = None
+        #
+    #
+
+
+class FormTransitionWatcherBase:
+    """Waits for the form's structure to change, e.g. when the user moves to another page of the form, without
+    polling from Python. Elements being added to or removed from the form are counted by a MutationObserver on the
+    form element, so changes elsewhere on the page (e.g. a ticking clock or a carousel) are ignored, and the browser
+    itself checks for changes. Navigation events, and the form being replaced, are picked up as well.
+    Once the structure has changed, the wait ends when it settles, or after at most check_interval even if the form
+    keeps changing.
+    This class holds the state. FormTransitionWatcher and AsyncFormTransitionWatcher add the mark and wait methods
+    for the sync and async Playwright APIs.
+    
+    Example:
+    
+    watcher = FormTransitionWatcher(page.locator("form"))
+    watcher.mark()
+    ...  # Check whether the current page needs anything
+    watcher.wait()  # Blocks until the page changes after the call to mark
+    
+    For unattended runs, pass a timeout to wait, which then returns False if the form didn't change in time.
+    """
+    
+    def __init__(self, form: Locator|AsyncLocator, quiet_ms: int=100, check_interval: int=1000):
+        """form (Locator) - the form element to watch.
+        quiet_ms (int, default 100) - number of milliseconds without changes before the form is considered settled.
+        check_interval (int, default 1000) - max number of milliseconds between checks for navigation events
+            while waiting."""
         
-        {user_clicked_next_varname} = false;
-        {python_done_reading_varname} = false;
+        self.form = form
+        self.page = form.page
+        self.quiet_ms = quiet_ms
+        self.check_interval = check_interval
+        self._count = None
+        self._navigated = False
+        self.page.on("framenavigated", self._on_framenavigated)
+    
+    def _on_framenavigated(self, frame):
+        # Only navigation of the main frame (the one without a parent) is of interest
+        if frame.parent_frame is None:
+            self._navigated = True
+        #
+    
+    def _mark_args(self) -> list:
+        self._navigated = False
+        return [_STRUCTURE, _STRUCTURE_OPTIONS]
+    
+    @staticmethod
+    def _deadline(timeout: int|None) -> float|None:
+        return None if timeout is None else time.monotonic() + timeout/1000
+    
+    def _wait_args(self, deadline: float|None) -> list|None:
+        """Arguments for the next check while waiting, or None if the deadline has passed"""
         
+        interval = self.check_interval
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            interval = max(1, min(interval, int(remaining*1000)))
+        
+        return [_STRUCTURE, self._count or 0, self.quiet_ms, interval]
+    #
+
 
-        if (button) {{
-            const originalClick = button.click.bind(button);
+class FormTransitionWatcher(FormTransitionWatcherBase):
+    def mark(self):
+        """Marks the current state of the form, which wait compares against"""
+        self._count = self.form.evaluate_all(_install_mutation_counter_js, self._mark_args())
+    
+    def wait(self, timeout: int=None) -> bool:
+        """Blocks until the form's structure has changed since the last call to mark (and settled, or kept changing
+        for check_interval), or the page navigated.
+        timeout (int, optional) - max number of milliseconds to wait. Waits indefinitely if not provided.
+        Returns whether the form changed, i.e. False if the timeout was reached."""
+        
+        if self._count is None:
+            self.mark()
+        
+        deadline = self._deadline(timeout)
+        res = True
+        with tracing.span("FormTransitionWatcher.wait", category="automation"):
+            while not self._navigated:
+                args = self._wait_args(deadline)
+                if args is None:
+                    res = False
+                    break
+                
+                try:
+                    status = self.form.evaluate_all(_wait_settled_js, args)
+                except TargetClosedError:
+                    raise
+                except Error:
+                    # The document was replaced while waiting, so it changed
+                    break
+                
+                if status != "unchanged":
+                    break
+                #
+            #
+        
+        self._count = None
+        return res
+    #
+
+
+class AsyncFormTransitionWatcher(FormTransitionWatcherBase):
+    """Async counterpart of FormTransitionWatcher"""
+    
+    async def mark(self):
+        self._count = await self.form.evaluate_all(_install_mutation_counter_js, self._mark_args())
+    
+    async def wait(self, timeout: int=None) -> bool:
+        if self._count is None:
+            await self.mark()
+        
+        deadline = self._deadline(timeout)
+        res = True
+        with tracing.span("AsyncFormTransitionWatcher.wait", category="automation"):
+            while not self._navigated:
+                args = self._wait_args(deadline)
+                if args is None:
+                    res = False
+                    break
+                
+                try:
+                    status = await self.form.evaluate_all(_wait_settled_js, args)
+                except TargetClosedError:
+                    raise
+                except Error:
+                    break
+                
+                if status != "unchanged":
+                    break
+                #
+            #
+        
+        self._count = None
+        return res
+    #
+
+
+class AsyncWaitForMutation(WaitForMutationBase):
+    """Async counterpart of WaitForMutation, for use with the Playwright async API.
+    
+    Example:
+    
+    async with AsyncWaitForMutation(my_form):
+        await my_form.get_by_role("button", name="Next").click()
+    """
+    
+    async def __aenter__(self):
+        with ExitStack() as stack:
+            stack.enter_context(tracing.span("AsyncWaitForMutation", category="automation"))
+            self.count = await self.locator.evaluate_all(_install_mutation_counter_js, [_MUTATIONS, _MUTATION_OPTIONS])
+            # Keep the span open until exiting
+            self._stack = stack.pop_all()
+        #
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        with self._stack:
+            try:
+                await self.locator.evaluate_all(_wait_settled_js, self._settled_args())
+            except TargetClosedError:
+                raise
+            except Error:
+                pass
             
-            let interval = setInterval(function() {{
-                if ({python_done_reading_varname} === true) {{
-                    clearInterval(interval);  // Stop polling
-                    {user_clicked_next_varname} = false;
-                    {python_done_reading_varname} = false;
-                    
-                    originalClick();
-                }}
-            }}, 100);  // Check every 100ms
+            await self.page.wait_for_load_state("domcontentloaded")
+            self.count = None
+        #
+    #
 
+
+def _add_wait_js(user_clicked_next_varname: str, python_done_reading_varname: str) -> str:
+    """Javascript for add_wait. Takes the button text as argument."""
+    
+    js = f"""(buttonText) => {{
+        const button = Array.from(document.querySelectorAll('button')).find(
+            el => el.textContent.trim() === buttonText
+        );
+        
+        {python_done_reading_varname} = null;
+        {user_clicked_next_varname} = null;
+        if (!button) {{
+            return;
+        }}
+        
+        {user_clicked_next_varname} = new Promise(resolveClicked => {{
             button.addEventListener('click', function(event) {{
                 event.preventDefault();
-                {user_clicked_next_varname} = true;
-            }}, {{ once: true }});
-        }}
-    """
+                event.stopImmediatePropagation();
+                
+                // Click the button again (without this listener) once python is done reading
+                new Promise(resolveReading => {{
+                    {python_done_reading_varname} = resolveReading;
+                }}).then(() => button.click());
+                
+                resolveClicked(true);
+            }}, {{ once: true, capture: true }});
+        }});
+    }}"""
+    
+    return js
+
+
+def add_wait(page: Page, button_text: str, user_clicked_next_varname: str, python_done_reading_varname: str):
+    """Injects an event listener which holds back a click on the button until python has read the form.
+    This is useful for delaying navigating away from a form page until any newly entered
+    information has been read by python.
+    'user_clicked_next_varname' is set to a promise which resolves when the button is clicked, so python can
+    simply evaluate it to wait for the click. After reading, python must call the function stored in
+    'python_done_reading_varname', which releases the held back click.
+    No polling is involved on either side. If the button isn't found, the promise variable is set to null,
+    so waiting for it returns immediately."""
+    
+    js = _add_wait_js(user_clicked_next_varname, python_done_reading_varname)
+    page.evaluate(js, button_text)
 
-    page.evaluate(js)
+
+async def add_wait_async(
+        page: AsyncPage, button_text: str, user_clicked_next_varname: str, python_done_reading_varname: str):
+    """Async counterpart of add_wait"""
+    
+    js = _add_wait_js(user_clicked_next_varname, python_done_reading_varname)
+    await page.evaluate(js, button_text)
 
 
 def make_example_form_values() -> dict:
@@ -19,6 +19,23 @@ CONFIG_PATH = pathlib.Path(_config_dir_str).resolve() / "data_location.txt"
 
 DATA_FILENAME = "data.stuff"
 
+# Catalog of options seen in the form's autocomplete fields. The options depend on what the user typed, so they
+# reveal e.g. which medication the user takes. Only unencrypted if no cryptor is passed to OptionCatalog
+_cache_dir_str = platformdirs.user_cache_dir(APPNAME, ensure_exists=True)
+CATALOG_PATH = pathlib.Path(_cache_dir_str).resolve() / "options.json"
+
+# Compiled version of the field specification in data/fields.yaml (see automation/field_spec.py)
+FIELD_SPEC_CACHE_PATH = pathlib.Path(_cache_dir_str).resolve() / "fields_spec.json"
+
+# Map of the form's pages, for identifying pages without probing each field (see persistence/form_map.py)
+FORM_MAP_PATH = pathlib.Path(_cache_dir_str).resolve() / "form_map.json"
+
+# Plan for repeating the last automatic fill (see automation/fill_plan.py). Contains field keys, but no values
+FILL_PLAN_PATH = pathlib.Path(_cache_dir_str).resolve() / "fill_plan.json"
+
+# Port and (temporary) profile dir of the optional long-lived browser which sessions can attach to
+BROWSER_SERVER_STATE_PATH = pathlib.Path(_cache_dir_str).resolve() / "browser_server.json"
+
 
 def _default_data_dir():
     return CONFIG_PATH.parent
@@ -2,6 +2,8 @@ from nacl import pwhash, secret
 from nacl.exceptions import CryptoError
 from concurrent.futures import ProcessPoolExecutor
 
+from pillepas import tracing
+
 
 ENCODING = "utf-8"
 
@@ -28,7 +30,8 @@ def _box_from_password(password: str) -> secret.SecretBox:
     password_bytes = _encode(password)
     kdf = pwhash.argon2i.kdf
     salt = _salt()
-    key = kdf(secret.SecretBox.KEY_SIZE, password_bytes, salt=salt)
+    with tracing.span("Cryptor.derive_key", category="crypto"):
+        key = kdf(secret.SecretBox.KEY_SIZE, password_bytes, salt=salt)
     box = secret.SecretBox(key)
     return box
 
@@ -75,7 +78,9 @@ class Cryptor:
     def box(self) -> secret.SecretBox:
         """Returns the secret box. If not yet available, wait for the worker process to finish."""
         if self._box is pending:
-            self._box = self._box_future.result()
+            # Key derivation runs in the worker process, so trace the time spent waiting for it here
+            with tracing.span("Cryptor.wait_for_key", category="crypto"):
+                self._box = self._box_future.result()
             self._executor.shutdown()
             #
         
@@ -0,0 +1,96 @@
+import json
+import logging
+logger = logging.getLogger(__name__)
+from pathlib import Path
+from typing import Iterable
+
+from pillepas import config
+from pillepas.crypto import Cryptor, CryptoError
+from pillepas.persistence.storage import _passthrough, atomic_write, file_lock
+
+
+class OptionCatalog:
+    """Keeps track of the options seen in autocomplete fields, keyed by field.
+    Knowing the options in advance lets us type just enough of a value to make the desired option unique,
+    instead of typing one character at a time and checking the suggestions after each.
+    The options are recorded after typing the start of the user's own values, so they reveal e.g. which medication
+    the user takes. Pass a cryptor to store the catalog encrypted."""
+    
+    def __init__(self, path: Path=None, cryptor: Cryptor=None):
+        """path (Path, optional) - file for storing the catalog. Defaults to the location in the config module.
+        cryptor (Cryptor, optional) - Cryptor instance which can handle encrypting+decrypting, e.g. the one used
+            for the Gateway. If not provided, the catalog is stored unencrypted (readable by the user only)."""
+        
+        self.path = config.CATALOG_PATH if path is None else path
+        self._cryptor = _passthrough if cryptor is None else cryptor
+        self._data: dict[str, set[str]] = dict()
+        self._setup()
+    
+    def _setup(self):
+        self._data = self._read()
+    
+    def _read(self) -> dict[str, set[str]]:
+        try:
+            d = json.loads(self._cryptor.decrypt(self.path.read_bytes()))
+            return {k: set(v) for k, v in d.items()}
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, CryptoError):
+            # The catalog only saves time, so it's fine to lose it, e.g. when starting to encrypt it
+            logger.warning(f"Could not read option catalog at {self.path}. Starting from scratch.")
+        
+        return dict()
+    
+    def save(self) -> None:
+        """Saves the catalog. The file is shared by concurrent sessions, so options saved by others in the meantime
+        are merged in, and the file is replaced atomically."""
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.path.with_name(self.path.name + ".lock")):
+            for k, v in self._read().items():
+                self._data.setdefault(k, set()).update(v)
+            
+            d = {k: sorted(v) for k, v in self._data.items()}
+            atomic_write(self.path, self._cryptor.encrypt(json.dumps(d, sort_keys=True, indent=2)))
+        #
+    
+    def add(self, key: str, options: Iterable[str]) -> None:
+        """Records options seen for the field with the specified key. Saves if anything new was seen."""
+        
+        known = self._data.setdefault(key, set())
+        new = set(options) - known
+        if new:
+            logger.debug(f"Adding {len(new)} new options for {key} to catalog.")
+            known.update(new)
+            self.save()
+        #
+    
+    def options(self, key: str) -> set[str]:
+        return set(self._data.get(key, set()))
+    
+    def shortest_unique_prefix(self, key: str, value: str, min_length: int=3) -> str|None:
+        """Returns the shortest prefix of value (of at least min_length characters) which is not contained
+        in any other known option for the field, ignoring case. Returns the full value if no shorter prefix is unique,
+        and None if the value itself isn't in the catalog."""
+        
+        options = self._data.get(key, set())
+        if value not in options:
+            return None
+        
+        others = [opt.casefold() for opt in options if opt != value]
+        target = value.casefold()
+        for n in range(min_length, len(value)):
+            prefix = target[:n]
+            if not any(prefix in opt for opt in others):
+                return value[:n]
+            #
+        
+        return value
+    
+    def __contains__(self, key):
+        return key in self._data
+    #
+
+
+if __name__ == '__main__':
+    pass
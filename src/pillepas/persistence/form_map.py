@@ -0,0 +1,92 @@
+import json
+import logging
+logger = logging.getLogger(__name__)
+from pathlib import Path
+
+from pillepas import config
+from pillepas.persistence.storage import atomic_write
+
+
+class FormMap:
+    """Remembers the structure of the form's pages between runs. For each observed page state, identified by a cheap
+    fingerprint of the DOM, the map holds the page's signature, the ordered keys of its present fields, and its title.
+    Knowing these in advance means a page can be identified with a single fingerprint lookup, instead of
+    probing the page for each field.
+    
+    Entries are only kept for the most recently seen fingerprints of each signature, so entries from before a change
+    to the site are dropped automatically. The whole map is discarded if the proxies' layout (their selectors)
+    changes, as the cached field lists may no longer hold."""
+    
+    # Number of fingerprints to keep for each signature (e.g. a page with one or two added medications)
+    max_fingerprints_per_signature = 4
+    
+    def __init__(self, path: Path=None, layout: str=None):
+        """path (Path, optional) - file for storing the map. Defaults to the location in the config module.
+        layout (str, optional) - identifier of the proxies' layout, e.g. from FormGateway.layout.
+            A stored map with a different layout is discarded."""
+        
+        self.path = config.FORM_MAP_PATH if path is None else path
+        self.layout = layout
+        self._pages: dict[str, dict] = dict()
+        self._counter = 0
+        self._setup()
+    
+    def _setup(self):
+        try:
+            d = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError:
+            logger.warning(f"Could not parse form map at {self.path}. Starting from scratch.")
+            return
+        
+        if d.get("layout") != self.layout:
+            logger.info("Form layout has changed since the form map was saved. Starting from scratch.")
+            return
+        
+        self._pages = d.get("pages", dict())
+        self._counter = max((entry["seen"] for entry in self._pages.values()), default=0)
+    
+    def save(self) -> None:
+        d = dict(layout=self.layout, pages=self._pages)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, json.dumps(d, sort_keys=True, indent=2).encode("utf-8"))
+    
+    def lookup(self, fingerprint: str) -> dict|None:
+        """Returns the entry (with keys signature, fields and title) for the fingerprint, if known"""
+        
+        entry = self._pages.get(fingerprint)
+        if entry is None:
+            return None
+        
+        self._counter += 1
+        entry["seen"] = self._counter
+        return dict(entry)
+    
+    def record(self, fingerprint: str, signature: int, fields: list[str], title: str=None) -> None:
+        """Records a page state, and saves the map. Drops the least recently seen fingerprints of the signature,
+        if there are too many."""
+        
+        self._counter += 1
+        self._pages[fingerprint] = dict(signature=signature, fields=list(fields), title=title, seen=self._counter)
+        
+        same_signature = sorted(
+            (entry["seen"], fp) for fp, entry in self._pages.items() if entry["signature"] == signature
+        )
+        n_excess = len(same_signature) - self.max_fingerprints_per_signature
+        for _, fp in same_signature[:max(n_excess, 0)]:
+            logger.debug(f"Dropping stale form map entry for signature {signature}.")
+            del self._pages[fp]
+        
+        self.save()
+    
+    def __len__(self):
+        return len(self._pages)
+    
+    def __contains__(self, fingerprint):
+        return fingerprint in self._pages
+    #
+
+
+if __name__ == '__main__':
+    pass
@@ -1,15 +1,16 @@
-import json
+import atexit
+from contextlib import contextmanager
 from pathlib import Path
+import threading
+import weakref
 
-from pillepas import config
+from pillepas import config, tracing
 from pillepas.utils import path_looks_like_file
 from pillepas.crypto import Cryptor
+from pillepas.persistence.storage import _passthrough, CorruptedError, FileBackend, profile_of, StorageBackend
 
-_passthrough = Cryptor(password=None)
-
-
-class CorruptedError(Exception):
-    pass
+# Marks keys deleted since the last save
+_deleted = object()
 
 
 def get_data_file_path(folder: Path=None) -> Path:
@@ -19,30 +20,75 @@ def get_data_file_path(folder: Path=None) -> Path:
     return res
 
 
+def _flush_at_exit(ref: weakref.ref) -> None:
+    gateway = ref()
+    if gateway is not None:
+        gateway.flush()
+    #
+
+
 class Gateway:
     """Intended to handle reading/writing of data, along with any preprocessing.
     Uses the builtin get/set/del magic methods for items, so stuff like
     my_gateway["foo"] = "bar"
-    adds value "bar" at key "foo", then updates the gateway's file."""
+    adds value "bar" at key "foo", then updates the gateway's file.
+    
+    The data are stored by a storage backend (see the storage module). By default, a FileBackend is used, which
+    keeps everything in a single encrypted file (plus a journal of recent changes). For large amounts of data,
+    an SQLiteBackend can be passed instead, which encrypts each value separately, so nothing needs to be loaded
+    up front:
+    
+    my_gateway = Gateway(backend=SQLiteBackend(cryptor=my_cryptor))
+    
+    Keys can be namespaced by profile, like 'alice/user_first_name', and all data for a profile
+    looked up with the profile method.
     
-    def __init__(self, cryptor: Cryptor=None):
-        """cryptor (Cryptor, optional) - Cryptor instance which can handle encrypting+decrypting""" 
+    Multiple changes should be grouped in a transaction, which only saves once, when it ends:
+    
+    with my_gateway.transaction():
+        my_gateway["foo"] = "bar"
+        my_gateway["baz"] = 42
+    
+    Alternatively, write-behind mode can be enabled, in which case changes are saved by a background timer,
+    so changes made in rapid succession result in a single save. Pending changes can be saved right away
+    with flush, and are also saved when the interpreter exits."""
+    
+    def __init__(
+            self,
+            cryptor: Cryptor=None,
+            write_behind: float=None,
+            journal: bool=True,
+            backend: StorageBackend=None
+        ):
+        """cryptor (Cryptor, optional) - Cryptor instance which can handle encrypting+decrypting.
+            Only used for the default backend.
+        write_behind (float, optional) - if set, changes are saved this many seconds after the first unsaved
+            change, instead of immediately.
+        journal (bool, default True) - whether the default backend appends changes to a journal, instead of
+            rewriting the data file on each save.
+        backend (StorageBackend, optional) - where to store the data. Defaults to a FileBackend at
+            the location in the config module."""
         
-        self.path = config.get_data_file()
-        self._cryptor = _passthrough if cryptor is None else cryptor
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self._last_hash = None
-        self._data = None
-        self._setup()
+        if backend is None:
+            backend = FileBackend(cryptor=cryptor, journal=journal)
+        self.backend = backend
         
-    def _setup(self):
-        try:
-            self._data = self.read()
-        except FileNotFoundError:
-            self._data = dict()
-            self.save()
+        # Changes which haven't been passed on to the backend yet
+        self.write_behind = write_behind
+        self._lock = threading.RLock()
+        self._transaction_depth = 0
+        self._pending = dict()
+        self._timer: threading.Timer | None = None
+        
+        if self.write_behind is not None:
+            # Use a weak reference, so the gateway isn't kept alive just to flush it at exit
+            atexit.register(_flush_at_exit, weakref.ref(self))
         #
     
+    @property
+    def path(self) -> Path:
+        return self.backend.path
+    
     def change_cryptor(self, cryptor: Cryptor=None) -> None:
         """Changes the gateway's Cryptor instance.
         The new cryptor can be a different cryptor instance, e.g. when changing a password, or None,
@@ -50,77 +96,115 @@ class Gateway:
         
         if cryptor is None:
             cryptor = _passthrough
-
+        
         if not isinstance(cryptor, Cryptor):
             raise TypeError
         
-        # Set the new cryptor and save data
-        self.check_corrupt()
-        self._last_hash = None
-        self._cryptor = cryptor
-        self.save()
+        # Save pending changes, then re-encrypt everything with the new cryptor
+        with self._lock:
+            self.flush()
+            self.backend.change_cryptor(cryptor)
+        #
     
     def move_data(self, new_folder: Path):
+        self.flush()
         if path_looks_like_file(new_folder):
             raise RuntimeError(f"New path ({new_folder}) looks like a file. Use a folder.")
         
         new_folder.mkdir(parents=True, exist_ok=True)
-        new_path = get_data_file_path(folder=new_folder)
-        self.path.rename(new_path)
-        self.path = new_path
+        self.backend.move(new_folder)
     
-    def _json(self) -> str:
-        s = json.dumps(self._data, sort_keys=True, indent=2)
-        return s
+    def check_corrupt(self):
+        self.backend.check_corrupt()
     
-    @property
-    def file_hash(self):
-        raw = self.path.read_bytes()
-        s = self._cryptor.decrypt(raw)
-        return hash(s)
+    def read(self) -> dict:
+        """Reads data from disk"""
+        return self.backend.read()
     
-    @property
-    def data_hash(self):
-        return hash(self._json())
+    def save(self) -> None:
+        """Saves any changes to disk"""
+        
+        with self._lock, tracing.span("Gateway.save", category="persistence", n_changes=len(self._pending)):
+            self._cancel_timer()
+            set_ = {k: v for k, v in self._pending.items() if v is not _deleted}
+            deleted = {k for k, v in self._pending.items() if v is _deleted}
+            self.backend.write(set_, deleted)
+            self._pending = dict()
+        #
     
-    def check_corrupt(self):
-        if self._last_hash and self._last_hash != self.file_hash:
-            raise CorruptedError(f"File has been modified - might happen if running multiple processes at once?")
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
         #
-
-    def read(self) -> dict:
-        """Reads data from disk"""
+    
+    def _changed(self):
+        """Called after the data are modified. Saves, unless saving is deferred by a transaction or write-behind."""
         
-        raw = self.path.read_bytes()
-        s = self._cryptor.decrypt(raw)
-        self._last_hash = hash(s)
-        res = json.loads(s)
+        if self._transaction_depth:
+            return
         
-        return res
-
-    def save(self) -> None:
-        """Saves the stored data to disk"""
-
-        self.check_corrupt()
-
-        s = self._json()
-        self._last_hash = hash(s)
-        raw = self._cryptor.encrypt(s)
-        self.path.write_bytes(raw)
+        if self.write_behind is None:
+            self.save()
+        elif self._timer is None:
+            # Later changes are picked up by the pending save
+            self._timer = threading.Timer(self.write_behind, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+        #
+    
+    def flush(self) -> None:
+        """Saves any pending changes"""
+        with self._lock:
+            if self._pending and not self._transaction_depth:
+                self.save()
+            #
+        #
+    
+    @contextmanager
+    def transaction(self):
+        """Context manager for grouping changes. Changes made in the transaction are saved once, when the outermost
+        transaction ends. If an exception is raised, the data are rolled back to the state when the
+        transaction began, and nothing is saved."""
+        
+        with self._lock:
+            snapshot = dict(self._pending)
+            self._transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._pending = snapshot
+                raise
+            finally:
+                self._transaction_depth -= 1
+            
+            if self._pending and not self._transaction_depth:
+                self._changed()
+            #
+        #
     
     def wipe(self):
         """Remove data from disk"""
-        self.path.unlink(missing_ok=True)
+        with self._lock:
+            self._cancel_timer()
+            self._pending = dict()
+            self.backend.wipe()
+        #
     
     def set_values(self, **kwargs):
         """Set a bunch of key-value pairs, then save"""
-        for k, v in kwargs.items():
-            self._data[k] = v
-        
-        self.save()
+        with self._lock:
+            self._pending.update(kwargs)
+            self._changed()
+        #
     
     def __getitem__(self, key):
-        res = self._data[key]
+        if key not in self._pending:
+            return self.backend.get(key)
+        
+        res = self._pending[key]
+        if res is _deleted:
+            raise KeyError(key)
         return res
     
     def get(self, key, default=None):
@@ -130,18 +214,54 @@ class Gateway:
             return default
     
     def __setitem__(self, key, value):
-        self._data[key] = value
-        self.save()
+        with self._lock:
+            self._pending[key] = value
+            self._changed()
+        #
     
     def __delitem__(self, key):
-        del self._data[key]
-        self.save()
+        with self._lock:
+            if key not in self:
+                raise KeyError(key)
+            self._pending[key] = _deleted
+            self._changed()
+        #
     
     def __contains__(self, item):
-        return item in self._data
+        if item in self._pending:
+            return self._pending[item] is not _deleted
+        return self.backend.contains(item)
+    
+    def to_dict(self) -> dict:
+        """All data, including unsaved changes"""
+        
+        res = dict(self.backend.items())
+        for k, v in self._pending.items():
+            if v is _deleted:
+                res.pop(k, None)
+            else:
+                res[k] = v
+            #
+        
+        return res
+    
+    def profile(self, profile: str) -> dict:
+        """All data with keys belonging to the profile, e.g. {'alice/user_first_name': 'Alice', ...}"""
+        
+        res = self.backend.profile_items(profile)
+        for k, v in self._pending.items():
+            if profile_of(k) != profile:
+                continue
+            if v is _deleted:
+                res.pop(k, None)
+            else:
+                res[k] = v
+            #
+        
+        return res
     
     def __str__(self) -> str:
-        data_str = f"{', '.join(f'{k}={repr(v)}' for k, v in self._data.items())}"
+        data_str = f"{', '.join(f'{k}={repr(v)}' for k, v in self.to_dict().items())}"
         res = f"{self.__class__.__name__}({data_str})"
         return res
     #
@@ -153,11 +273,11 @@ if __name__ == '__main__':
     
     # Make the path instance, add filename if provided, otherwise reference the folder
     path = Path(tempdir.name) / "data.stuff"
-
+    
     
     g = Gateway(path=path, cryptor=Cryptor("1"))
     other_cryptor = cryptor=Cryptor("2")
     
-
+    
     g.change_cryptor(other_cryptor)
     
\ No newline at end of file
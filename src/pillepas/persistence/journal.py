@@ -0,0 +1,78 @@
+"""Append-only journal of records, stored next to the data file.
+Each record is stored as its length (4 bytes, big-endian) followed by its contents, so the journal can be read
+back without any knowledge of the contents, which are typically encrypted.
+If a process is interrupted while appending, the journal may end with an incomplete record. Reading stops
+before such a record, and the offset returned by read can be used to truncate it away."""
+
+import os
+from pathlib import Path
+import struct
+
+_HEADER = struct.Struct(">I")
+
+
+class Journal:
+    def __init__(self, path: Path):
+        """path (Path) - the journal file. Created when the first record is appended."""
+        self.path = path
+    
+    def size(self) -> int:
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+        #
+    
+    def append(self, record: bytes) -> int:
+        """Appends a record, and returns the size of the journal afterwards"""
+        
+        with open(self.path, "ab") as f:
+            f.write(_HEADER.pack(len(record)) + record)
+            f.flush()
+            os.fsync(f.fileno())
+            res = f.tell()
+        
+        return res
+    
+    def read(self, offset: int=0) -> tuple[list[bytes], int]:
+        """Reads the complete records starting at offset.
+        Returns the records, and the offset right after the last complete record."""
+        
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                raw = f.read()
+            #
+        except FileNotFoundError:
+            return [], offset
+        
+        records = []
+        pos = 0
+        while pos + _HEADER.size <= len(raw):
+            (n,) = _HEADER.unpack_from(raw, pos)
+            end = pos + _HEADER.size + n
+            if end > len(raw):
+                break
+            records.append(raw[pos + _HEADER.size:end])
+            pos = end
+        
+        return records, offset + pos
+    
+    def truncate(self, size: int=0) -> None:
+        try:
+            with open(self.path, "r+b") as f:
+                f.truncate(size)
+                f.flush()
+                os.fsync(f.fileno())
+            #
+        except FileNotFoundError:
+            pass
+        #
+    
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
+    #
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,229 @@
+"""SQLite storage backend for the Gateway, for when there's too much data to keep in a single file.
+Each value is encrypted separately and stored in its own row, so values are only read and decrypted when accessed,
+and a change only touches the affected rows. Keys and profiles aren't stored in plaintext. Rows are looked up by
+a keyed hash (HMAC) of the key and of the profile, a so-called blind index, and the key itself is stored encrypted
+along with the value. The secret used for hashing is random, and stored encrypted in the database.
+
+Example:
+
+gateway = Gateway(backend=SQLiteBackend(cryptor=cryptor))
+gateway["alice/user_first_name"] = "Alice"
+gateway.profile("alice")  # {'alice/user_first_name': 'Alice'}
+"""
+
+from contextlib import contextmanager
+import hashlib
+import hmac
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Any, Iterator
+
+from pillepas import config, tracing
+from pillepas.crypto import Cryptor, CryptoError
+from pillepas.persistence.storage import _passthrough, profile_of, StorageBackend
+
+SQLITE_SUFFIX = ".sqlite"
+
+_INDEX_KEY_SIZE = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    key_hash BLOB PRIMARY KEY,
+    profile_hash BLOB,
+    value BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_profile ON items (profile_hash);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+"""
+
+
+class SQLiteBackend(StorageBackend):
+    """Stores the gateway's data in an SQLite database, with each value encrypted separately.
+    Multiple processes can use the same database. SQLite takes care of the locking, and the database uses
+    write-ahead logging, so readers don't block each other or the writer."""
+    
+    def __init__(self, path: Path=None, cryptor: Cryptor=None):
+        """path (Path, optional) - the database file. Defaults to the data file in the config module,
+            with the suffix .sqlite.
+        cryptor (Cryptor, optional) - Cryptor instance which can handle encrypting+decrypting.
+        Raises CryptoError if the database was encrypted with a different cryptor."""
+        
+        self.path = config.get_data_file().with_suffix(SQLITE_SUFFIX) if path is None else path
+        self._cryptor = _passthrough if cryptor is None else cryptor
+        self._conn: sqlite3.Connection | None = None
+        # Secret key for the blind index. Read from the database when connecting
+        self._index_key: bytes | None = None
+        # The connection is shared with e.g. the gateway's write-behind timer
+        self._lock = threading.RLock()
+        self._connection()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection to the database, creating the database if needed"""
+        
+        if self._conn is not None:
+            return self._conn
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._index_key = self._read_index_key(conn)
+        except BaseException:
+            conn.close()
+            raise
+        
+        self._conn = conn
+        return conn
+    
+    def _read_index_key(self, conn: sqlite3.Connection) -> bytes:
+        """Returns the secret key for the blind index, creating it if the database is new.
+        Raises CryptoError if the key was encrypted with a different cryptor."""
+        
+        new_key = self._cryptor.encrypt(os.urandom(_INDEX_KEY_SIZE).hex())
+        # Another process may create the key at the same time, so only insert if missing, then read it back
+        conn.execute("INSERT OR IGNORE INTO meta VALUES ('index_key', ?)", (new_key,))
+        raw, = conn.execute("SELECT value FROM meta WHERE name = 'index_key'").fetchone()
+        
+        try:
+            res = bytes.fromhex(self._cryptor.decrypt(raw))
+        except ValueError:
+            raise CryptoError
+        
+        return res
+    
+    def _hash(self, s: str | None) -> bytes | None:
+        """The blind index of a key or profile"""
+        
+        if s is None:
+            return None
+        
+        self._connection()
+        res = hmac.digest(self._index_key, s.encode("utf-8"), hashlib.sha256)
+        return res
+    
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        #
+    
+    def _query(self, sql: str, params: tuple=()) -> list:
+        with self._lock:
+            res = self._connection().execute(sql, params).fetchall()
+        return res
+    
+    def _encrypt(self, key: str, value: Any) -> bytes:
+        return self._cryptor.encrypt(json.dumps([key, value]))
+    
+    def _decrypt(self, raw: bytes) -> tuple[str, Any]:
+        key, value = json.loads(self._cryptor.decrypt(raw))
+        return key, value
+    
+    def get(self, key: str) -> Any:
+        rows = self._query("SELECT value FROM items WHERE key_hash = ?", (self._hash(key),))
+        if not rows:
+            raise KeyError(key)
+        _, res = self._decrypt(rows[0][0])
+        return res
+    
+    def contains(self, key: str) -> bool:
+        rows = self._query("SELECT 1 FROM items WHERE key_hash = ?", (self._hash(key),))
+        return bool(rows)
+    
+    def keys(self) -> list[str]:
+        """All keys. Keys are stored encrypted, so this decrypts every row."""
+        return [key for key, _ in self.items()]
+    
+    def items(self) -> Iterator[tuple[str, Any]]:
+        rows = self._query("SELECT value FROM items")
+        yield from sorted(self._decrypt(raw) for raw, in rows)
+    
+    def profile_items(self, profile: str) -> dict:
+        rows = self._query("SELECT value FROM items WHERE profile_hash = ?", (self._hash(profile),))
+        res = dict(self._decrypt(raw) for raw, in rows)
+        return res
+    
+    def write(self, set_: dict, deleted: set) -> None:
+        rows = [
+            (self._hash(key), self._hash(profile_of(key)), self._encrypt(key, value))
+            for key, value in set_.items()
+        ]
+        with tracing.span("SQLiteBackend.write", category="persistence", n_rows=len(rows) + len(deleted)):
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO items VALUES (?, ?, ?) "
+                    "ON CONFLICT (key_hash) DO UPDATE SET profile_hash = excluded.profile_hash, value = excluded.value",
+                    rows
+                )
+                conn.executemany("DELETE FROM items WHERE key_hash = ?", [(self._hash(key),) for key in deleted])
+            #
+        #
+    
+    def change_cryptor(self, cryptor: Cryptor) -> None:
+        """Re-encrypts everything with the new cryptor. The secret for the blind index is kept, so the hashes
+        are still valid."""
+        
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT key_hash, value FROM items").fetchall()
+            reencrypted = [(cryptor.encrypt(self._cryptor.decrypt(raw)), key_hash) for key_hash, raw in rows]
+            conn.executemany("UPDATE items SET value = ? WHERE key_hash = ?", reencrypted)
+            conn.execute(
+                "UPDATE meta SET value = ? WHERE name = 'index_key'",
+                (cryptor.encrypt(self._index_key.hex()),)
+            )
+            self._cryptor = cryptor
+        #
+    
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._index_key = None
+            #
+        #
+    
+    def _files(self, path: Path) -> list[Path]:
+        """The database file, and SQLite's write-ahead log and shared memory files"""
+        return [path] + [path.with_name(path.name + suffix) for suffix in ("-wal", "-shm")]
+    
+    def move(self, new_folder: Path) -> None:
+        new_path = new_folder / self.path.name
+        with self._lock:
+            self.close()
+            for old, new in zip(self._files(self.path), self._files(new_path)):
+                if old.exists():
+                    old.rename(new)
+                #
+            self.path = new_path
+            self._connection()
+        #
+    
+    def wipe(self) -> None:
+        """Removes the database. It's created again if more data are stored."""
+        
+        with self._lock:
+            self.close()
+            for path in self._files(self.path):
+                path.unlink(missing_ok=True)
+            #
+        #
+    #
+
+
+if __name__ == '__main__':
+    pass
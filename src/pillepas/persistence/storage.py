@@ -0,0 +1,568 @@
+"""Storage backends for the persistence Gateway.
+A backend stores the gateway's key-value pairs, encrypting them with the backend's Cryptor. The gateway takes care
+of buffering changes (transactions and write-behind), and passes them on to the backend's write method.
+FileBackend, the default, keeps all data in a single encrypted file plus a journal. For large amounts of data,
+see the SQLite backend in the sqlite_storage module."""
+
+import abc
+from contextlib import contextmanager, nullcontext
+import copy
+import hashlib
+import json
+import logging
+logger = logging.getLogger(__name__)
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, which has msvcrt instead
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+from pillepas import config, tracing
+from pillepas.crypto import Cryptor
+from pillepas.persistence.journal import Journal
+
+_passthrough = Cryptor(password=None)
+
+# Keys can be namespaced by profile, like '<profile>/<key>'
+PROFILE_SEPARATOR = "/"
+
+# Seconds between attempts to take a lock with msvcrt, which can't block until the lock is free
+_LOCK_RETRY_INTERVAL = 0.05
+
+# Files modified this recently (in nanoseconds) might be modified again without changing their timestamp,
+# depending on the timestamp resolution of the file system, so their stats can't be trusted
+_RACY_WINDOW_NS = 2_000_000_000
+
+# Keys of the envelope holding the data and its version number in the data file
+_VERSION_KEY = "__version__"
+_DATA_KEY = "__data__"
+
+_missing = object()
+
+
+class CorruptedError(Exception):
+    pass
+
+
+def profile_of(key: str) -> str|None:
+    """The profile a key belongs to, e.g. 'alice' for 'alice/user_first_name'. None if the key has no profile."""
+    
+    head, sep, _ = key.partition(PROFILE_SEPARATOR)
+    res = head if sep else None
+    return res
+
+
+def digest(raw: bytes) -> str:
+    """Stable digest of the (encrypted) contents of a data file"""
+    res = hashlib.blake2b(raw, digest_size=32).hexdigest()
+    return res
+
+
+def stat_fingerprint(st: os.stat_result) -> tuple:
+    res = (st.st_mtime_ns, st.st_size, st.st_ino)
+    return res
+
+
+@contextmanager
+def file_lock(path: Path, exclusive: bool=True):
+    """Holds a lock on the file at path (created if missing) while in the context.
+    Uses fcntl where available, where shared locks (exclusive=False) don't block each other.
+    On Windows, msvcrt is used instead, which only has exclusive locks.
+    Raises RuntimeError if neither is available, rather than silently not locking."""
+    
+    if fcntl is not None:
+        with open(path, "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            #
+        #
+    elif msvcrt is not None:
+        with open(path, "a+b") as f:
+            # Lock the first byte. It doesn't need to exist
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(_LOCK_RETRY_INTERVAL)
+                #
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            #
+        #
+    else:
+        raise RuntimeError("No file locking available on this platform (needs fcntl or msvcrt)")
+    #
+
+
+def atomic_write(path: Path, raw: bytes) -> None:
+    """Writes to a temporary file in the same folder, then replaces the file at path with it, so readers
+    only ever see the old or the new contents."""
+    
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+    
+    # Make sure the rename itself is persisted
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        #
+    #
+
+
+class StorageBackend(abc.ABC):
+    """Interface for the gateway's storage. Subclasses must set the path attribute to their main file."""
+    
+    path: Path
+    
+    @abc.abstractmethod
+    def get(self, key: str) -> Any:
+        """Returns the value stored at key. Raises KeyError if there is none."""
+        raise NotImplementedError
+    
+    @abc.abstractmethod
+    def contains(self, key: str) -> bool:
+        raise NotImplementedError
+    
+    @abc.abstractmethod
+    def items(self) -> Iterator[tuple[str, Any]]:
+        """Iterates over all stored (key, value) pairs"""
+        raise NotImplementedError
+    
+    @abc.abstractmethod
+    def profile_items(self, profile: str) -> dict:
+        """All stored key-value pairs with keys belonging to the profile (see profile_of)"""
+        raise NotImplementedError
+    
+    @abc.abstractmethod
+    def write(self, set_: dict, deleted: set) -> None:
+        """Stores the values in set_, and removes the keys in deleted, as a single change"""
+        raise NotImplementedError
+    
+    @abc.abstractmethod
+    def change_cryptor(self, cryptor: Cryptor) -> None:
+        """Encrypts all stored data with a new cryptor"""
+        raise NotImplementedError
+    
+    @abc.abstractmethod
+    def move(self, new_folder: Path) -> None:
+        """Moves the stored data into new_folder"""
+        raise NotImplementedError
+    
+    @abc.abstractmethod
+    def wipe(self) -> None:
+        """Removes all stored data from disk"""
+        raise NotImplementedError
+    
+    def read(self) -> dict:
+        """Reads all data from disk"""
+        return dict(self.items())
+    
+    def check_corrupt(self) -> None:
+        """Raises CorruptedError if the stored data were modified unexpectedly"""
+        pass
+    
+    def close(self) -> None:
+        pass
+    #
+
+
+class FileBackend(StorageBackend):
+    """Keeps all data in memory, and stores them in an encrypted file.
+    
+    Changes are appended to an encrypted journal next to the data file, so saving a change costs the same
+    regardless of how much data is stored. Once the journal grows large compared to the data file, it's folded
+    into the data file by a background compaction. With journal=False, each write rewrites the whole data file.
+    
+    Multiple processes can use the same file. Writes hold an advisory lock on a lock file next to the data file,
+    and each write increments a version number. If another process has written since the backend last read or
+    wrote the files (i.e. the version on disk is newer), its changes are loaded before ours are applied.
+    Reads hold a shared lock, so they don't block each other."""
+    
+    # Compact once the journal is larger than this many bytes, and this many times the size of the data file
+    compact_min_bytes = 64 * 1024
+    compact_ratio = 1.0
+    
+    def __init__(self, path: Path=None, cryptor: Cryptor=None, journal: bool=True):
+        """path (Path, optional) - the data file. Defaults to the location in the config module.
+        cryptor (Cryptor, optional) - Cryptor instance which can handle encrypting+decrypting
+        journal (bool, default True) - whether to append changes to a journal, instead of rewriting
+            the data file on each write."""
+        
+        self.path = config.get_data_file() if path is None else path
+        self._cryptor = _passthrough if cryptor is None else cryptor
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Fingerprints of the file when last read or written, for detecting modifications by others
+        self._last_stat = None
+        self._last_digest = None
+        self._data = None
+        # Version number of the files, and the data as of that version, for detecting conflicting changes
+        self._version = 0
+        self._base = dict()
+        self.use_journal = journal
+        self._journal_offset = 0
+        self._compaction: threading.Thread | None = None
+        
+        self._lock = threading.RLock()
+        self._file_lock_depth = 0
+        
+        self._setup()
+    
+    def _setup(self):
+        try:
+            with self._read_lock():
+                self._data = self._load()
+            #
+        except FileNotFoundError:
+            self._data = dict()
+            self.write(dict(), set())
+        #
+    
+    @property
+    def lock_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".lock")
+    
+    @property
+    def journal_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".journal")
+    
+    @property
+    def journal(self) -> Journal | None:
+        return Journal(self.journal_path) if self.use_journal else None
+    
+    def _read_lock(self):
+        """Shared lock on the lock file, unless the exclusive one is already held"""
+        
+        if self._file_lock_depth:
+            return nullcontext()
+        return file_lock(self.lock_path, exclusive=False)
+    
+    @contextmanager
+    def _locked(self):
+        """Holds the backend's thread lock and an exclusive lock on the lock file. Reentrant."""
+        
+        with self._lock:
+            if self._file_lock_depth:
+                self._file_lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._file_lock_depth -= 1
+                return
+            
+            with file_lock(self.lock_path):
+                self._file_lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._file_lock_depth = 0
+                #
+            #
+        #
+    
+    def get(self, key: str) -> Any:
+        return self._data[key]
+    
+    def contains(self, key: str) -> bool:
+        return key in self._data
+    
+    def items(self) -> Iterator[tuple[str, Any]]:
+        yield from list(self._data.items())
+    
+    def profile_items(self, profile: str) -> dict:
+        res = {k: v for k, v in self._data.items() if profile_of(k) == profile}
+        return res
+    
+    def change_cryptor(self, cryptor: Cryptor) -> None:
+        # Pick up changes from other processes while the files can still be decrypted, then save everything
+        # with the new cryptor
+        with self._locked():
+            self._sync(dict(), set())
+            self._cryptor = cryptor
+            self.compact()
+        #
+    
+    def move(self, new_folder: Path) -> None:
+        new_path = new_folder / self.path.name
+        with self._locked():
+            journal_path = self.journal_path
+            self.path.rename(new_path)
+            self.path = new_path
+            if journal_path.exists():
+                journal_path.rename(self.journal_path)
+            #
+        #
+    
+    def _json(self) -> str:
+        d = {_VERSION_KEY: self._version, _DATA_KEY: self._data}
+        s = json.dumps(d, sort_keys=True, indent=2)
+        return s
+    
+    @staticmethod
+    def _parse(s: str) -> tuple[int, dict]:
+        """Parses the decrypted contents of the data file into its version number and data.
+        Files saved before versioning was added hold only the data, and have version 0."""
+        
+        d = json.loads(s)
+        if isinstance(d, dict) and d.keys() == {_VERSION_KEY, _DATA_KEY}:
+            return d[_VERSION_KEY], d[_DATA_KEY]
+        
+        return 0, d
+    
+    @property
+    def file_hash(self) -> str:
+        raw = self.path.read_bytes()
+        return digest(raw)
+    
+    def _remember_file(self, raw: bytes) -> None:
+        """Records the fingerprints of the file, which has just been read or written with the raw contents"""
+        self._last_stat = stat_fingerprint(os.stat(self.path))
+        self._last_digest = digest(raw)
+    
+    def file_modified(self) -> bool:
+        """Whether the data file or journal has been modified since the backend last read or wrote them.
+        The files are never decrypted."""
+        
+        res = self._snapshot_modified() or (self.use_journal and self.journal.size() != self._journal_offset)
+        return res
+    
+    def _snapshot_modified(self) -> bool:
+        """Whether the data file has been modified since the backend last read or wrote it.
+        Compares the file's stats (modification time, size, and inode) first, and only reads the file
+        if they differ or are too recent to be trusted."""
+        
+        if self._last_digest is None:
+            # Not read or written yet, so any existing file was written by someone else
+            return self.path.exists()
+        
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        
+        fingerprint = stat_fingerprint(st)
+        if fingerprint == self._last_stat and time.time_ns() - st.st_mtime_ns > _RACY_WINDOW_NS:
+            return False
+        
+        res = self.file_hash != self._last_digest
+        if not res:
+            self._last_stat = fingerprint
+        
+        return res
+    
+    def check_corrupt(self):
+        if self.file_modified():
+            raise CorruptedError(f"File has been modified - might happen if running multiple processes at once?")
+        #
+    
+    def _replay(self, version: int, data: dict, offset: int=0) -> tuple[int, dict, int]:
+        """Applies the journal's records from offset onwards to data (in place), skipping records already included
+        in the data file.
+        Returns the resulting version, the data, and the offset after the last record."""
+        
+        records, end = self.journal.read(offset)
+        for raw in records:
+            record = json.loads(self._cryptor.decrypt(raw))
+            if record["version"] <= version:
+                continue
+            
+            data.update(record["set"])
+            for key in record["del"]:
+                data.pop(key, None)
+            version = record["version"]
+        
+        return version, data, end
+    
+    def read(self) -> dict:
+        with self._lock, self._read_lock():
+            raw = self.path.read_bytes()
+            version, res = self._parse(self._cryptor.decrypt(raw))
+            if self.use_journal:
+                _, res, _ = self._replay(version, res)
+            #
+        
+        return res
+    
+    def _load(self) -> dict:
+        """Reads data from disk, and records the files' version and fingerprints. Must hold a file lock."""
+        
+        raw = self.path.read_bytes()
+        version, res = self._parse(self._cryptor.decrypt(raw))
+        self._remember_file(raw)
+        self._journal_offset = 0
+        if self.use_journal:
+            version, res, self._journal_offset = self._replay(version, res)
+        
+        self._version = version
+        self._base = copy.deepcopy(res)
+        
+        return res
+    
+    def _sync(self, set_: dict, deleted: set) -> None:
+        """Loads any changes written by others since the files were last read or written, and warns about those
+        conflicting with the changes about to be written. Must hold the file lock."""
+        
+        base = self._base
+        version = self._version
+        if self._snapshot_modified():
+            # The data file was rewritten, so start over
+            try:
+                self._data = self._load()
+            except FileNotFoundError:
+                # Removed by someone else, so the data file must be written again
+                self._last_digest = None
+                return
+            #
+        elif self.use_journal and self.journal.size() > self._journal_offset:
+            # Records were appended, so only apply those
+            self._version, self._data, self._journal_offset = self._replay(
+                self._version,
+                self._data,
+                self._journal_offset
+            )
+            self._base = copy.deepcopy(self._data)
+        else:
+            return
+        
+        if self._version < version:
+            logger.warning(
+                f"{self.path} was replaced by an older version ({self._version}, had {version}). "
+                f"Changes made since then are lost."
+            )
+        if self._version <= version:
+            # Rewritten without new changes, e.g. touched or restored, so nothing can conflict
+            return
+        
+        conflicts = []
+        for key in set_.keys() | deleted:
+            theirs = self._data.get(key, _missing)
+            if theirs != base.get(key, _missing) and theirs != set_.get(key, _missing):
+                conflicts.append(key)
+            #
+        
+        if conflicts:
+            logger.warning(f"Keys {conflicts} were also changed by another process. Keeping the values set here.")
+        #
+    
+    def _save_snapshot(self) -> None:
+        """Writes all data to the data file, and clears the journal. Must hold the file lock."""
+        
+        self._version += 1
+        s = self._json()
+        raw = self._cryptor.encrypt(s)
+        atomic_write(self.path, raw)
+        self._remember_file(raw)
+        self._base = copy.deepcopy(self._data)
+        
+        # The journal's records are all included in the data file now
+        if self.use_journal:
+            self.journal.truncate(0)
+            self._journal_offset = 0
+        #
+    
+    def _append(self, set_: dict, deleted: set) -> None:
+        """Appends the changes to the journal. Must hold the file lock."""
+        
+        if not set_ and not deleted:
+            return
+        
+        journal = self.journal
+        if journal.size() > self._journal_offset:
+            # Drop an incomplete record left by an interrupted write
+            journal.truncate(self._journal_offset)
+        
+        self._version += 1
+        record = {"version": self._version, "set": set_, "del": sorted(deleted)}
+        raw = self._cryptor.encrypt(json.dumps(record, sort_keys=True))
+        self._journal_offset = journal.append(raw)
+        
+        self._base.update(copy.deepcopy(set_))
+        for key in deleted:
+            self._base.pop(key, None)
+        #
+    
+    def write(self, set_: dict, deleted: set) -> None:
+        with self._locked():
+            self._sync(set_, deleted)
+            self._data.update(set_)
+            for key in deleted:
+                self._data.pop(key, None)
+            
+            if self.use_journal and self._last_digest is not None:
+                self._append(set_, deleted)
+            else:
+                self._save_snapshot()
+            #
+        
+        if self._needs_compaction():
+            self._compact_in_background()
+        #
+    
+    def compact(self) -> None:
+        """Folds the journal into the data file"""
+        
+        with self._locked(), tracing.span("FileBackend.compact", category="persistence", n_keys=len(self._data)):
+            self._sync(dict(), set())
+            self._save_snapshot()
+        #
+    
+    def _needs_compaction(self) -> bool:
+        if not self.use_journal or self._last_stat is None:
+            return False
+        
+        snapshot_size = self._last_stat[1]
+        res = self._journal_offset > max(self.compact_min_bytes, self.compact_ratio * snapshot_size)
+        return res
+    
+    def _compact_in_background(self) -> None:
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        
+        self._compaction = threading.Thread(target=self.compact, daemon=True)
+        self._compaction.start()
+    
+    def wipe(self) -> None:
+        with self._locked():
+            self.path.unlink(missing_ok=True)
+            Journal(self.journal_path).remove()
+            self._last_stat = None
+            self._last_digest = None
+            self._version = 0
+            self._base = dict()
+            self._journal_offset = 0
+        #
+    #
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,228 @@
+"""Tracing of the hot paths (browser automation, key derivation, saving data) as nested spans.
+Spans are the single instrumentation layer. Finished spans are passed to the active recorders, which are:
+the Tracer, exporting spans in Chrome's trace_event format (which can be opened in e.g. chrome://tracing
+or https://ui.perfetto.dev), the benchmark's Timings (see automation/timing.py), and the RoundTripCounter
+(see automation/roundtrips.py), which attributes browser calls to the 'key' attribute of the innermost open span.
+While no recorder is active, 'span' returns a shared no-op context manager, so instrumented code pays little more
+than a function call.
+
+Tracing can be enabled programmatically, or by setting the PILLEPAS_TRACE environment variable to the path
+where the trace should be written when the process exits.
+
+Example:
+
+with tracing.tracing_to("trace.json"):
+    with tracing.span("my_operation", key="user_first_name"):
+        ...
+
+Span attributes must never contain personal data, such as the values entered into the form.
+"""
+
+import atexit
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import threading
+import time
+
+
+ENV_VAR = "PILLEPAS_TRACE"
+
+_NULL_SPAN = nullcontext()
+
+# The innermost open span. A context variable, so threads and asyncio tasks each have their own
+_current: ContextVar["Span|None"] = ContextVar("pillepas_span", default=None)
+
+
+class Span:
+    """A single timed operation. Use as a context manager - the span is passed to the recorders when the block exits."""
+    
+    __slots__ = ("recorders", "name", "category", "timed", "attrs", "start", "parent", "_token")
+    
+    def __init__(self, recorders: tuple, name: str, category: str, timed: str|None, attrs: dict):
+        self.recorders = recorders
+        self.name = name
+        self.category = category
+        self.timed = timed
+        self.attrs = attrs
+        self.start = None
+        self.parent: Span | None = None
+        self._token = None
+    
+    def __enter__(self):
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = time.perf_counter()
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        for recorder in self.recorders:
+            recorder.record_span(self, end)
+        #
+    
+    def ancestors(self):
+        """Iterates over the enclosing spans, innermost first"""
+        
+        span = self.parent
+        while span is not None:
+            yield span
+            span = span.parent
+        #
+    #
+
+
+class Tracer:
+    """Collects finished spans as Chrome trace events"""
+    
+    def __init__(self):
+        self.events: list[dict] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+    
+    def record_span(self, span: Span, end: float):
+        event = dict(
+            name=span.name,
+            cat=span.category,
+            ph="X",  # 'complete' event, i.e. one with a duration
+            ts=(span.start - self._origin)*1e6,
+            dur=(end - span.start)*1e6,
+            pid=os.getpid(),
+            tid=threading.get_ident(),
+            args=span.attrs,
+        )
+        with self._lock:
+            self.events.append(event)
+        #
+    
+    def to_chrome_trace(self) -> dict:
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e["ts"])
+        res = dict(traceEvents=events, displayTimeUnit="ms")
+        return res
+    
+    def export(self, path: Path) -> None:
+        """Writes the recorded spans to a Chrome trace_event JSON file"""
+        Path(path).write_text(json.dumps(self.to_chrome_trace(), default=str))
+    #
+
+
+# Objects with a record_span(span, end) method, which finished spans are passed to
+_recorders: tuple = ()
+_tracer: Tracer | None = None
+
+
+def add_recorder(recorder) -> None:
+    global _recorders
+    _recorders = _recorders + (recorder,)
+
+
+def remove_recorder(recorder) -> None:
+    global _recorders
+    _recorders = tuple(r for r in _recorders if r is not recorder)
+
+
+def recorders() -> tuple:
+    return _recorders
+
+
+@contextmanager
+def recording(recorder):
+    """Makes the recorder active within the block"""
+    
+    add_recorder(recorder)
+    try:
+        yield recorder
+    finally:
+        remove_recorder(recorder)
+    #
+
+
+def is_enabled() -> bool:
+    return _tracer is not None
+
+
+def enable(tracer: Tracer=None) -> Tracer:
+    """Starts recording spans for the trace export. Returns the active tracer."""
+    
+    global _tracer
+    if _tracer is not None:
+        remove_recorder(_tracer)
+    _tracer = Tracer() if tracer is None else tracer
+    add_recorder(_tracer)
+    return _tracer
+
+
+def disable() -> Tracer | None:
+    """Stops recording spans for the trace export. Returns the tracer which was active, if any."""
+    
+    global _tracer
+    res = _tracer
+    if res is not None:
+        remove_recorder(res)
+    _tracer = None
+    return res
+
+
+def span(name: str, category: str="pillepas", timed: str=None, **attrs):
+    """Context manager timing the block as a span, if any recorder is active.
+    timed (str, optional) - name to record the span's duration under in the benchmark timings, in the span's category.
+    attrs - attributes to attach to the span. Must not contain sensitive data."""
+    
+    recorders_ = _recorders
+    if not recorders_:
+        return _NULL_SPAN
+    return Span(recorders_, name, category, timed, attrs)
+
+
+def current_attr(name: str, default=None):
+    """The value of an attribute of the innermost open span which has it, e.g. the key of the proxy being filled"""
+    
+    span_ = _current.get()
+    while span_ is not None:
+        if name in span_.attrs:
+            return span_.attrs[name]
+        span_ = span_.parent
+    
+    return default
+
+
+@contextmanager
+def tracing_to(path: Path):
+    """Enables tracing within the block, and writes the trace to path afterwards"""
+    
+    previous = _tracer
+    tracer = enable()
+    try:
+        yield tracer
+    finally:
+        tracer.export(path)
+        if previous is None:
+            disable()
+        else:
+            enable(previous)
+        #
+    #
+
+
+def _enable_from_env():
+    path = os.environ.get(ENV_VAR)
+    # Worker processes inherit the environment, but shouldn't overwrite the main process' trace
+    if not path or multiprocessing.parent_process() is not None:
+        return
+    
+    tracer = enable()
+    atexit.register(tracer.export, path)
+
+
+_enable_from_env()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,262 @@
+import asyncio
+from contextlib import asynccontextmanager
+from pathlib import Path
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from playwright.async_api import Keyboard, Locator, Page
+
+from pillepas.automation import async_fill_form, timing
+from pillepas.automation.async_fill_form import AsyncSession, fill_concurrently
+from pillepas.automation.async_form_gateway import AsyncFormGateway
+from pillepas.automation.async_proxy_classes import ASYNC_SUBSTITUTIONS, AsyncMedicineProxy, AsyncProxy
+from pillepas.automation.fill_form import FillError, Session
+from pillepas.automation.form_gateway import FormGateway
+from pillepas.automation.proxy_classes import Proxy
+from pillepas.persistence.catalog import OptionCatalog
+
+
+def make_locator() -> MagicMock:
+    """Mock of an async locator. Methods which talk to the browser are coroutines, and methods which narrow down
+    the locator return the same mock, so all interactions are recorded in one place."""
+    
+    res = MagicMock(spec=Locator)
+    res.first = res
+    for name in ("nth", "locator", "get_by_role", "get_by_label", "filter"):
+        getattr(res, name).return_value = res
+    
+    res.page = MagicMock(spec=Page)
+    res.page.keyboard = MagicMock(spec=Keyboard)
+    res.page.get_by_role.return_value = res
+    res.page.locator.return_value = res
+    return res
+
+
+class TestAsyncProxies(IsolatedAsyncioTestCase):
+    def test_separate_from_sync_proxies(self):
+        for cls_ in ASYNC_SUBSTITUTIONS.values():
+            self.assertFalse(issubclass(cls_, Proxy), cls_)
+        #
+    
+    async def test_set_value(self):
+        elem = make_locator()
+        proxy = AsyncProxy(elem, key="user_first_name")
+        
+        timings = timing.Timings()
+        with timing.recording(timings):
+            await proxy.set_value("Alice")
+        
+        elem.fill.assert_awaited_once_with("Alice")
+        elem.dispatch_event.assert_awaited_once_with("change")
+        self.assertEqual(timings.counts()["proxy"], {"AsyncProxy": 1})
+    
+    async def test_medicine(self):
+        elem = make_locator()
+        proxy = AsyncMedicineProxy(elem, sub_proxies=dict(drug=AsyncProxy(elem, key="drug")), key="medicine")
+        
+        timings = timing.Timings()
+        with timing.recording(timings):
+            await proxy.set_value([dict(drug="Drug 0"), dict(drug="Drug 1")])
+        
+        self.assertEqual([call.args for call in elem.fill.await_args_list], [("Drug 0",), ("Drug 1",)])
+        self.assertEqual(len(proxy.sub_proxies), 2)
+        self.assertEqual(timings.counts()["proxy"], {"AsyncMedicineProxy": 1})
+        self.assertEqual(timings.counts()["proxy (nested)"], {"AsyncProxy": 2})
+        
+        with self.assertRaises(RuntimeError):
+            await proxy.set_value([dict(dosis="1")])
+        #
+    #
+
+
+class TestAsyncSession(IsolatedAsyncioTestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.catalog = OptionCatalog(path=Path(tempdir.name) / "catalog.json")
+        
+        self.page = MagicMock(spec=Page)
+        self.page.locator.return_value = make_locator()
+        self.browser = MagicMock()
+        self.browser.new_context = AsyncMock()
+        self.context = self.browser.new_context.return_value
+        self.context.new_page = AsyncMock(return_value=self.page)
+    
+    def make_session(self, fill_data: dict) -> AsyncSession:
+        return AsyncSession(fill_data, browser=self.browser, catalog=self.catalog, url="http://localhost/form")
+    
+    def test_separate_from_sync_session(self):
+        self.assertFalse(issubclass(AsyncSession, Session))
+        self.assertFalse(issubclass(AsyncFormGateway, FormGateway))
+        for name in ("replay", "_replay_step", "_identify_page", "__enter__", "is_alive"):
+            self.assertFalse(hasattr(AsyncSession, name), name)
+        #
+    
+    async def test_fingerprint(self):
+        sess = self.make_session(dict())
+        await sess.start()
+        self.page.locator.return_value.evaluate.return_value = "INPUT:firstName:#"
+        
+        self.assertEqual(len(await sess.proxies.fingerprint()), 40)
+    
+    async def test_provided_browser_left_running(self):
+        async with self.make_session(dict()) as sess:
+            self.page.goto.assert_awaited_once_with("http://localhost/form")
+            self.assertTrue(all(isinstance(proxy, AsyncProxy) for proxy in sess.proxies.values()))
+        
+        self.context.close.assert_awaited_once()
+        self.browser.close.assert_not_called()
+    
+    async def test_fill_falls_back_to_proxies(self):
+        sess = self.make_session(dict(a="foo", b="bar", c="baz"))
+        proxy_b = MagicMock(set_value=AsyncMock())
+        sess.proxies = MagicMock()
+        sess.proxies.present_fields = AsyncMock(return_value=["a", "b", "d"])
+        sess.proxies.fill_values = AsyncMock(return_value=dict(a=True, b=False))
+        sess.proxies.__getitem__.return_value = proxy_b
+        
+        await sess.fill_fields_on_current_page()
+        
+        # Fields which aren't present, or have no data, are skipped
+        sess.proxies.fill_values.assert_awaited_once_with(dict(a="foo", b="bar"))
+        proxy_b.set_value.assert_awaited_once_with("bar")
+        self.assertEqual(sess.saved_fields, {"a", "b"})
+    
+    async def test_failed_bulk_fill_falls_back_to_proxies(self):
+        sess = self.make_session(dict(a="foo", b="bar"))
+        proxy = MagicMock(set_value=AsyncMock())
+        sess.proxies = MagicMock()
+        sess.proxies.present_fields = AsyncMock(return_value=["a", "b"])
+        sess.proxies.fill_values = AsyncMock(side_effect=Exception("Execution context was destroyed"))
+        sess.proxies.__getitem__.return_value = proxy
+        
+        with self.assertLogs(async_fill_form.logger, level="WARNING"):
+            await sess.fill_fields_on_current_page()
+        
+        self.assertEqual([c.args for c in proxy.set_value.await_args_list], [("foo",), ("bar",)])
+        self.assertEqual(sess.saved_fields, {"a", "b"})
+    
+    def make_filling_session(self, fields: list[str]) -> AsyncSession:
+        """Makes a session with stand-ins for the gateway, where every page has the same fields"""
+        
+        sess = self.make_session(dict(a="foo"))
+        sess.page = MagicMock()
+        sess.transitions = MagicMock(mark=AsyncMock(), wait=AsyncMock(return_value=False))
+        sess.proxies = MagicMock()
+        sess.proxies.presence = AsyncMock()
+        sess.proxies.signature = AsyncMock(return_value=1)
+        sess.proxies.present_fields = AsyncMock(return_value=fields)
+        sess.fill_fields_on_current_page = AsyncMock(side_effect=lambda presence: sess.saved_fields.add("a"))
+        sess.read_fields_on_current_page = AsyncMock()
+        sess._current_title = AsyncMock(return_value=None)
+        sess.next_page = AsyncMock()
+        sess.wait_for_user_next = AsyncMock()
+        sess.is_last_page = AsyncMock(side_effect=[False, False, True])
+        sess.process_submit_page = AsyncMock()
+        return sess
+    
+    async def test_unfilled_field_raises(self):
+        sess = self.make_filling_session(["a", "b"])
+        with self.assertRaisesRegex(FillError, "'b'"):
+            await sess.fill()
+        
+        sess.wait_for_user_next.assert_not_awaited()
+    
+    async def test_page_not_changing_raises(self):
+        sess = self.make_filling_session(["a"])
+        with self.assertRaises(FillError):
+            await sess.fill()
+        
+        # The page isn't probed over and over, but watched for changes in the browser
+        sess.next_page.assert_awaited_once()
+        self.assertEqual(sess.proxies.presence.await_count, 3)
+        sess.transitions.wait.assert_awaited_once_with(timeout=sess.transition_timeout)
+    
+    async def test_page_changing_completes(self):
+        sess = self.make_filling_session(["a"])
+        sess.transitions.wait.return_value = True
+        await sess.fill(timeout=60)
+        
+        sess.process_submit_page.assert_awaited_once()
+        sess.page.set_default_timeout.assert_called_once_with(60000)
+    
+    async def test_failed_proxy_logged(self):
+        sess = self.make_session(dict(a="foo"))
+        sess.proxies = MagicMock()
+        sess.proxies.present_fields = AsyncMock(return_value=["a"])
+        sess.proxies.fill_values = AsyncMock(return_value=dict(a=False))
+        sess.proxies.__getitem__.return_value.set_value = AsyncMock(side_effect=RuntimeError("boom"))
+        
+        with self.assertLogs(async_fill_form.logger, level="ERROR"):
+            await sess.fill_fields_on_current_page()
+        
+        # Not retried on the next pass over the page
+        self.assertEqual(sess.saved_fields, {"a"})
+    #
+
+
+class StubSession:
+    """Stands in for AsyncSession, keeping track of how many sessions are filling at once"""
+    
+    active = 0
+    max_active = 0
+    instances: list["StubSession"] = []
+    
+    def __init__(self, data: dict, browser=None, catalog=None, url=None):
+        self.data = data
+        self.browser = browser
+        self.catalog = catalog
+        StubSession.instances.append(self)
+    
+    async def __aenter__(self):
+        StubSession.active += 1
+        StubSession.max_active = max(StubSession.max_active, StubSession.active)
+        return self
+    
+    async def __aexit__(self, *args):
+        StubSession.active -= 1
+    
+    async def fill(self, auto_submit: bool=False, interactive: bool=True, timeout: float=None) -> dict:
+        self.interactive = interactive
+        await asyncio.sleep(0.01)
+        if self.data.get("fail"):
+            raise RuntimeError(self.data["name"])
+        return dict(user_first_name=self.data["name"])
+    #
+
+
+class TestFillConcurrently(IsolatedAsyncioTestCase):
+    def setUp(self):
+        StubSession.active = StubSession.max_active = 0
+        StubSession.instances = []
+        self.browser = MagicMock(close=AsyncMock())
+        playwright = MagicMock()
+        playwright.chromium.launch = AsyncMock(return_value=self.browser)
+        
+        @asynccontextmanager
+        async def fake_async_playwright():
+            yield playwright
+        
+        self.enterContext(patch.object(async_fill_form, "async_playwright", fake_async_playwright))
+        self.enterContext(patch.object(async_fill_form, "AsyncSession", StubSession))
+    
+    async def test_results_in_order(self):
+        fill_data = [dict(name=f"user {i}", fail=i == 2) for i in range(6)]
+        catalog = MagicMock()
+        res = await fill_concurrently(fill_data, max_concurrency=2, catalog=catalog)
+        
+        self.assertEqual(len(res), 6)
+        for i, r in enumerate(res):
+            if i == 2:
+                self.assertIsInstance(r, RuntimeError)
+            else:
+                self.assertEqual(r, dict(user_first_name=f"user {i}"))
+            #
+        
+        self.assertEqual(StubSession.max_active, 2)
+        # All sessions share the browser and the catalog
+        self.assertTrue(all(s.browser is self.browser and s.catalog is catalog for s in StubSession.instances))
+        self.assertFalse(any(s.interactive for s in StubSession.instances))
+        self.browser.close.assert_awaited_once()
+    #
@@ -1,19 +1,54 @@
 import functools
+from pathlib import Path
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
 
 from pillepas.automation.utils import make_example_form_values
 from pillepas.automation.fill_form import Session
+from pillepas.automation.form_gateway import FormGateway
+from pillepas.automation.standin import StandinServer
+from pillepas.persistence.catalog import OptionCatalog
+from pillepas.persistence.form_map import FormMap
 
 
 class FormTester(TestCase):
     headless = True
+    # Whether to run against the local stand-in of the form, rather than the real one
+    use_standin = True
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.server = None
+        if cls.use_standin:
+            cls.server = StandinServer()
+            cls.server.start()
+        return super().setUpClass()
+    
+    @classmethod
+    def tearDownClass(cls):
+        if cls.server is not None:
+            cls.server.stop()
+        return super().tearDownClass()
     
     def get_fill_vals(self):
         return make_example_form_values()
     
     def setUp(self):
         self.vals = self.get_fill_vals()
-        self.session = Session(self.vals, headless=self.headless)
+        url = None if self.server is None else self.server.url
+        
+        # Keep the options and pages seen during tests out of the user's cache
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+        self.session = Session(
+            self.vals,
+            headless=self.headless,
+            url=url,
+            catalog=OptionCatalog(path=self.dir / "catalog.json"),
+            form_map=FormMap(path=self.dir / "map.json")
+        )
         self.session.start()
         return super().setUp()
 
@@ -38,8 +73,76 @@ class TestFormFill(FormTester):
                 print(msg)
             #
         #
+    
+    def test_submit(self):
+        if self.server is None:
+            self.skipTest("Only submit to the stand-in form")
+        
+        self.session.fill(auto_click_next=True, auto_submit=True, wait_for_user=False, interactive=False)
+        self.session.page.get_by_text("Tak for din bestilling").wait_for()
+        
+        submission = self.server.submissions[-1]
+        self.assertEqual(self.vals["user_passport_number"], submission["passportNumber"])
+        self.assertEqual([d.isoformat() for d in self.vals["dates"]], submission["dates"])
+    #
+
+
+# Counts the form's submissions, and clicks the next button from the page's side once the listener from add_wait
+# is in place, like a user would
+_click_next_js = """([buttonText, clickedVar]) => {
+    window.__submits = 0;
+    document.querySelector('form').addEventListener('submit', () => window.__submits++);
+    const timer = setInterval(() => {
+        if (!eval(clickedVar)) {
+            return;
+        }
+        clearInterval(timer);
+        Array.from(document.querySelectorAll('button')).find(el => el.textContent.trim() === buttonText).click();
+    }, 50);
+}"""
+
+
+class TestUserClicksNext(FormTester):
+    def test_read_before_navigation(self):
+        if self.server is None:
+            self.skipTest("Only click through the stand-in form")
+        
+        sess = self.session
+        sess.fill_fields_on_current_page()
+        first_title = sess._current_title()
+        
+        # Record the state of the page when the fields are read
+        at_read = dict()
+        read = sess.read_fields_on_current_page
+        def read_and_record(*args, **kwargs):
+            at_read["title"] = sess._current_title()
+            at_read["submits"] = sess.page.evaluate("window.__submits")
+            return read(*args, **kwargs)
+        sess.read_fields_on_current_page = read_and_record
+        
+        sess.page.evaluate(_click_next_js, [sess.next_button_text, sess.user_clicked_next_var])
+        sess.wait_for_user_next()
+        
+        # The click was held back until the fields had been read
+        self.assertEqual(at_read, dict(title=first_title, submits=0))
+        self.assertIn("dates", sess.read_fields)
+        
+        # Then delivered, once
+        sess.page.locator("#page-title").filter(has_text="Medicin").wait_for()
+        self.assertEqual(sess.page.evaluate("window.__submits"), 1)
     #
-   
+
+
+class TestFieldSpecFormFill(TestFormFill):
+    """Runs the form tests with proxies built from the field specification rather than the hand-written factory"""
+    
+    def setUp(self):
+        patcher = patch.object(FormGateway, "use_field_spec", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return super().setUp()
+    #
+
 
 if __name__ == '__main__':
     class TestVisible(TestFormFill):
@@ -0,0 +1,141 @@
+import csv
+import datetime
+import json
+from pathlib import Path
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import TestCase
+from unittest.mock import patch
+
+import yaml
+
+from pillepas.automation import batch
+from pillepas.automation.batch import _run_job, load_profiles, run_batch
+from pillepas.automation.utils import make_example_form_values
+
+
+class TestLoadProfiles(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.folder = Path(tempdir.name)
+        self.vals = make_example_form_values()
+    
+    def test_yaml(self):
+        path = self.folder / "profiles.yaml"
+        d = dict(self.vals, dates=list(self.vals["dates"]))
+        path.write_text(yaml.safe_dump([d, d], allow_unicode=True), encoding="utf-8")
+        
+        profiles = load_profiles(path)
+        self.assertEqual([self.vals, self.vals], profiles)
+    
+    def test_csv(self):
+        path = self.folder / "profiles.csv"
+        start, end = self.vals["dates"]
+        row = dict(self.vals, dates=f"{start.isoformat()}/{end.isoformat()}", medicine=json.dumps(self.vals["medicine"]))
+        
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+            writer.writeheader()
+            writer.writerow(row)
+        #
+        
+        profiles = load_profiles(path)
+        self.assertEqual([self.vals], profiles)
+        self.assertIsInstance(profiles[0]["dates"][0], datetime.date)
+    #
+
+
+class StubSession:
+    """Stands in for Session, without a browser. Fails on start or fill if the fill data say so."""
+    
+    instances = []
+    
+    def __init__(self, fill_data: dict, browser=None, url=None):
+        self.fill_data = fill_data
+        self.read_fields = dict(fill_data)
+        self.stopped = False
+        StubSession.instances.append(self)
+    
+    def start(self):
+        if self.fill_data.get("fail") == "start":
+            raise RuntimeError("Could not start")
+        #
+    
+    def fill(self, **kwargs):
+        self.fill_kwargs = kwargs
+        if self.fill_data.get("fail") == "fill":
+            raise RuntimeError("Could not fill")
+        #
+    
+    def stop(self):
+        self.stopped = True
+    #
+
+
+class InlineExecutor:
+    """Stands in for the process pool, running jobs right away. Jobs for profiles marked with 'crash' fail as if
+    their worker process died."""
+    
+    def __init__(self, **kwargs):
+        pass
+    
+    def submit(self, fn, index, profile, *args):
+        future = Future()
+        if profile.get("crash"):
+            future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+        else:
+            future.set_result(fn(index, profile, *args))
+        return future
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        pass
+    #
+
+
+class TestRunBatch(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.results_path = Path(tempdir.name) / "results.jsonl"
+        
+        StubSession.instances = []
+        patcher = patch.object(batch, "Session", StubSession)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_run_job(self):
+        res = _run_job(3, dict(user_first_name="Namey"), auto_submit=False)
+        self.assertTrue(res["ok"])
+        self.assertEqual(res["index"], 3)
+        self.assertEqual(res["fields_read"], ["user_first_name"])
+        self.assertNotIn("Namey", json.dumps(res))
+        # Jobs never wait for a user
+        kwargs = StubSession.instances[-1].fill_kwargs
+        self.assertFalse(kwargs["interactive"] or kwargs["wait_for_user"])
+        self.assertEqual(kwargs["timeout"], batch.DEFAULT_JOB_TIMEOUT)
+    
+    def test_failed_start_stops_session(self):
+        for fail in ("start", "fill"):
+            res = _run_job(0, dict(fail=fail), auto_submit=False)
+            self.assertFalse(res["ok"])
+            self.assertIn(f"Could not {fail}", res["error"])
+            self.assertTrue(StubSession.instances[-1].stopped)
+        #
+    
+    def test_broken_pool_recorded(self):
+        profiles = [dict(a=1), dict(crash=True), dict(fail="fill"), dict(a=2)]
+        with patch.object(batch, "ProcessPoolExecutor", InlineExecutor):
+            summary = run_batch(profiles, self.results_path)
+        #
+        
+        self.assertEqual((summary["n_jobs"], summary["n_ok"], summary["n_failed"]), (4, 2, 2))
+        results = [json.loads(line) for line in self.results_path.read_text().splitlines()]
+        by_index = {res["index"]: res for res in results}
+        self.assertEqual(sorted(by_index), [0, 1, 2, 3])
+        self.assertIn("BrokenProcessPool", by_index[1]["error"])
+    #
@@ -0,0 +1,73 @@
+from unittest import TestCase
+
+from pillepas import tracing
+from pillepas.automation import timing
+from pillepas.automation.benchmark import aggregate, compare
+
+
+class TestTimings(TestCase):
+    def test_nothing_recorded_when_inactive(self):
+        timings = timing.Timings()
+        with tracing.span("Session.fill", category="phase", timed="fill"):
+            pass
+        timing.record("page", "1", 1.0)
+        self.assertEqual(timings.totals(), dict())
+    
+    def test_records_while_active(self):
+        timings = timing.Timings()
+        with timing.recording(timings):
+            with tracing.span("Session.fill", category="phase", timed="fill"):
+                pass
+            timing.record("phase", "fill", 1.0)
+            timing.record("page", "1", 2.0)
+        
+        self.assertEqual(timings.counts(), dict(phase=dict(fill=2), page={"1": 1}))
+        self.assertGreaterEqual(timings.totals()["phase"]["fill"], 1.0)
+        
+        # Recording stops when leaving the block
+        timing.record("page", "1", 2.0)
+        self.assertEqual(timings.counts()["page"]["1"], 1)
+    
+    def test_nested_blocks_recorded_separately(self):
+        timings = timing.Timings()
+        with timing.recording(timings):
+            with tracing.span("a", category="proxy", timed="MedicineProxy"), tracing.span("b", category="phase", timed="fill"):
+                with tracing.span("c", category="proxy", timed="AutocompleteProxy"):
+                    pass
+                #
+            with tracing.span("d", category="proxy", timed="Proxy"):
+                pass
+            #
+        
+        counts = timings.counts()
+        self.assertEqual(counts["proxy"], dict(MedicineProxy=1, Proxy=1))
+        self.assertEqual(counts["proxy" + timing.NESTED_SUFFIX], dict(AutocompleteProxy=1))
+        self.assertEqual(counts["phase"], dict(fill=1))
+    #
+
+
+class TestCompare(TestCase):
+    def setUp(self):
+        runs = [dict(phase=dict(fill=1.0, read=0.5)), dict(phase=dict(fill=3.0, read=0.5))]
+        self.baseline = dict(n_runs=2, timings=aggregate(runs))
+    
+    def test_aggregate(self):
+        stats = self.baseline["timings"]["phase"]["fill"]
+        self.assertEqual(stats, dict(mean=2.0, median=2.0, min=1.0, max=3.0))
+    
+    def test_no_regression_against_self(self):
+        self.assertEqual(compare(self.baseline, self.baseline), [])
+    
+    def test_flags_regression(self):
+        current = dict(n_runs=1, timings=aggregate([dict(phase=dict(fill=2.1, read=1.0), page={"1": 5.0})]))
+        regressions = compare(current, self.baseline, threshold=0.1)
+        self.assertEqual([(r["category"], r["name"]) for r in regressions], [("phase", "read")])
+    
+    def test_zero_baseline(self):
+        baseline = dict(n_runs=1, timings=aggregate([dict(phase=dict(fill=0.0))]))
+        current = dict(n_runs=1, timings=aggregate([dict(phase=dict(fill=1.0))]))
+        regressions = compare(current, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0]["change"], float("inf"))
+        self.assertEqual(compare(baseline, baseline), [])
+    #
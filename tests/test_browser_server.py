@@ -0,0 +1,140 @@
+import json
+import os
+from pathlib import Path
+import stat
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pillepas import config
+from pillepas.automation import browser_server
+from pillepas.automation.browser_server import claim_spare_page, ensure_server, SPARE_PAGE_MARKER, stop_server
+
+
+class TestServer(TestCase):
+    """Runs the server functions against a fake browser process, which writes its port when started"""
+    
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        state_path = Path(tempdir.name) / "browser_server.json"
+        self.enterContext(patch.object(config, "BROWSER_SERVER_STATE_PATH", state_path))
+        
+        self.running: set[int] = set()
+        self.launches: list[list[str]] = []
+        self.popen = self.enterContext(patch.object(browser_server.subprocess, "Popen", side_effect=self._launch))
+        self.enterContext(patch.object(browser_server, "server_is_running", side_effect=self._is_running))
+        
+        self.playwright = MagicMock()
+        self.playwright.chromium.executable_path = "chromium"
+        self.playwright.chromium.connect_over_cdp.return_value.new_browser_cdp_session.return_value.send.side_effect = (
+            lambda _: self.running.clear()
+        )
+        self.addCleanup(stop_server, self.playwright)
+    
+    def _launch(self, args: list[str], **kwargs):
+        self.launches.append(args)
+        port = 40000 + len(self.launches)
+        profile_dir = Path(next(a for a in args if a.startswith("--user-data-dir=")).split("=", 1)[1])
+        (profile_dir / "DevToolsActivePort").write_text(f"{port}\n/devtools/browser/abc")
+        self.running.add(port)
+    
+    def _is_running(self, port: int=None) -> bool:
+        if port is None:
+            port = json.loads(config.BROWSER_SERVER_STATE_PATH.read_text())["port"]
+        return port in self.running
+    
+    def _profile_dir(self) -> Path:
+        return Path(json.loads(config.BROWSER_SERVER_STATE_PATH.read_text())["profile_dir"])
+    
+    def test_random_port_and_private_profile(self):
+        endpoint = ensure_server(self.playwright)
+        
+        args = self.launches[0]
+        self.assertIn("--remote-debugging-port=0", args)
+        self.assertEqual(endpoint, "http://127.0.0.1:40001")
+        
+        # Only the user can read the profile and the state file with the port
+        profile_dir = self._profile_dir()
+        self.assertIn(f"--user-data-dir={profile_dir}", args)
+        self.assertEqual(stat.S_IMODE(os.stat(profile_dir).st_mode), 0o700)
+        self.assertEqual(stat.S_IMODE(os.stat(config.BROWSER_SERVER_STATE_PATH).st_mode), 0o600)
+    
+    def test_running_server_reused(self):
+        endpoint = ensure_server(self.playwright)
+        self.assertEqual(ensure_server(self.playwright), endpoint)
+        self.assertEqual(len(self.launches), 1)
+    
+    def test_stop_deletes_profile(self):
+        ensure_server(self.playwright)
+        profile_dir = self._profile_dir()
+        stop_server(self.playwright)
+        
+        self.assertFalse(self.running)
+        self.assertFalse(profile_dir.exists())
+        self.assertFalse(config.BROWSER_SERVER_STATE_PATH.exists())
+    
+    def test_stale_server_replaced(self):
+        ensure_server(self.playwright)
+        old_profile_dir = self._profile_dir()
+        self.running.clear()
+        
+        self.assertEqual(ensure_server(self.playwright), "http://127.0.0.1:40002")
+        self.assertFalse(old_profile_dir.exists())
+        self.assertNotEqual(self._profile_dir(), old_profile_dir)
+    
+    def test_timeout(self):
+        self.popen.side_effect = lambda args, **kwargs: self.launches.append(args)
+        with patch.object(browser_server.time, "sleep"), self.assertRaises(RuntimeError):
+            ensure_server(self.playwright, timeout=0)
+        
+        self.assertFalse(config.BROWSER_SERVER_STATE_PATH.exists())
+    #
+
+
+def make_page(url: str, spare: bool) -> MagicMock:
+    page = MagicMock()
+    page.url = url
+    page.window_name = SPARE_PAGE_MARKER if spare else ""
+    
+    def evaluate(js, marker):
+        res = page.window_name == marker
+        if res:
+            page.window_name = ""
+        return res
+    
+    page.evaluate.side_effect = evaluate
+    return page
+
+
+class TestClaimSparePage(TestCase):
+    url = "https://example.com/form"
+    
+    def test_redirected_page_claimed(self):
+        page = make_page("https://example.com/form/session/123?step=1", spare=True)
+        context = MagicMock(pages=[page])
+        
+        self.assertIs(claim_spare_page(context, self.url), page)
+        # Unmarked, so no other session claims it as well
+        self.assertIsNone(claim_spare_page(context, self.url))
+    
+    def test_other_origins_ignored(self):
+        pages = [
+            make_page("https://example.com.evil.org/form", spare=True),
+            make_page("http://example.com/form", spare=True),
+            make_page("about:blank", spare=True),
+        ]
+        context = MagicMock(pages=pages)
+        
+        self.assertIsNone(claim_spare_page(context, self.url))
+        for page in pages:
+            page.evaluate.assert_not_called()
+        #
+    
+    def test_pages_in_use_skipped(self):
+        in_use = make_page(self.url, spare=False)
+        spare = make_page(self.url, spare=True)
+        context = MagicMock(pages=[in_use, spare])
+        
+        self.assertIs(claim_spare_page(context, self.url), spare)
+    #
@@ -0,0 +1,67 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+
+from pillepas.crypto import Cryptor
+from pillepas.persistence.catalog import OptionCatalog
+
+
+class TestOptionCatalog(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.path = Path(tempdir.name) / "options.json"
+        
+        self.options = [
+            "Elvanse, kapsler, hårde, 20 mg 'Takeda Pharma'",
+            "Elvanse, kapsler, hårde, 40 mg 'Takeda Pharma'",
+            "Ritalin, tabletter, 10 mg 'Novartis'",
+        ]
+        self.catalog = OptionCatalog(path=self.path)
+        self.catalog.add("drug", self.options)
+    
+    def test_options_persist(self):
+        other = OptionCatalog(path=self.path)
+        self.assertEqual(set(self.options), other.options("drug"))
+    
+    def test_concurrent_catalogs_merged(self):
+        other = OptionCatalog(path=self.path)
+        self.catalog.add("doctor", ["Dr. Hansen"])
+        other.add("drug", ["Concerta, depottabletter, 18 mg 'Janssen'"])
+        
+        merged = OptionCatalog(path=self.path)
+        self.assertEqual(merged.options("doctor"), {"Dr. Hansen"})
+        self.assertEqual(merged.options("drug"), set(self.options) | {"Concerta, depottabletter, 18 mg 'Janssen'"})
+    
+    def test_encrypted(self):
+        path = self.path.with_name("encrypted.json")
+        cryptor = Cryptor("hunter2", parallelize=False)
+        OptionCatalog(path=path, cryptor=cryptor).add("drug", self.options)
+        
+        self.assertNotIn(b"Elvanse", path.read_bytes())
+        self.assertEqual(OptionCatalog(path=path, cryptor=cryptor).options("drug"), set(self.options))
+        # Without the right cryptor, the catalog starts from scratch
+        with self.assertLogs("pillepas.persistence.catalog", level="WARNING"):
+            self.assertEqual(OptionCatalog(path=path).options("drug"), set())
+        #
+    
+    def test_prefix_is_unique(self):
+        for value in self.options:
+            prefix = self.catalog.shortest_unique_prefix("drug", value)
+            self.assertTrue(value.startswith(prefix))
+            others = [opt for opt in self.options if opt != value]
+            self.assertFalse(any(prefix.casefold() in opt.casefold() for opt in others))
+        #
+    
+    def test_prefix_respects_min_length(self):
+        prefix = self.catalog.shortest_unique_prefix("drug", self.options[2], min_length=3)
+        self.assertEqual("Rit", prefix)
+    
+    def test_unknown_value_gives_none(self):
+        self.assertIsNone(self.catalog.shortest_unique_prefix("drug", "Panodil"))
+        self.assertIsNone(self.catalog.shortest_unique_prefix("pharmacy_address", self.options[0]))
+    
+    def test_value_contained_in_other_option(self):
+        self.catalog.add("drug", ["Elvanse", "Elvanse forte"])
+        self.assertEqual("Elvanse", self.catalog.shortest_unique_prefix("drug", "Elvanse"))
+    #
@@ -0,0 +1,52 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from pillepas.automation import proxy_classes
+from pillepas.automation.proxy_classes import DateSelectorProxy
+
+
+class TestDateSelectorProxy(TestCase):
+    def setUp(self):
+        self.proxy = DateSelectorProxy(MagicMock(), key="dates")
+        self.date = datetime.date(2025, 8, 14)
+    
+    def test_parse(self):
+        raw = "25. apr. 2025 - 2. maj 2025"
+        expected = (datetime.date(2025, 4, 25), datetime.date(2025, 5, 2))
+        self.assertEqual(self.proxy.convert_read(raw), expected)
+        
+        # Parsing again hits the cache
+        hits = proxy_classes._parse_short_date.cache_info().hits
+        self.assertEqual(self.proxy.convert_read(raw), expected)
+        self.assertEqual(proxy_classes._parse_short_date.cache_info().hits, hits + 2)
+    
+    def test_parse_missing(self):
+        self.assertIsNone(self.proxy.convert_read(None))
+    
+    def test_jump_args(self):
+        target, months, max_clicks = self.proxy._jump_args(self.date)
+        self.assertEqual(months[target % 12], "august")
+        self.assertEqual(target // 12, 2025)
+        self.assertEqual(max_clicks, self.proxy.max_months_ahead)
+    
+    def test_jumps_in_single_evaluation(self):
+        dialog = self.proxy.e.page.get_by_role.return_value.filter.return_value
+        dialog.evaluate.return_value = 3
+        self.proxy.scroll_to_date(self.date)
+        
+        dialog.evaluate.assert_called_once()
+        pane = dialog.get_by_label.return_value
+        pane.count.assert_not_called()
+        pane.get_by_role.assert_called_once_with("gridcell", name="14", exact=True)
+    
+    def test_falls_back_to_scrolling(self):
+        dialog = self.proxy.e.page.get_by_role.return_value.filter.return_value
+        dialog.evaluate.return_value = None
+        pane = dialog.get_by_label.return_value
+        pane.count.side_effect = [0, 0, 1]
+        self.proxy.scroll_to_date(self.date)
+        
+        self.assertEqual(pane.count.call_count, 3)
+        self.assertEqual(dialog.get_by_role.return_value.click.call_count, 2)
+    #
@@ -0,0 +1,104 @@
+import json
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pillepas.automation import field_spec, form_gateway
+from pillepas.automation.field_spec import compile_spec, compiled_proxy_factory, FIELDS_PATH, load_spec, SpecError
+from pillepas.automation.form_gateway import FormGateway
+from pillepas.automation.make_proxies import proxy_factory
+from pillepas.automation.proxy_classes import AutocompleteProxy, MedicineProxy
+
+
+class TestFieldSpec(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+        self.cache_path = self.dir / "cache.json"
+    
+    def test_matches_hand_written_factory(self):
+        spec = compile_spec(FIELDS_PATH.read_bytes())
+        compiled = dict(compiled_proxy_factory(MagicMock(), spec=spec))
+        hand_written = dict(proxy_factory(MagicMock()))
+        
+        self.assertEqual(set(compiled), set(hand_written))
+        for key, proxy in compiled.items():
+            self.assertIs(type(proxy), type(hand_written[key]), key)
+            self.assertEqual(proxy.sensitive, hand_written[key].sensitive, key)
+        #
+        
+        self.assertEqual(list(compiled["medicine"]._sub_proxies), list(hand_written["medicine"]._sub_proxies))
+    
+    def test_selectors(self):
+        proxies = dict(compiled_proxy_factory(MagicMock(), spec=compile_spec(FIELDS_PATH.read_bytes())))
+        self.assertEqual(proxies["user_first_name"].selector, '[name="firstName"]')
+        self.assertEqual(
+            proxies["doctor_first_name"].selector,
+            '[name^="medication."][name$=".doctorInformation.firstName"]'
+        )
+        
+        # The doctor's information isn't repeated for each medication, but should match it in any row, like the
+        # hand-written factory does
+        for key, proxy in proxies.items():
+            if key.startswith("doctor_"):
+                self.assertTrue(proxy.selector.startswith('[name^="medication."]'), key)
+            #
+        #
+        
+        # Fields repeated for each medication should match all rows
+        medicine = proxies["medicine"]
+        self.assertIsInstance(medicine, MedicineProxy)
+        drug = medicine._sub_proxies["drug"]
+        self.assertIsInstance(drug, AutocompleteProxy)
+        self.assertEqual(drug.selector, '[name^="medication."][name$=".drug"]')
+    
+    def test_invalid_spec(self):
+        with self.assertRaises(SpecError):
+            compile_spec(b"base:\n  - key: foo\n    name: foo\n    proxy: NotAProxy\n")
+        with self.assertRaises(SpecError):
+            compile_spec(b"base:\n  - key: foo\n")
+        with self.assertRaises(SpecError):
+            compile_spec(b"stuff:\n  - key: foo\n    name: foo\n")
+    
+    def test_cache(self):
+        path = self.dir / "fields.yaml"
+        path.write_text("base:\n  - key: foo\n    name: foo\n")
+        
+        spec = load_spec(path=path, cache_path=self.cache_path)
+        self.assertEqual([f["key"] for f in spec], ["foo"])
+        self.assertEqual(json.loads(self.cache_path.read_text())["fields"], spec)
+        
+        # The cached version is used while the YAML file is unchanged
+        with patch.object(field_spec, "compile_spec", side_effect=AssertionError):
+            self.assertEqual(load_spec(path=path, cache_path=self.cache_path), spec)
+        
+        # Changing the YAML file invalidates the cache
+        path.write_text("base:\n  - key: bar\n    name: bar\n")
+        spec = load_spec(path=path, cache_path=self.cache_path)
+        self.assertEqual([f["key"] for f in spec], ["bar"])
+        
+        # So does a new compiler version
+        with patch.object(field_spec, "COMPILER_VERSION", field_spec.COMPILER_VERSION + 1):
+            with patch.object(field_spec, "compile_spec", wraps=compile_spec) as compile_:
+                load_spec(path=path, cache_path=self.cache_path)
+            #
+            self.assertEqual(compile_.call_count, 1)
+        #
+    
+    def test_stale_spec_falls_back(self):
+        stale = [dict(key="foo", proxy="Proxy")]
+        with patch.object(FormGateway, "use_field_spec", True), patch.object(form_gateway, "load_spec", return_value=stale):
+            with self.assertLogs(form_gateway.logger, level="WARNING"):
+                gateway = FormGateway(MagicMock())
+            #
+        #
+        
+        self.assertEqual(set(gateway), set(dict(proxy_factory(MagicMock()))))
+    
+    def test_hand_written_by_default(self):
+        with patch.object(form_gateway, "load_spec", side_effect=AssertionError):
+            FormGateway(MagicMock())
+        #
+    #
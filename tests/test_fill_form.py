@@ -0,0 +1,117 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from pillepas.automation import fill_form
+from pillepas.automation.fill_form import FillError, Session
+from pillepas.automation.fill_plan import FillPlan
+from pillepas.persistence.catalog import OptionCatalog
+from pillepas.persistence.form_map import FormMap
+
+
+class TestNonInteractiveFill(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+    
+    def make_session(self, fill_data: dict, fields: list[str]) -> Session:
+        """Makes a session with stand-ins for everything which would talk to the browser. Every page has
+        the same fields."""
+        
+        sess = Session(
+            fill_data,
+            catalog=OptionCatalog(path=self.dir / "catalog.json"),
+            form_map=FormMap(path=self.dir / "map.json")
+        )
+        sess.page = MagicMock()
+        sess.plan = FillPlan(layout="abc")
+        sess.transitions = MagicMock()
+        sess.proxies = MagicMock()
+        sess.proxies.present_fields.return_value = fields
+        sess._identify_page = MagicMock(return_value=(dict(), 1, None, "fp1"))
+        sess.fill_fields_on_current_page = MagicMock(
+            side_effect=lambda presence: sess.saved_fields.update(k for k in fields if k in fill_data)
+        )
+        sess.read_fields_on_current_page = MagicMock()
+        sess.wait_for_user_next = MagicMock()
+        sess.next_page = MagicMock()
+        sess.is_last_page = MagicMock(side_effect=[False, False, True])
+        sess.process_submit_page = MagicMock()
+        return sess
+    
+    def test_unfilled_field_raises(self):
+        sess = self.make_session(dict(user_first_name="Namey"), ["user_first_name", "user_last_name"])
+        with self.assertRaisesRegex(FillError, "user_last_name") as ctx:
+            sess.fill(auto_click_next=True, wait_for_user=False, interactive=False)
+        
+        sess.wait_for_user_next.assert_not_called()
+        # The values aren't part of the error
+        self.assertNotIn("Namey", str(ctx.exception))
+    
+    def test_page_not_changing_raises(self):
+        sess = self.make_session(dict(user_first_name="Namey"), ["user_first_name"])
+        sess.transitions.wait.return_value = False
+        with self.assertRaises(FillError):
+            sess.fill(auto_click_next=True, wait_for_user=False, interactive=False)
+        
+        # The page was left once, then didn't change
+        sess.next_page.assert_called_once()
+        sess.transitions.wait.assert_called_once_with(timeout=sess.transition_timeout)
+    
+    def test_page_changing_completes(self):
+        sess = self.make_session(dict(user_first_name="Namey"), ["user_first_name"])
+        sess.transitions.wait.return_value = True
+        sess.fill(auto_click_next=True, wait_for_user=False, interactive=False, timeout=60)
+        
+        sess.process_submit_page.assert_called_once()
+        sess.page.set_default_timeout.assert_called_once_with(60000)
+    
+    def test_timeout(self):
+        sess = self.make_session(dict(user_first_name="Namey"), ["user_first_name"])
+        with self.assertRaisesRegex(FillError, "took more than"):
+            sess.fill(auto_click_next=True, wait_for_user=False, interactive=False, timeout=-1)
+        #
+    
+    def test_interactive_waits_for_user(self):
+        sess = self.make_session(dict(user_first_name="Namey"), ["user_first_name", "user_last_name"])
+        sess.transitions.wait.return_value = True
+        sess.fill(auto_click_next=True, wait_for_user=False)
+        
+        sess.wait_for_user_next.assert_called_once()
+        sess.transitions.wait.assert_called_once_with(timeout=None)
+    #
+
+
+class TestBulkFill(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+        
+        self.sess = Session(
+            dict(a="foo", b="bar"),
+            catalog=OptionCatalog(path=self.dir / "catalog.json"),
+            form_map=FormMap(path=self.dir / "map.json")
+        )
+        self.proxy = MagicMock()
+        self.sess.proxies = MagicMock()
+        self.sess.proxies.present_fields.return_value = ["a", "b"]
+        self.sess.proxies.__getitem__.return_value = self.proxy
+    
+    def test_failed_fields_fall_back_to_proxies(self):
+        self.sess.proxies.fill_values.return_value = dict(a=True, b=False)
+        self.sess.fill_fields_on_current_page()
+        
+        self.proxy.set_value.assert_called_once_with("bar")
+        self.assertEqual(self.sess.saved_fields, {"a", "b"})
+    
+    def test_failed_bulk_fill_falls_back_to_proxies(self):
+        self.sess.proxies.fill_values.side_effect = Exception("Execution context was destroyed")
+        with self.assertLogs(fill_form.logger, level="WARNING"):
+            self.sess.fill_fields_on_current_page()
+        
+        self.assertEqual([c.args for c in self.proxy.set_value.call_args_list], [("foo",), ("bar",)])
+        self.assertEqual(self.sess.saved_fields, {"a", "b"})
+    #
@@ -0,0 +1,88 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from pillepas.automation.fill_form import Session
+from pillepas.automation.fill_plan import FillPlan
+from pillepas.persistence.catalog import OptionCatalog
+from pillepas.persistence.form_map import FormMap
+
+
+class TestFillPlan(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+        
+        self.plan = FillPlan(layout="abc")
+        self.plan.add_step("fp1", 1, ["user_first_name"], reprobe=False)
+        self.plan.add_step("fp2", 2, ["user_last_name"], reprobe=True)
+    
+    def make_session(self, fingerprints: list[str]) -> Session:
+        """Makes a session with stand-ins for everything which would talk to the browser"""
+        
+        sess = Session(
+            dict(user_first_name="Namey", user_last_name="McNameface"),
+            catalog=OptionCatalog(path=self.dir / "catalog.json"),
+            form_map=FormMap(path=self.dir / "map.json")
+        )
+        sess.plan = FillPlan(layout="abc")
+        sess.proxies = MagicMock()
+        sess.proxies.fingerprint.side_effect = fingerprints
+        sess.proxies.present_fields.side_effect = lambda presence: presence
+        sess.proxies.presence_from_fields.side_effect = lambda fields: fields
+        
+        def fill_fields(presence):
+            sess.saved_fields.update(presence)
+        
+        sess.fill_fields_on_current_page = MagicMock(side_effect=fill_fields)
+        sess.read_fields_on_current_page = MagicMock()
+        sess.next_page = MagicMock()
+        sess._identify_page = MagicMock(return_value=(["user_last_name"], 2, None, "fp2b"))
+        sess.fill = MagicMock()
+        return sess
+    
+    def test_save_and_load(self):
+        path = self.dir / "plan.json"
+        self.assertIsNone(FillPlan.load(path))
+        
+        self.plan.save(path)
+        loaded = FillPlan.load(path)
+        self.assertEqual(loaded.to_dict(), self.plan.to_dict())
+        self.assertNotIn("Namey", path.read_text())
+        
+        # Saving over an existing plan replaces it whole, without leaving temporary files behind
+        self.plan.add_step("fp3", 3, [], reprobe=False)
+        self.plan.save(path)
+        self.assertEqual(len(FillPlan.load(path)), 3)
+        self.assertEqual(list(self.dir.iterdir()), [path])
+    
+    def test_replay(self):
+        sess = self.make_session(["fp1", "fp2"])
+        sess.replay(self.plan, wait_for_user=False)
+        
+        self.assertEqual(sess.next_page.call_count, 2)
+        self.assertEqual(sess._identify_page.call_count, 1)  # Only the step which needs it is probed again
+        self.assertEqual(sess.plan.to_dict(), self.plan.to_dict())
+        sess.fill.assert_called_once_with(
+            auto_click_next=True, auto_submit=False, wait_for_user=False, interactive=True, timeout=None
+        )
+    
+    def test_falls_back_on_mismatch(self):
+        sess = self.make_session(["fp1", "something else"])
+        sess.replay(self.plan, wait_for_user=False)
+        
+        self.assertEqual(sess.next_page.call_count, 1)
+        self.assertEqual(len(sess.plan), 1)
+        self.assertNotIn(2, sess.processed_pages_signatures)
+        sess.fill.assert_called_once()
+    
+    def test_ignores_plan_for_other_layout(self):
+        sess = self.make_session([])
+        sess.plan = FillPlan(layout="def")
+        sess.replay(self.plan, wait_for_user=False)
+        
+        sess.next_page.assert_not_called()
+        sess.fill.assert_called_once()
+    #
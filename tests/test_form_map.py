@@ -0,0 +1,62 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pillepas.automation.form_gateway import FormGateway
+from pillepas.persistence.form_map import FormMap
+
+
+class TestFormMap(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.path = Path(tempdir.name) / "form_map.json"
+        self.form_map = FormMap(path=self.path, layout="abc")
+        self.form_map.record("fp1", 42, ["user_first_name", "user_last_name"], title="Dine oplysninger")
+    
+    def test_entries_persist(self):
+        other = FormMap(path=self.path, layout="abc")
+        entry = other.lookup("fp1")
+        self.assertEqual(entry["signature"], 42)
+        self.assertEqual(entry["fields"], ["user_first_name", "user_last_name"])
+        self.assertEqual(entry["title"], "Dine oplysninger")
+        self.assertIsNone(other.lookup("fp2"))
+    
+    def test_interrupted_save_keeps_file(self):
+        with patch("os.replace", side_effect=OSError):
+            self.assertRaises(OSError, lambda: self.form_map.record("fp2", 43, ["user_first_name"]))
+        #
+        
+        other = FormMap(path=self.path, layout="abc")
+        self.assertIn("fp1", other)
+        self.assertNotIn("fp2", other)
+        self.assertEqual(list(self.path.parent.iterdir()), [self.path])
+    
+    def test_layout_change_discards_map(self):
+        other = FormMap(path=self.path, layout="def")
+        self.assertEqual(len(other), 0)
+    
+    def test_stale_fingerprints_dropped(self):
+        n = self.form_map.max_fingerprints_per_signature
+        for i in range(n):
+            self.form_map.record(f"new{i}", 42, ["user_first_name"])
+        
+        self.assertNotIn("fp1", self.form_map)
+        self.assertEqual(len(self.form_map), n)
+    
+    def test_recently_seen_fingerprints_kept(self):
+        n = self.form_map.max_fingerprints_per_signature
+        for i in range(n):
+            self.form_map.lookup("fp1")
+            self.form_map.record(f"new{i}", 42, ["user_first_name"])
+        
+        self.assertIn("fp1", self.form_map)
+        self.assertNotIn("new0", self.form_map)
+    
+    def test_presence_from_fields(self):
+        gateway = FormGateway(MagicMock())
+        presence = gateway.presence_from_fields(self.form_map.lookup("fp1")["fields"])
+        self.assertEqual(set(presence), set(gateway))
+        self.assertEqual({k for k, v in presence.items() if v}, {"user_first_name", "user_last_name"})
+    #
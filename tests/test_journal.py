@@ -0,0 +1,32 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+
+from pillepas.persistence.journal import Journal
+
+
+class TestJournal(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.journal = Journal(Path(tempdir.name) / "data.journal")
+    
+    def test_read_records(self):
+        self.assertEqual(self.journal.read(), ([], 0))
+        records = [b"foo", b"", b"barbaz"]
+        offsets = [self.journal.append(record) for record in records]
+        
+        self.assertEqual(self.journal.read(), (records, offsets[-1]))
+        self.assertEqual(self.journal.read(offsets[0]), (records[1:], offsets[-1]))
+        self.assertEqual(self.journal.size(), offsets[-1])
+    
+    def test_incomplete_record_ignored(self):
+        end = self.journal.append(b"foo")
+        with open(self.journal.path, "ab") as f:
+            f.write(b"\x00\x00\x00\x10bar")
+        
+        self.assertEqual(self.journal.read(), ([b"foo"], end))
+        self.journal.truncate(end)
+        self.journal.append(b"baz")
+        self.assertEqual(self.journal.read()[0], [b"foo", b"baz"])
+    #
@@ -0,0 +1,98 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from playwright.sync_api import Request, Response, Route
+
+from pillepas.automation.lean import NetworkFilter
+
+
+def make_route(url: str, resource_type: str="document") -> MagicMock:
+    request = MagicMock(spec=Request, url=url, resource_type=resource_type)
+    route = MagicMock(spec=Route, request=request)
+    return route
+
+
+def make_response(headers: dict) -> MagicMock:
+    return MagicMock(spec=Response, headers=headers)
+
+
+class TestNetworkFilter(TestCase):
+    def assertBlocked(self, filter_: NetworkFilter, route: MagicMock):
+        filter_._handle_route(route)
+        route.abort.assert_called_once_with("blockedbyclient")
+        route.continue_.assert_not_called()
+    
+    def assertAllowed(self, filter_: NetworkFilter, route: MagicMock):
+        filter_._handle_route(route)
+        route.continue_.assert_called_once_with()
+        route.abort.assert_not_called()
+    
+    def test_blocked_resource_types(self):
+        filter_ = NetworkFilter()
+        self.assertBlocked(filter_, make_route("https://example.com/logo.png", "image"))
+        self.assertBlocked(filter_, make_route("https://example.com/font.woff2", "font"))
+        self.assertAllowed(filter_, make_route("https://example.com/form", "document"))
+        self.assertAllowed(filter_, make_route("https://example.com/app.js", "script"))
+    
+    def test_blocked_hosts_and_subdomains(self):
+        filter_ = NetworkFilter()
+        self.assertBlocked(filter_, make_route("https://www.google-analytics.com/collect", "xhr"))
+        self.assertBlocked(filter_, make_route("https://hotjar.com/script.js", "script"))
+        # Only the host itself and its subdomains are blocked, not hosts which happen to end the same way
+        self.assertAllowed(filter_, make_route("https://nothotjar.com/script.js", "script"))
+        self.assertAllowed(filter_, make_route("https://example.com/hotjar.com", "script"))
+    
+    def test_allowed_hosts_never_blocked(self):
+        filter_ = NetworkFilter(allowed_hosts=["example.com"])
+        self.assertAllowed(filter_, make_route("https://cdn.example.com/logo.png", "image"))
+        self.assertBlocked(filter_, make_route("https://other.org/logo.png", "image"))
+        self.assertAllowed(filter_, make_route("https://other.org/app.js", "script"))
+    
+    def test_deny_other_hosts(self):
+        filter_ = NetworkFilter(allowed_hosts=["example.com"], deny_other_hosts=True)
+        self.assertAllowed(filter_, make_route("https://example.com/app.js", "script"))
+        self.assertBlocked(filter_, make_route("https://other.org/app.js", "script"))
+        
+        # Without an allow list, there's nothing to deny other hosts relative to
+        filter_ = NetworkFilter(deny_other_hosts=True)
+        self.assertAllowed(filter_, make_route("https://other.org/app.js", "script"))
+    
+    def test_empty_deny_lists(self):
+        filter_ = NetworkFilter(blocked_resource_types=(), blocked_hosts=())
+        self.assertAllowed(filter_, make_route("https://www.google-analytics.com/logo.png", "image"))
+    
+    def test_request_counts(self):
+        filter_ = NetworkFilter()
+        routes = [
+            make_route("https://example.com/form", "document"),
+            make_route("https://example.com/a.png", "image"),
+            make_route("https://example.com/b.png", "image"),
+            make_route("https://example.com/font.woff2", "font"),
+            make_route("https://www.googletagmanager.com/gtm.js", "script"),
+        ]
+        for route in routes:
+            filter_._handle_route(route)
+        
+        stats = filter_.stats()
+        self.assertEqual(stats["requests_allowed"], 1)
+        self.assertEqual(stats["requests_blocked"], 4)
+        self.assertEqual(stats["blocked_by_type"], dict(image=2, font=1, script=1))
+    
+    def test_bytes_loaded(self):
+        filter_ = NetworkFilter()
+        filter_._handle_response(make_response({"content-length": "1000"}))
+        filter_._handle_response(make_response({"content-length": "234"}))
+        # Responses without a (valid) length don't count
+        filter_._handle_response(make_response({}))
+        filter_._handle_response(make_response({"content-length": "garbage"}))
+        
+        self.assertEqual(filter_.stats()["bytes_loaded"], 1234)
+    
+    def test_install(self):
+        filter_ = NetworkFilter()
+        context = MagicMock()
+        filter_.install(context)
+        
+        context.route.assert_called_once_with("**/*", filter_._handle_route)
+        context.on.assert_called_once_with("response", filter_._handle_response)
+    #
@@ -0,0 +1,57 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pillepas.automation import proxy_classes
+from pillepas.automation.field_spec import compile_spec, compiled_proxy_factory, FIELDS_PATH
+from pillepas.automation.proxy_classes import Proxy
+
+
+class TestMedicineProxy(TestCase):
+    def setUp(self):
+        self.elem = MagicMock()
+        spec = compile_spec(FIELDS_PATH.read_bytes())
+        self.proxy = dict(compiled_proxy_factory(self.elem, spec=spec))["medicine"]
+        self.value = [dict(drug=f"Drug {i}", daily_dosis=str(i), n_days_with_meds="Alle dage") for i in range(5)]
+        
+        def evaluate(js, arg=None):
+            if js == proxy_classes._fill_js:
+                return {entry[0]: True for entry in arg}
+            #
+        
+        self.elem.evaluate.side_effect = evaluate
+    
+    def set_value(self, value) -> list[str]:
+        """Sets the value, and returns the keys of the sub-proxies which were set one at a time"""
+        
+        with patch.object(Proxy, "set_value", autospec=True) as set_value:
+            self.proxy.set_value(value)
+        
+        res = [call.args[0].key for call in set_value.call_args_list]
+        return res
+    
+    def test_bulk(self):
+        keys = self.set_value(self.value)
+        
+        # All rows are added in one go, and the dosis of every row is filled in a single evaluation
+        scripts = [call.args[0] for call in self.elem.evaluate.call_args_list]
+        self.assertEqual(scripts.count(proxy_classes._click_repeatedly_js), 1)
+        self.assertEqual(scripts.count(proxy_classes._fill_js), 1)
+        self.assertEqual(scripts.count(proxy_classes._reuse_doctor_js), 1)
+        
+        fill_entries = next(call.args[1] for call in self.elem.evaluate.call_args_list if call.args[0] == proxy_classes._fill_js)
+        self.assertEqual([entry[2] for entry in fill_entries], list(range(len(self.value))))
+        
+        self.assertEqual(len(self.proxy.sub_proxies), len(self.value))
+        self.assertNotIn("daily_dosis", keys)
+        self.assertEqual(keys.count("drug"), len(self.value))
+    
+    def test_single_medication_sequential(self):
+        keys = self.set_value(self.value[:1])
+        self.elem.evaluate.assert_not_called()
+        self.assertEqual(sorted(keys), sorted(self.value[0].keys()))
+    
+    def test_key_mismatch(self):
+        with self.assertRaises(RuntimeError):
+            self.set_value([dict(drug="foo")] * 2)
+        #
+    #
@@ -0,0 +1,82 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from playwright.sync_api import Keyboard, Locator, Page
+
+from pillepas import tracing
+from pillepas.automation import fill_form
+from pillepas.automation.fill_form import Session
+from pillepas.automation.roundtrips import RoundTripCounter
+from pillepas.persistence.catalog import OptionCatalog
+from pillepas.persistence.form_map import FormMap
+
+
+class TestRoundTripCounter(TestCase):
+    def setUp(self):
+        self.locator = MagicMock(spec=Locator)
+        self.locator.count.return_value = 1
+        self.page = MagicMock(spec=Page)
+        self.page.locator.return_value = self.locator
+        self.page.keyboard = MagicMock(spec=Keyboard)
+        self.locator.page = self.page
+        
+        self.counter = RoundTripCounter()
+        self.wrapped = self.counter.wrap(self.page)
+    
+    def test_locator_building_not_counted(self):
+        form = self.wrapped.locator("form")
+        self.assertEqual(self.counter.n_calls, 0)
+        
+        # The built locator is instrumented as well
+        self.assertEqual(form.count(), 1)
+        form.fill("foo")
+        form.page.keyboard.press("Enter")
+        self.assertEqual(self.counter.n_calls, 3)
+        self.assertEqual(set(self.counter.by_method()), {"count", "fill", "press"})
+    
+    def test_attribution(self):
+        form = self.wrapped.locator("form")
+        self.counter.page = "abc"
+        with tracing.recording(self.counter):
+            with tracing.span("Proxy._set", key="user_first_name"), tracing.span("inner"):
+                form.fill("Namey")
+                form.dispatch_event("change")
+            form.count()
+        #
+        
+        by_key = self.counter.by_key()
+        self.assertEqual(by_key["user_first_name"]["calls"], 2)
+        self.assertEqual(by_key["-"]["calls"], 1)
+        self.assertEqual(self.counter.by_page()["abc"]["calls"], 3)
+        self.assertIn("3 Playwright round trips", self.counter.format_summary())
+    
+    def test_summary_logged_after_fill(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        dir_ = Path(tempdir.name)
+        sess = Session(
+            dict(),
+            count_round_trips=True,
+            catalog=OptionCatalog(path=dir_ / "catalog.json"),
+            form_map=FormMap(path=dir_ / "map.json")
+        )
+        sess.page = sess.round_trips.wrap(self.page)
+        sess.is_last_page = MagicMock(return_value=True)
+        sess.process_submit_page = MagicMock()
+        
+        with self.assertLogs(fill_form.logger, level="INFO") as logs, redirect_stdout(io.StringIO()) as stdout:
+            sess.fill(auto_submit=True, wait_for_user=False)
+        #
+        
+        self.assertTrue(any("Playwright round trips" in line for line in logs.output))
+        self.assertEqual(stdout.getvalue(), "")
+    
+    def test_arguments_unwrapped(self):
+        form = self.wrapped.locator("form")
+        self.wrapped.locator("input").and_(form)
+        self.locator.and_.assert_called_once_with(self.locator)
+    #
@@ -0,0 +1,103 @@
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from nacl.exceptions import CryptoError
+
+from pillepas.persistence.gateway import Gateway
+from pillepas.persistence.sqlite_storage import SQLiteBackend
+
+from tests.test_cryptography import make_cryptor, PASS1, PASS2
+
+
+class TestSQLiteBackend(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+        self.path = self.dir / "data.sqlite"
+        self.cryptor = make_cryptor(PASS1)
+        self.example_data = {"alice/first_name": "Alice", "alice/meds": ["a", "b"], "bob/first_name": "Bob", "c": 3}
+    
+    def make_gateway(self, cryptor=None) -> Gateway:
+        backend = SQLiteBackend(path=self.path, cryptor=self.cryptor if cryptor is None else cryptor)
+        self.addCleanup(backend.close)
+        return Gateway(backend=backend)
+    
+    def test_data_save(self):
+        g = self.make_gateway()
+        g.set_values(**self.example_data)
+        del g["c"]
+        g["bob/first_name"] = "Robert"
+        
+        expected = dict(self.example_data, **{"bob/first_name": "Robert"})
+        del expected["c"]
+        self.assertEqual(g.read(), expected)
+        self.assertEqual(self.make_gateway().to_dict(), expected)
+        self.assertNotIn("c", g)
+        self.assertEqual(g["alice/meds"], ["a", "b"])
+    
+    def test_values_encrypted_per_row(self):
+        g = self.make_gateway()
+        g.set_values(**self.example_data)
+        
+        # Looking up a key only decrypts its own row
+        with patch.object(self.cryptor, "decrypt", wraps=self.cryptor.decrypt) as decrypt:
+            self.assertEqual(g["alice/first_name"], "Alice")
+            self.assertEqual(decrypt.call_count, 1)
+        #
+        
+        self.assertNotIn(b"Alice", self.path.read_bytes())
+    
+    def test_keys_not_stored_in_plaintext(self):
+        g = self.make_gateway()
+        g.set_values(**self.example_data)
+        g.backend.close()
+        
+        raw = self.path.read_bytes()
+        for s in (b"alice", b"first_name", b"meds"):
+            self.assertNotIn(s, raw)
+        #
+        
+        # The keys can still be looked up, and listed by decrypting the rows
+        self.assertEqual(g["bob/first_name"], "Bob")
+        self.assertEqual(g.backend.keys(), sorted(self.example_data))
+    
+    def test_profile(self):
+        g = self.make_gateway()
+        g.set_values(**self.example_data)
+        with g.transaction():
+            g["alice/last_name"] = "Smith"
+            del g["alice/meds"]
+            self.assertEqual(g.profile("alice"), {"alice/first_name": "Alice", "alice/last_name": "Smith"})
+        #
+        
+        self.assertEqual(g.profile("bob"), {"bob/first_name": "Bob"})
+        self.assertEqual(g.backend.profile_items("alice"), {"alice/first_name": "Alice", "alice/last_name": "Smith"})
+    
+    def test_wrong_cryptor_fails(self):
+        self.make_gateway()
+        self.assertRaises(CryptoError, lambda: self.make_gateway(cryptor=make_cryptor(PASS2)))
+    
+    def test_change_cryptor(self):
+        g = self.make_gateway()
+        g.set_values(**self.example_data)
+        other_cryptor = make_cryptor(PASS2)
+        g.change_cryptor(other_cryptor)
+        
+        self.assertEqual(self.make_gateway(cryptor=other_cryptor).to_dict(), self.example_data)
+    
+    def test_move_and_wipe(self):
+        g = self.make_gateway()
+        g.set_values(**self.example_data)
+        
+        new_dir = self.dir / "new"
+        g.move_data(new_dir)
+        self.assertFalse(self.path.exists())
+        self.assertEqual(g.path, new_dir / self.path.name)
+        self.assertEqual(g.read(), self.example_data)
+        
+        g.wipe()
+        self.assertFalse(g.path.exists())
+    #
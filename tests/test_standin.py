@@ -0,0 +1,49 @@
+import json
+import threading
+from unittest import TestCase
+import urllib.request
+
+from pillepas.automation.standin import StandinServer, suggest
+
+
+class TestStandinServer(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandinServer(suggest_delay=0, navigation_delay=0)
+        cls.server.start()
+        return super().setUpClass()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        return super().tearDownClass()
+    
+    def get(self, path: str) -> bytes:
+        with urllib.request.urlopen(self.server.url + path, timeout=5) as response:
+            return response.read()
+        #
+    
+    def test_serves_form(self):
+        html = self.get("").decode("utf-8")
+        self.assertIn("<form", html)
+        self.assertIn("Tilføj mere medicin", html)
+    
+    def test_suggestions(self):
+        res = json.loads(self.get("api/suggest?source=drug&q=elv"))
+        self.assertTrue(res)
+        self.assertTrue(all("elv" in opt.casefold() for opt in res))
+        self.assertEqual(res, suggest("drug", "elv"))
+    
+    def test_submission_is_recorded(self):
+        data = dict(firstName="Namey")
+        request = urllib.request.Request(self.server.url + "api/submit", data=json.dumps(data).encode("utf-8"))
+        urllib.request.urlopen(request, timeout=5).read()
+        self.assertEqual(data, self.server.submissions[-1])
+    
+    def test_stop_without_start(self):
+        server = StandinServer()
+        stopper = threading.Thread(target=server.stop, daemon=True)
+        stopper.start()
+        stopper.join(timeout=5)
+        self.assertFalse(stopper.is_alive())
+    #
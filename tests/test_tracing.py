@@ -0,0 +1,108 @@
+import asyncio
+import json
+from pathlib import Path
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from playwright.sync_api import Page
+
+from pillepas import tracing
+from pillepas.automation import timing
+from pillepas.automation.proxy_classes import Proxy
+from pillepas.automation.roundtrips import RoundTripCounter
+
+
+class TestTracing(TestCase):
+    def setUp(self):
+        previous = tracing.disable()
+        self.addCleanup(lambda: tracing.enable(previous) if previous is not None else tracing.disable())
+    
+    def test_disabled_is_noop(self):
+        self.assertFalse(tracing.is_enabled())
+        self.assertIs(tracing.span("foo"), tracing.span("bar"))
+    
+    def test_nested_spans(self):
+        tracer = tracing.enable()
+        with tracing.span("outer"):
+            with tracing.span("inner", key="user_first_name"):
+                pass
+            #
+        tracing.disable()
+        
+        events = {e["name"]: e for e in tracer.to_chrome_trace()["traceEvents"]}
+        outer, inner = events["outer"], events["inner"]
+        self.assertEqual(inner["args"], dict(key="user_first_name"))
+        self.assertLessEqual(outer["ts"], inner["ts"])
+        self.assertGreaterEqual(outer["ts"] + outer["dur"], inner["ts"] + inner["dur"])
+    
+    def test_export_chrome_trace(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        path = Path(tempdir.name) / "trace.json"
+        
+        with tracing.tracing_to(path):
+            with tracing.span("foo"):
+                pass
+            #
+        
+        self.assertFalse(tracing.is_enabled())
+        trace = json.loads(path.read_text())
+        self.assertEqual([e["name"] for e in trace["traceEvents"]], ["foo"])
+        self.assertEqual(trace["traceEvents"][0]["ph"], "X")
+    
+    def test_single_span_feeds_all_recorders(self):
+        class DummyProxy(Proxy):
+            def _set(self, value):
+                self.e.page.fill("input", value)
+            #
+        
+        page = MagicMock(spec=Page)
+        counter = RoundTripCounter()
+        proxy = DummyProxy(counter.wrap(MagicMock(page=page)), key="user_first_name")
+        timings = timing.Timings()
+        tracer = tracing.enable()
+        with timing.recording(timings), tracing.recording(counter):
+            proxy.set_value("Namey")
+        #
+        tracing.disable()
+        
+        self.assertEqual([e["name"] for e in tracer.to_chrome_trace()["traceEvents"]], ["DummyProxy._set"])
+        self.assertEqual(timings.counts(), dict(proxy=dict(DummyProxy=1)))
+        self.assertEqual(counter.by_key()["user_first_name"]["calls"], 2)  # fill and dispatch_event
+        self.assertEqual(tracing.recorders(), ())
+    
+    def test_async_tasks_keep_own_spans(self):
+        async def work(key: str) -> str:
+            with tracing.span("work", key=key):
+                await asyncio.sleep(0.01)
+                return tracing.current_attr("key")
+            #
+        
+        async def main():
+            return await asyncio.gather(work("a"), work("b"))
+        
+        with tracing.recording(timing.Timings()):
+            self.assertEqual(asyncio.run(main()), ["a", "b"])
+        #
+        self.assertIsNone(tracing.current_attr("key"))
+    
+    def test_sensitive_values_not_traced(self):
+        class DummyProxy(Proxy):
+            def _set(self, value):
+                pass
+            
+            def _get(self):
+                return "hunter2"
+            #
+        
+        proxy = DummyProxy(MagicMock(), sensitive=True, key="cpr")
+        tracer = tracing.enable()
+        proxy.set_value("hunter2")
+        proxy.get_value()
+        tracing.disable()
+        
+        events = tracer.to_chrome_trace()["traceEvents"]
+        self.assertEqual([e["name"] for e in events], ["DummyProxy._set", "DummyProxy._get"])
+        self.assertNotIn("hunter2", json.dumps(events))
+    #
@@ -0,0 +1,96 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from playwright.async_api import Locator as AsyncLocator, Page as AsyncPage
+from playwright.sync_api import Error, Locator, Page
+
+from pillepas.automation.utils import AsyncFormTransitionWatcher, FormTransitionWatcher
+
+
+class TestFormTransitionWatcher(TestCase):
+    def setUp(self):
+        self.page = MagicMock(spec=Page)
+        self.form = MagicMock(spec=Locator)
+        self.form.page = self.page
+        self.form.evaluate_all.return_value = 7
+        self.watcher = FormTransitionWatcher(self.form, quiet_ms=50, check_interval=10)
+        self.page.on.assert_called_once_with("framenavigated", self.watcher._on_framenavigated)
+    
+    def test_waits_in_browser(self):
+        self.watcher.mark()
+        self.form.evaluate_all.return_value = "settled"
+        self.watcher.wait()
+        
+        # The form itself is observed, and a single call blocks until the browser sees a change
+        self.assertEqual(self.form.evaluate_all.call_count, 2)
+        self.assertEqual(self.form.evaluate_all.call_args.args[1][1:], [7, 50, 10])
+        self.page.evaluate.assert_not_called()
+    
+    def test_keeps_changing(self):
+        # Once the structure has changed, the wait ends even if it doesn't settle
+        self.watcher.mark()
+        self.form.evaluate_all.side_effect = ["unchanged", "moved", "settled"]
+        self.watcher.wait()
+        self.assertEqual(self.form.evaluate_all.call_count, 3)
+    
+    def test_navigation_ends_wait(self):
+        main_frame = MagicMock(parent_frame=None)
+        self.watcher.mark()
+        
+        def unchanged(*args, **kwargs):
+            self.watcher._on_framenavigated(main_frame)
+            return "unchanged"
+        
+        self.form.evaluate_all.side_effect = unchanged
+        self.watcher.wait()
+        self.assertEqual(self.form.evaluate_all.call_count, 2)
+    
+    def test_child_frame_navigation_ignored(self):
+        child_frame = MagicMock(parent_frame=MagicMock())
+        self.watcher.mark()
+        self.form.evaluate_all.side_effect = ["unchanged", "unchanged", "settled"]
+        self.watcher._on_framenavigated(child_frame)
+        self.watcher.wait()
+        self.assertEqual(self.form.evaluate_all.call_count, 4)
+    
+    def test_timeout(self):
+        self.watcher.mark()
+        self.form.evaluate_all.return_value = "unchanged"
+        self.assertFalse(self.watcher.wait(timeout=30))
+        
+        # The browser-side wait is capped by the remaining time
+        self.assertTrue(all(call.args[1][3] <= 10 for call in self.form.evaluate_all.call_args_list[1:]))
+        
+        self.watcher.mark()
+        self.form.evaluate_all.return_value = "settled"
+        self.assertTrue(self.watcher.wait(timeout=30))
+    
+    def test_destroyed_context_ends_wait(self):
+        self.watcher.mark()
+        self.form.evaluate_all.side_effect = Error("Execution context was destroyed")
+        self.watcher.wait()
+        self.assertEqual(self.form.evaluate_all.call_count, 2)
+    #
+
+
+class TestAsyncFormTransitionWatcher(TestCase):
+    def setUp(self):
+        self.form = MagicMock(spec=AsyncLocator)
+        self.form.page = MagicMock(spec=AsyncPage)
+        self.form.evaluate_all.return_value = 7
+        self.watcher = AsyncFormTransitionWatcher(self.form, quiet_ms=50, check_interval=10)
+    
+    def test_wait(self):
+        async def main():
+            await self.watcher.mark()
+            self.form.evaluate_all.side_effect = ["unchanged", "settled"]
+            changed = await self.watcher.wait()
+            
+            self.form.evaluate_all.side_effect = None
+            self.form.evaluate_all.return_value = "unchanged"
+            return changed, await self.watcher.wait(timeout=30)
+        
+        self.assertEqual(asyncio.run(main()), (True, False))
+        self.assertEqual(self.form.evaluate_all.call_args_list[1].args[1][1:], [7, 50, 10])
+    #
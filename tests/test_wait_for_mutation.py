@@ -0,0 +1,66 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from playwright.sync_api import Error, Locator, Page
+
+from pillepas import tracing
+from pillepas.automation.utils import AsyncWaitForMutation, WaitForMutation
+
+
+class TestWaitForMutation(TestCase):
+    def setUp(self):
+        self.page = MagicMock(spec=Page)
+        self.locator = MagicMock(spec=Locator)
+        self.locator.page = self.page
+        self.locator.evaluate_all.return_value = 3
+        
+        previous = tracing.disable()
+        self.addCleanup(lambda: tracing.enable(previous) if previous is not None else tracing.disable())
+        self.tracer = tracing.enable()
+    
+    def test_observes_locator(self):
+        with WaitForMutation(self.locator, quiet_ms=20, timeout=500):
+            self.locator.click()
+        #
+        
+        # Both installing the counter and waiting happen on the watched element, not the whole document
+        self.assertEqual(self.locator.evaluate_all.call_count, 2)
+        self.assertEqual(self.locator.evaluate_all.call_args.args[1][1:], [3, 20, 500])
+        self.page.evaluate.assert_not_called()
+        self.page.wait_for_function.assert_not_called()
+    
+    def test_navigation_while_waiting(self):
+        with WaitForMutation(self.locator):
+            self.locator.evaluate_all.side_effect = Error("Execution context was destroyed")
+        #
+        self.page.wait_for_load_state.assert_called_once()
+    
+    def test_span_closed_on_errors(self):
+        # Failing on entering
+        self.locator.evaluate_all.side_effect = Error("boom")
+        with self.assertRaises(Error):
+            with WaitForMutation(self.locator):
+                pass
+            #
+        #
+        
+        # Failing on exiting
+        self.locator.evaluate_all.side_effect = None
+        self.page.wait_for_load_state.side_effect = Error("Target closed")
+        with self.assertRaises(Error):
+            with WaitForMutation(self.locator):
+                pass
+            #
+        #
+        
+        events = self.tracer.to_chrome_trace()["traceEvents"]
+        self.assertEqual([e["args"].get("error") for e in events], ["Error", "Error"])
+        self.assertIsNone(tracing.current_attr("error"))
+        self.assertIsNone(tracing._current.get())
+    
+    def test_async_has_no_sync_protocol(self):
+        # Entering the async variant with a plain 'with' would leave its coroutines un-awaited, so it must fail
+        self.assertFalse(hasattr(AsyncWaitForMutation, "__enter__"))
+        self.assertFalse(hasattr(AsyncWaitForMutation, "__exit__"))
+        self.assertFalse(hasattr(WaitForMutation, "__aenter__"))
+    #